@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+
+from dates import DATE_FMT, now_str, today_str
+
+# --- تحليل أعمار الديون (Receivables Aging) ---
+# المبالغ المتأخرة موزعة على فترات التأخير لكل (صف، عام دراسي، آخر طريقة دفع للطالب).
+# كل الفترات تُحسب في تمرير واحد مجمّع (GROUP BY + SUM(CASE)) بمقارنة تواريخ ISO نصية،
+# ويمكن حفظ النتيجة في جدول لقطة (aging_snapshot) يُحدَّث في الخلفية ويُقرأ دون أي تجميع.
+
+# (العنوان، أقل عدد أيام تأخير، أكبر عدد أيام تأخير أو None)
+AGING_BUCKETS = [
+    ("0-30", 0, 30),
+    ("31-60", 31, 60),
+    ("61-90", 61, 90),
+    ("90+", 91, None),
+]
+
+# جدول اللقطة aging_snapshot معرف في schema.py (أعمدة الفترات بنفس ترتيب AGING_BUCKETS)
+
+_REMAINING = "(i.amount - IFNULL(i.paid_amount, 0))"
+
+
+def _bucket_bounds(as_of):
+    """حدود كل فترة كتواريخ استحقاق: (من تاريخ، حتى تاريخ) بحيث from <= due_date < to"""
+    day = datetime.strptime(as_of, DATE_FMT)
+    bounds = []
+    for _, low, high in AGING_BUCKETS:
+        # متأخر low يوماً على الأقل (ويوماً واحداً على الأقل) => due_date < as_of - (low - 1)
+        upper = (day - timedelta(days=max(low, 1) - 1)).strftime(DATE_FMT)
+        lower = (day - timedelta(days=high)).strftime(DATE_FMT) if high is not None else None
+        bounds.append((lower, upper))
+    return bounds
+
+
+def aging_query(as_of=None):
+    """يبني استعلام أعمار الديون ومعاملاته لتاريخ معين (اليوم افتراضياً)"""
+    as_of = as_of or today_str()
+    columns, params = [], []
+    for lower, upper in _bucket_bounds(as_of):
+        condition = "i.due_date < ?"
+        params.append(upper)
+        if lower is not None:
+            condition += " AND i.due_date >= ?"
+            params.append(lower)
+        columns.append(f"ROUND(SUM(CASE WHEN {condition} THEN {_REMAINING} ELSE 0 END), 2)")
+    sql = f"""
+        SELECT s.grade, IFNULL(s.academic_year, ''), IFNULL(b.last_payment_method, ''),
+               {", ".join(columns)},
+               ROUND(SUM({_REMAINING}), 2),
+               COUNT(DISTINCT i.student_id)
+        FROM installments i
+        JOIN students s ON s.id = i.student_id
+        LEFT JOIN student_balances b ON b.student_id = i.student_id
+        WHERE i.status = 'pending' AND i.due_date < ?
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+    """
+    return sql, params + [as_of]
+
+
+def compute_aging(conn, as_of=None):
+    """صفوف أعمار الديون: (الصف، العام، طريقة الدفع، 0-30، 31-60، 61-90، 90+، الإجمالي، عدد الطلاب)"""
+    sql, params = aging_query(as_of)
+    return conn.execute(sql, params).fetchall()
+
+
+def save_snapshot(conn, as_of, rows):
+    """استبدال اللقطة المحفوظة بنتيجة جديدة (يُحتفظ بآخر لقطة فقط)"""
+    taken_at = now_str()
+    conn.execute("DELETE FROM aging_snapshot")
+    conn.executemany("""
+        INSERT INTO aging_snapshot (as_of, grade, academic_year, payment_method,
+            bucket_0_30, bucket_31_60, bucket_61_90, bucket_90_plus, total, students, taken_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, [(as_of,) + tuple(row) + (taken_at,) for row in rows])
+    return taken_at
+
+
+def load_snapshot(conn):
+    """آخر لقطة محفوظة: (التاريخ، وقت الحساب، الصفوف) أو None"""
+    head = conn.execute("SELECT as_of, taken_at FROM aging_snapshot LIMIT 1").fetchone()
+    if not head:
+        return None
+    rows = conn.execute("""
+        SELECT grade, academic_year, payment_method,
+               bucket_0_30, bucket_31_60, bucket_61_90, bucket_90_plus, total, students
+        FROM aging_snapshot
+        WHERE as_of = ?
+        ORDER BY grade, academic_year, payment_method
+    """, (head[0],)).fetchall()
+    return head[0], head[1], rows
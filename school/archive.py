@@ -0,0 +1,245 @@
+import os
+import re
+import sqlite3
+from datetime import datetime
+
+from changes import ChangeSet
+
+# --- أرشفة الأعوام الدراسية المغلقة (Cold Storage) ---
+# العام الدراسي المسدد بالكامل (لا أقساط معلقة لطلابه) يُنقل بطلابه وأقساطهم وحركاتهم
+# إلى قاعدة أرشيف مستقلة archive/school_<العام>.db، فتبقى القاعدة الرئيسية بحجم العامين الحالي والسابق فقط.
+# - النسخ ثم الحذف في معاملتين منفصلتين (ATTACH في وضع WAL لا يضمن معاملة ذرية بين ملفين)،
+#   والنسخ بـ INSERT OR REPLACE فإعادة التشغيل بعد انقطاع آمنة.
+# - المساحة المحررة تُسترجع بـ incremental_vacuum.
+# - لا يُنقل عام لطلابه حركات بتاريخ داخل النافذة الساخنة (دفعة متأخرة سددت العام مثلاً)،
+#   لأن حذفها ينقص إيراد أيام ما زالت تظهر في اللوحة ويومية الخزينة. يُؤجَّل العام حتى تخرج حركاته من النافذة.
+# - التقارير التاريخية تقرأ الأرشيف عبر ATTACH وعروض مؤقتة تجمع كل الأعوام (query_archive).
+
+ARCHIVE_DIR = "archive"
+HOT_YEARS = 2  # العام الحالي والسابق يبقيان في القاعدة الرئيسية
+ARCHIVED_TABLES = ("students", "installments", "transactions", "receipts")
+# أقصى عدد قواعد يمكن إرفاقها بنفس الاتصال في SQLite (الافتراضي 10 ومنها القاعدة الرئيسية)
+MAX_ATTACHED = 9
+
+_ARCHIVE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS archive.idx_archive_installments_student ON installments(student_id, due_date)",
+    "CREATE INDEX IF NOT EXISTS archive.idx_archive_transactions_student ON transactions(student_id, date)",
+    "CREATE INDEX IF NOT EXISTS archive.idx_archive_transactions_date ON transactions(date)",
+]
+
+# شروط اختيار صفوف العام (المعامل: العام الدراسي)
+_YEAR_ROWS = {
+    "students": "academic_year = ?",
+    "installments": "student_id IN (SELECT id FROM main.students WHERE academic_year = ?)",
+    "transactions": "student_id IN (SELECT id FROM main.students WHERE academic_year = ?)",
+    "receipts": """transaction_id IN (SELECT t.id FROM main.transactions t
+                                     JOIN main.students s ON s.id = t.student_id WHERE s.academic_year = ?)""",
+}
+# العمود الذي يطابق به صف الأرشيف صفه في القاعدة الرئيسية عند التحقق من النسخة
+_ROW_KEYS = {"receipts": "transaction_id"}
+
+
+def current_academic_year(today=None):
+    """العام الدراسي الحالي بصيغة 2025-2026 (يبدأ العام في سبتمبر)"""
+    today = today or datetime.now()
+    start = today.year if today.month >= 9 else today.year - 1
+    return f"{start}-{start + 1}"
+
+
+def hot_years(today=None):
+    """الأعوام التي تبقى في القاعدة الرئيسية (الحالي وما قبله)"""
+    start = int(current_academic_year(today)[:4])
+    return [f"{start - i}-{start - i + 1}" for i in range(HOT_YEARS)]
+
+
+def hot_window_start(today=None):
+    """أول يوم في النافذة الساخنة (بداية أقدم عام يبقى في القاعدة الرئيسية)"""
+    return f"{min(hot_years(today))[:4]}-09-01"
+
+
+def archive_path(academic_year, archive_dir=ARCHIVE_DIR):
+    return os.path.join(archive_dir, f"school_{academic_year}.db")
+
+
+def list_archives(archive_dir=ARCHIVE_DIR):
+    """الأعوام المؤرشفة الموجودة على القرص (مرتبة)"""
+    if not os.path.isdir(archive_dir):
+        return []
+    years = []
+    for name in os.listdir(archive_dir):
+        match = re.fullmatch(r"school_(\d{4}-\d{4})\.db", name)
+        if match:
+            years.append(match.group(1))
+    return sorted(years)
+
+
+def find_settled_years(system, today=None):
+    """
+    الأعوام القابلة للأرشفة: (العام، عدد الطلاب) لكل عام أقدم من الأعوام الساخنة
+    ليس لطلابه أقساط معلقة ولا حركات بتاريخ داخل النافذة الساخنة.
+    """
+    keep = hot_years(today)
+    with system.db.read() as conn:
+        rows = conn.execute("""
+            SELECT s.academic_year, COUNT(*),
+                   SUM(EXISTS (SELECT 1 FROM installments i WHERE i.student_id = s.id AND i.status = 'pending')),
+                   SUM(EXISTS (SELECT 1 FROM transactions t WHERE t.student_id = s.id AND t.date >= ?))
+            FROM students s
+            WHERE s.academic_year IS NOT NULL AND s.academic_year != ''
+            GROUP BY s.academic_year
+            ORDER BY s.academic_year
+        """, (hot_window_start(today),)).fetchall()
+    return [(year, count) for year, count, pending, recent in rows
+            if not pending and not recent and year < min(keep)]
+
+
+# --- 1. النقل إلى الأرشيف ---
+
+def _columns(conn, schema, table):
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def _ensure_archive_schema(conn):
+    """إنشاء جداول الأرشيف بنفس تعريف جداول القاعدة الرئيسية، وإضافة أي عمود جديد لاحقاً"""
+    for table in ARCHIVED_TABLES:
+        sql = conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?",
+                           (table,)).fetchone()[0]
+        conn.execute(re.sub(r"^CREATE TABLE\s+(IF NOT EXISTS\s+)?\"?\w+\"?",
+                            f"CREATE TABLE IF NOT EXISTS archive.{table}", sql, count=1))
+        existing = set(_columns(conn, "archive", table))
+        for column in _columns(conn, "main", table):
+            if column not in existing:
+                conn.execute(f"ALTER TABLE archive.{table} ADD COLUMN {column}")
+    for sql in _ARCHIVE_INDEXES:
+        conn.execute(sql)
+
+
+def enable_incremental_vacuum(conn):
+    """تفعيل auto_vacuum=INCREMENTAL للقواعد القديمة (يتطلب VACUUM كاملاً مرة واحدة فقط)"""
+    if conn.execute("PRAGMA main.auto_vacuum").fetchone()[0] != 2:
+        conn.execute("PRAGMA main.auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM main")
+
+
+def archive_year(system, academic_year, archive_dir=ARCHIVE_DIR, progress=None, today=None):
+    """نقل عام دراسي إلى قاعدة الأرشيف الخاصة به، ويعيد عدد الصفوف المنقولة لكل جدول"""
+    window_start = hot_window_start(today)
+    os.makedirs(archive_dir, exist_ok=True)
+    path = archive_path(academic_year, archive_dir)
+    moved = {}
+
+    with system.db.maintenance() as conn:
+        conn.execute("ATTACH DATABASE ? AS archive", (path,))
+        try:
+            # 1. النسخ إلى الأرشيف
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # الفحص داخل المعاملة (قفل الكتابة محجوز) حتى لا تسبقه دفعة جديدة
+                recent = conn.execute(f"SELECT COUNT(*) FROM main.transactions WHERE {_YEAR_ROWS['transactions']} "
+                                      "AND date >= ?", (academic_year, window_start)).fetchone()[0]
+                if recent:
+                    raise RuntimeError(f"لا يمكن أرشفة العام {academic_year}: "
+                                       f"لطلابه {recent} حركة بتاريخ {window_start} أو بعده")
+                _ensure_archive_schema(conn)
+                for table in ARCHIVED_TABLES:
+                    columns = ", ".join(_columns(conn, "main", table))
+                    cur = conn.execute(f"""
+                        INSERT OR REPLACE INTO archive.{table} ({columns})
+                        SELECT {columns} FROM main.{table} WHERE {_YEAR_ROWS[table]}
+                    """, (academic_year,))
+                    moved[table] = cur.rowcount
+                    if progress:
+                        progress(f"  {table}: {cur.rowcount:,}")
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+            # 2. الحذف من القاعدة الرئيسية بعد التأكد من اكتمال النسخة
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for table in ARCHIVED_TABLES:
+                    hot = conn.execute(f"SELECT COUNT(*) FROM main.{table} WHERE {_YEAR_ROWS[table]}",
+                                       (academic_year,)).fetchone()[0]
+                    key = _ROW_KEYS.get(table, "id")
+                    cold = conn.execute(f"SELECT COUNT(*) FROM archive.{table} WHERE {key} IN "
+                                        f"(SELECT {key} FROM main.{table} WHERE {_YEAR_ROWS[table]})",
+                                        (academic_year,)).fetchone()[0]
+                    if hot != cold:
+                        raise RuntimeError(f"نسخة الأرشيف غير مكتملة للجدول {table} ({cold} من {hot})")
+                # الترتيب مهم: الإيصالات ثم الحركات والأقساط قبل الطلاب (الشروط تعتمد على جدول الطلاب)،
+                # وصفوف دفتر الأرصدة بعد الأقساط لأن Triggers الحذف تعيد إنشاءها
+                conn.execute(f"DELETE FROM main.receipts WHERE {_YEAR_ROWS['receipts']}", (academic_year,))
+                conn.execute("""DELETE FROM main.transactions WHERE student_id IN
+                                (SELECT id FROM main.students WHERE academic_year = ?)""", (academic_year,))
+                # سجل التذكيرات لا يُؤرشف (أقساط العام المسدد لن تُذكَّر بها مجدداً)
+                conn.execute(f"""DELETE FROM main.reminder_items WHERE installment_id IN
+                                 (SELECT id FROM main.installments WHERE {_YEAR_ROWS['installments']})""",
+                             (academic_year,))
+                conn.execute("""DELETE FROM main.installments WHERE student_id IN
+                                (SELECT id FROM main.students WHERE academic_year = ?)""", (academic_year,))
+                conn.execute("""DELETE FROM main.student_balances WHERE student_id IN
+                                (SELECT id FROM main.students WHERE academic_year = ?)""", (academic_year,))
+                conn.execute("DELETE FROM main.students WHERE academic_year = ?", (academic_year,))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.execute("DETACH DATABASE archive")
+
+        # 3. استرجاع الصفحات المحررة إلى نظام الملفات
+        # execute في sqlite3 ينفذ خطوة واحدة فقط (= صفحة واحدة)، أما executescript فيكمل التنفيذ حتى النهاية
+        conn.executescript("PRAGMA main.incremental_vacuum;")
+        conn.execute("PRAGMA main.wal_checkpoint(TRUNCATE)").fetchone()  # تصغير الملف فعلياً دون انتظار نقطة التثبيت
+
+    system.publish_changes(ChangeSet(totals=True, pending_list=True, roster=True))
+    return moved
+
+
+def archive_settled_years(system, archive_dir=ARCHIVE_DIR, progress=print, today=None):
+    """أرشفة كل الأعوام المغلقة، وتعيد [(العام، الصفوف المنقولة لكل جدول)]"""
+    years = find_settled_years(system, today)
+    if not years:
+        progress("لا توجد أعوام دراسية مسددة بالكامل خارج العامين الحالي والسابق.")
+        return []
+    with system.db.maintenance() as conn:
+        enable_incremental_vacuum(conn)
+    results = []
+    for year, students in years:
+        progress(f"📦 أرشفة العام {year} ({students:,} طالب)...")
+        results.append((year, archive_year(system, year, archive_dir, progress, today)))
+    return results
+
+
+# --- 2. القراءة من الأرشيف (التقارير التاريخية) ---
+
+def query_archive(system, sql, params=(), years=None, archive_dir=ARCHIVE_DIR, include_hot=True):
+    """
+    تنفيذ استعلام قراءة على الأعوام المؤرشفة عبر ATTACH على اتصال مستقل للقراءة فقط.
+    الاستعلام يستخدم العروض المؤقتة all_students و all_installments و all_transactions
+    (اتحاد الأرشيفات المختارة، ومعها القاعدة الرئيسية عند include_hot)، أو archive_<n>.<table> مباشرة.
+    """
+    years = list_archives(archive_dir) if years is None else list(years)
+    if len(years) > MAX_ATTACHED:
+        raise ValueError(f"لا يمكن إرفاق أكثر من {MAX_ATTACHED} أعوام في استعلام واحد")
+
+    conn = sqlite3.connect(f"file:{os.path.abspath(system.db_path)}?mode=ro", uri=True)
+    try:
+        schemas = ["main"] if include_hot else []
+        for n, year in enumerate(years):
+            path = archive_path(year, archive_dir)
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"لا يوجد أرشيف للعام {year}")
+            conn.execute(f"ATTACH DATABASE ? AS archive_{n}", (f"file:{os.path.abspath(path)}?mode=ro",))
+            schemas.append(f"archive_{n}")
+        if not schemas:
+            raise ValueError("لم يتم اختيار أي قاعدة للاستعلام")
+
+        for table in ARCHIVED_TABLES:
+            columns = ", ".join(_columns(conn, "main", table))
+            union = " UNION ALL ".join(f"SELECT {columns} FROM {schema}.{table}" for schema in schemas)
+            conn.execute(f"CREATE TEMP VIEW all_{table} AS {union}")
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
@@ -0,0 +1,79 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Superseded(Exception):
+    """يُرفع عندما يحل طلب أحدث بنفس المفتاح محل الطلب الحالي (مثل ضغطات بحث أقدم)"""
+
+
+class AsyncFinanceSystem:
+    """
+    واجهة غير متزامنة فوق FinanceSystem: كل استدعاء يعمل في مجموعة خيوط محدودة
+    حتى لا تتجمد دوال أحداث Flet أثناء عمل SQLite.
+    """
+
+    def __init__(self, system, max_workers=4):
+        self.system = system
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="finance")
+        self._lock = threading.Lock()
+        self._latest = {}  # المفتاح -> (رقم الجيل، المستقبل المعلق)
+        self._generation = 0
+
+    async def call(self, method, *args, **kwargs):
+        """تشغيل دالة من FinanceSystem في الخلفية وانتظار نتيجتها"""
+        loop = asyncio.get_running_loop()
+        fn = functools.partial(getattr(self.system, method), *args, **kwargs)
+        return await loop.run_in_executor(self._executor, fn)
+
+    async def latest(self, key, method, *args, debounce=0.0, **kwargs):
+        """
+        مثل call لكن الطلب الأحدث بنفس المفتاح يلغي الأقدم:
+        الطلب الأقدم إن لم يبدأ بعد يُلغى، وإن انتهى تُتجاهل نتيجته، وفي الحالتين يُرفع Superseded.
+        debounce: مهلة انتظار (بالثواني) قبل التنفيذ لتجميع الضغطات المتتالية.
+        """
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            previous = self._latest.get(key)
+            self._latest[key] = (generation, None)
+        if previous and previous[1] is not None:
+            previous[1].cancel()
+
+        if debounce:
+            await asyncio.sleep(debounce)
+            self._check_current(key, generation)
+
+        loop = asyncio.get_running_loop()
+        fn = functools.partial(getattr(self.system, method), *args, **kwargs)
+        future = loop.run_in_executor(self._executor, fn)
+        with self._lock:
+            if self._latest.get(key, (None,))[0] == generation:
+                self._latest[key] = (generation, future)
+
+        try:
+            result = await future
+        except asyncio.CancelledError:
+            # إلغاء بسبب طلب أحدث فقط يصبح Superseded، أما إلغاء المهمة نفسها (إغلاق الصفحة) فيمر كما هو
+            with self._lock:
+                superseded = self._latest.get(key, (None,))[0] != generation
+            if superseded:
+                raise Superseded(key)
+            raise
+        self._check_current(key, generation)
+        return result
+
+    def _check_current(self, key, generation):
+        with self._lock:
+            if self._latest.get(key, (None,))[0] != generation:
+                raise Superseded(key)
+
+    def forget(self, prefix):
+        """حذف مفاتيح الطلبات التي تبدأ بـ prefix (مفاتيح جلسة أُغلقت)"""
+        with self._lock:
+            for key in [k for k in self._latest if k.startswith(prefix)]:
+                del self._latest[key]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,285 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+from dates import DATE_FMT, DATETIME_FMT
+
+# --- مولد بيانات مدرسة اصطناعية + قياس أداء دوال FinanceSystem ---
+# مثال:
+#   python benchmark.py generate --db bench.db --students 50000 --installments 500000 --transactions 2000000
+#   python benchmark.py run --db bench.db --out report.json --baseline baseline.json
+
+FIRST_NAMES = ["أحمد", "محمد", "محمود", "علي", "عمر", "يوسف", "مريم", "فاطمة", "سارة", "نور",
+               "خالد", "حسن", "ليلى", "هدى", "إبراهيم", "مصطفى", "آية", "ياسين", "ريم", "زياد"]
+LAST_NAMES = ["عبدالله", "السيد", "حسين", "إبراهيم", "منصور", "الشريف", "سالم", "عثمان", "فؤاد", "رمضان"]
+GRADES = ["KG1", "KG2"] + [f"الصف {i}" for i in range(1, 13)]
+METHODS = ["Cash", "Bank Transfer", "Cheque"]
+CHUNK = 10000
+
+
+# --- 1. توليد البيانات ---
+
+def _academic_years(today):
+    start = today.year if today.month >= 9 else today.year - 1
+    return [f"{start - 1}-{start}", f"{start}-{start + 1}"]
+
+
+def generate_school(db_path, students=1000, installments=10000, transactions=20000, seed=42, progress=print):
+    """إنشاء قاعدة بيانات اصطناعية بالمخطط الحالي (كل الترحيلات) وأحجام قابلة للتحديد"""
+    from db_init import init_db
+
+    rng = random.Random(seed)
+    today = datetime.now()
+    years = _academic_years(today)
+    init_db(db_path)
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")  # قاعدة قياس فقط: لا حاجة لضمانات المتانة أثناء التوليد
+
+    def insert_chunks(sql, rows, label, total):
+        done = 0
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= CHUNK:
+                conn.execute("BEGIN")
+                conn.executemany(sql, chunk)
+                conn.execute("COMMIT")
+                done += len(chunk)
+                chunk = []
+                progress(f"  {label}: {done:,}/{total:,}")
+        if chunk:
+            conn.execute("BEGIN")
+            conn.executemany(sql, chunk)
+            conn.execute("COMMIT")
+
+    first_id = (conn.execute("SELECT IFNULL(MAX(id), 0) FROM students").fetchone()[0]) + 1
+
+    def student_rows():
+        for _ in range(students):
+            yield (
+                f"{rng.choice(FIRST_NAMES)} {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                rng.choice(GRADES),
+                rng.choice(years),
+                f"01{rng.randint(0, 2)}{rng.randint(10000000, 99999999)}",
+                (today - timedelta(days=rng.randint(0, 700))).strftime(DATE_FMT),
+            )
+
+    insert_chunks("""INSERT INTO students (name, grade, academic_year, parent_phone, created_at)
+                     VALUES (?, ?, ?, ?, ?)""", student_rows(), "الطلاب", students)
+
+    per_student = max(1, installments // max(students, 1))
+    plan_start = datetime.strptime(years[-1].split("-")[0] + "-09-01", DATE_FMT)
+
+    def installment_rows():
+        produced = 0
+        for offset in range(students):
+            for seq in range(per_student):
+                if produced >= installments:
+                    return
+                due = plan_start + timedelta(days=30 * seq)
+                amount = float(rng.choice([500, 750, 1000, 1250]))
+                paid = due < today and rng.random() < 0.8
+                yield (
+                    first_id + offset, seq + 1, amount, amount if paid else 0.0,
+                    due.strftime(DATE_FMT),
+                    (due + timedelta(days=rng.randint(0, 10))).strftime(DATETIME_FMT) if paid else None,
+                    "paid" if paid else "pending",
+                )
+                produced += 1
+
+    insert_chunks("""INSERT INTO installments (student_id, sequence, amount, paid_amount, due_date, paid_date, status)
+                     VALUES (?, ?, ?, ?, ?, ?, ?)""", installment_rows(), "الأقساط", installments)
+
+    def transaction_rows():
+        for _ in range(transactions):
+            when = today - timedelta(days=rng.randint(0, 730), seconds=rng.randint(0, 86399))
+            yield (
+                first_id + rng.randrange(students),
+                when.strftime(DATETIME_FMT),
+                float(rng.choice([250, 500, 750, 1000])),
+                "payment" if rng.random() < 0.95 else "expense",
+                "حركة اصطناعية",
+                rng.choice(METHODS),
+            )
+
+    insert_chunks("""INSERT INTO transactions (student_id, date, amount, type, description, payment_method)
+                     VALUES (?, ?, ?, ?, ?, ?)""", transaction_rows(), "الحركات", transactions)
+
+    conn.execute("ANALYZE")
+    conn.close()
+    progress(f"✔ تم توليد القاعدة {db_path} ({os.path.getsize(db_path) / 1e6:,.1f} MB)")
+
+
+# --- 2. القياس ---
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _measure(fn, iterations):
+    timings = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        fn(i)
+        timings.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - started
+    timings.sort()
+    return {
+        "iterations": iterations,
+        "mean_ms": sum(timings) / len(timings),
+        "p50_ms": _percentile(timings, 50),
+        "p95_ms": _percentile(timings, 95),
+        "p99_ms": _percentile(timings, 99),
+        "max_ms": timings[-1],
+        "ops_per_sec": iterations / elapsed if elapsed else 0.0,
+    }
+
+
+def _db_size(db_path):
+    return sum(os.path.getsize(p) for p in (db_path, db_path + "-wal") if os.path.exists(p))
+
+
+def run_benchmarks(db_path, iterations=200, use_cache=False, seed=7, include_writes=True, progress=print):
+    """قياس كل دالة عامة في FinanceSystem وإرجاع تقرير قابل للحفظ كـ JSON"""
+    from cache import LRUCache
+    from finance_system import FinanceSystem
+
+    rng = random.Random(seed)
+    system = FinanceSystem(db_path)
+    if not use_cache:
+        system.cache = LRUCache(maxsize=0)  # قياس الاستعلامات نفسها لا الذاكرة المؤقتة
+
+    with system.db.read() as conn:
+        student_ids = [r[0] for r in conn.execute("SELECT id FROM students ORDER BY random() LIMIT 1000")]
+        names = [r[0] for r in conn.execute("SELECT name FROM students ORDER BY random() LIMIT 200")]
+        pending_ids = [r[0] for r in conn.execute(
+            "SELECT id FROM installments WHERE status = 'pending' ORDER BY random() LIMIT ?", (iterations,))]
+        counts = {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+                  for t in ("students", "installments", "transactions")}
+    if not student_ids:
+        raise RuntimeError("قاعدة البيانات فارغة: استخدم الأمر generate أولاً")
+
+    def deep_pages(_):
+        cursor = None
+        for _ in range(5):
+            _, cursor = system.get_pending_installments_page(cursor)
+            if not cursor:
+                break
+
+    cases = {
+        "get_daily_stats": lambda i: system.get_daily_stats(),
+        "get_pending_installments": lambda i: system.get_pending_installments(),
+        "get_pending_installments_page[5 pages]": deep_pages,
+        "get_students": lambda i: system.get_students(),
+        "get_student_details": lambda i: system.get_student_details(rng.choice(student_ids)),
+        "search_students": lambda i: system.search_students(rng.choice(names).split()[0]),
+        "suggest_students": lambda i: system.suggest_students(rng.choice(names)[:i % 6 + 1]),
+    }
+    if include_writes:
+        cases["pay_installment"] = lambda i: system.pay_installment(
+            pending_ids[i % len(pending_ids)], 100.0, "Cash", "benchmark") if pending_ids else None
+        cases["create_fee_plan"] = lambda i: system.create_fee_plan(
+            rng.choice(student_ids), 10000.0, 10, "2025-09-01")
+
+    results = {}
+    for name, fn in cases.items():
+        n = max(1, iterations // 10) if name == "get_students" else iterations
+        results[name] = _measure(fn, n)
+        progress(f"  {name}: p50={results[name]['p50_ms']:.2f}ms p95={results[name]['p95_ms']:.2f}ms")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().strftime(DATETIME_FMT),
+            "db_path": db_path,
+            "db_size_bytes": _db_size(db_path),
+            "rows": counts,
+            "iterations": iterations,
+            "cache": use_cache,
+            "sqlite_version": sqlite3.sqlite_version,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+        "cache_stats": system.cache_stats(),
+    }
+    system.close()
+    return report
+
+
+def compare_reports(report, baseline, threshold=0.10, metric="p95_ms", min_delta_ms=0.5):
+    """
+    مقارنة تقرير بخط أساس: تعيد قائمة (الدالة، القيمة القديمة، الجديدة، نسبة التغير، تراجع؟).
+    التراجع يُحتسب فقط إن تجاوز النسبة والفرق المطلق min_delta_ms معاً (لتجاهل ضوضاء القياس).
+    """
+    rows = []
+    for name, current in report["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous:
+            continue
+        old, new = previous[metric], current[metric]
+        change = (new - old) / old if old else 0.0
+        rows.append((name, old, new, change, change > threshold and new - old > min_delta_ms))
+    return rows
+
+
+# --- 3. سطر الأوامر ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="مولد بيانات وقياس أداء FinanceSystem")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    gen = sub.add_parser("generate", help="توليد مدرسة اصطناعية")
+    gen.add_argument("--db", default="bench.db")
+    gen.add_argument("--students", type=int, default=1000)
+    gen.add_argument("--installments", type=int, default=10000)
+    gen.add_argument("--transactions", type=int, default=20000)
+    gen.add_argument("--seed", type=int, default=42)
+
+    run = sub.add_parser("run", help="قياس الأداء وحفظ التقرير")
+    run.add_argument("--db", default="bench.db")
+    run.add_argument("--iterations", type=int, default=200)
+    run.add_argument("--cache", action="store_true", help="تفعيل الذاكرة المؤقتة أثناء القياس")
+    run.add_argument("--read-only", action="store_true", help="تخطي قياس دوال الكتابة")
+    run.add_argument("--out", default="bench_report.json")
+    run.add_argument("--baseline", help="تقرير سابق للمقارنة")
+    run.add_argument("--threshold", type=float, default=0.10, help="نسبة التراجع المسموحة (0.10 = 10%%)")
+    run.add_argument("--min-delta-ms", type=float, default=0.5, help="أقل فرق مطلق يُعد تراجعاً")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        generate_school(args.db, args.students, args.installments, args.transactions, args.seed)
+        return 0
+
+    report = run_benchmarks(args.db, args.iterations, use_cache=args.cache, include_writes=not args.read_only)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"✔ تم حفظ التقرير في {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = 0
+        for name, old, new, change, regressed in compare_reports(
+                report, baseline, args.threshold, min_delta_ms=args.min_delta_ms):
+            regressions += regressed
+            mark = "❌" if regressed else "✅"
+            print(f"{mark} {name}: p95 {old:.2f}ms → {new:.2f}ms ({change:+.1%})")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+# --- ذاكرة تخزين مؤقت للقراءات (Read-through cache) ---
+# مفتاح كل عنصر يتضمن "إصدار" البيانات التي يعتمد عليها (students / installments)،
+# ودوال الكتابة ترفع الإصدار، فتصبح العناصر القديمة غير قابلة للوصول وتُطرد لاحقاً بالـ LRU أو TTL.
+
+
+class LRUCache:
+    """ذاكرة مؤقتة محدودة الحجم مع مدة صلاحية وعدادات إصابة/إخفاق"""
+
+    def __init__(self, maxsize=512, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """تعيد (موجود؟، القيمة)"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._data[key]
+            self.misses += 1
+            return False, None
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / total if total else 0.0,
+            }
+
+
+def cached(*namespaces):
+    """
+    Decorator لدوال القراءة في FinanceSystem: يخزن النتيجة حسب الوسائط وإصدار الـ namespaces.
+    يتطلب أن يوفر الكائن self.cache و self.data_version(namespace).
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            versions = tuple(self.data_version(ns) for ns in namespaces)
+            key = (fn.__name__, args, tuple(sorted(kwargs.items())), versions)
+            found, value = self.cache.get(key)
+            if found:
+                return value
+            value = fn(self, *args, **kwargs)
+            self.cache.set(key, value)
+            return value
+        return wrapper
+    return decorator
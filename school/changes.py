@@ -0,0 +1,32 @@
+# --- وصف التغييرات بعد عمليات الكتابة (Change Sets) ---
+# كل دالة كتابة في FinanceSystem تنشر ChangeSet يصف ما تغير بالضبط،
+# فتقوم الواجهة بتحديث الصفوف والبطاقات المتأثرة فقط بدلاً من إعادة بناء اللوحة كاملة.
+
+
+class ChangeSet:
+    """الكيانات التي تغيرت في عملية كتابة واحدة"""
+
+    def __init__(self, students=(), installments=(), totals=False, pending_list=False, roster=False):
+        # طلاب تغيرت بياناتهم الأساسية (الاسم، الصف، العام، الهاتف)، وهي ما تعتمد عليه قراءات "students"
+        # المخزنة؛ الدفعات والخطط تغير الأقساط والأرصدة فقط فلا تضيف طلاباً هنا
+        self.students = set(students)
+        self.installments = set(installments)  # أقساط تغير المدفوع أو الحالة
+        self.totals = totals                   # تغيرت إجماليات اليوم أو عدد المتأخرات
+        self.pending_list = pending_list       # أقساط معلقة جديدة قد تظهر في الصفحة الحالية
+        self.roster = roster                   # طلاب جدد أضيفوا
+
+    def merge(self, other):
+        """دمج تغييرات أخرى في هذه المجموعة (لتجميع عدة أحداث في تحديث واحد)"""
+        self.students |= other.students
+        self.installments |= other.installments
+        self.totals = self.totals or other.totals
+        self.pending_list = self.pending_list or other.pending_list
+        self.roster = self.roster or other.roster
+        return self
+
+    def is_empty(self):
+        return not (self.students or self.installments or self.totals or self.pending_list or self.roster)
+
+    def __repr__(self):
+        return (f"ChangeSet(students={sorted(self.students)}, installments={sorted(self.installments)}, "
+                f"totals={self.totals}, pending_list={self.pending_list}, roster={self.roster})")
@@ -0,0 +1,369 @@
+import argparse
+import functools
+import os
+import sys
+import time
+
+# --- واجهة سطر الأوامر للمهام التشغيلية (بدون Flet) ---
+# كل أمر يستورد فقط الوحدات التي يحتاجها، ويطبع التقدم مباشرة على stdout، ويعيد رمز خروج مفهوماً لـ cron.
+# أمثلة:
+#   python cli.py migrate
+#   python cli.py plans --total 12000 --count 10 --start 2025-09-01 --grade KG1 --year 2025-2026
+#   python cli.py rebuild all
+#   python cli.py check --repair
+#   python cli.py export overdue --format csv --out overdue.csv
+#   python cli.py import students students.csv --rejects rejected_students.csv
+#   python cli.py nightly
+#   python cli.py bench run --db bench.db --baseline baseline.json
+
+EXIT_OK = 0
+EXIT_FAILED = 1       # فشل المهمة (خطأ في البيانات أو قاعدة البيانات)
+EXIT_USAGE = 2        # خطأ في الأوامر أو المعاملات (نفس رمز argparse)
+EXIT_PROBLEMS = 3     # المهمة اكتملت لكنها وجدت مشكلات (فحص السلامة)
+EXIT_TEMPFAIL = 75    # غير ممكن الآن، أعد المحاولة لاحقاً (قاعدة مقفلة أو خارج نافذة التشغيل الليلي)
+
+progress = functools.partial(print, flush=True)
+
+
+def fail(message, code=EXIT_FAILED):
+    print(f"❌ {message}", file=sys.stderr, flush=True)
+    return code
+
+
+def open_system(args):
+    """فتح FinanceSystem بعد التأكد من وجود القاعدة وتحديث مخططها (فحص PRAGMA واحد إن كان حديثاً)"""
+    from db_init import ensure_schema
+    from finance_system import FinanceSystem
+
+    if not os.path.exists(args.db):
+        raise FileNotFoundError(f"قاعدة البيانات غير موجودة: {args.db} (استخدم الأمر migrate لإنشائها)")
+    for version, description in ensure_schema(args.db):
+        progress(f"  ↳ ترحيل {version}: {description}")
+    return FinanceSystem(args.db)
+
+
+def _status(result):
+    """تحويل نتيجة (نجاح، رسالة) من FinanceSystem إلى رمز خروج مع طباعة الرسالة"""
+    ok, msg = result[0], result[1]
+    if not ok:
+        return fail(msg)
+    progress(f"✔ {msg}")
+    return EXIT_OK
+
+
+def combine(*codes):
+    """
+    رمز خروج واحد لعدة خطوات: أي فشل يعطي EXIT_FAILED،
+    وإلا أعلى رمز معلوماتي (مشكلات أو إعادة محاولة لاحقاً) أو EXIT_OK.
+    """
+    if any(code in (EXIT_FAILED, EXIT_USAGE) for code in codes):
+        return EXIT_FAILED
+    return max(codes, default=EXIT_OK)
+
+
+# --- 1. المخطط وإعادة البناء ---
+
+def cmd_migrate(args):
+    from db_init import ensure_schema
+    from migrations import LATEST_VERSION
+
+    applied = ensure_schema(args.db)
+    for version, description in applied:
+        progress(f"  ↳ ترحيل {version}: {description}")
+    progress(f"✔ المخطط محدث (Schema v{LATEST_VERSION})" + ("" if applied else " ولا توجد ترحيلات ناقصة"))
+    return EXIT_OK
+
+
+def cmd_rebuild(args, system):
+    code = EXIT_OK
+    if args.target in ("rollups", "all"):
+        progress("🔄 إعادة بناء جداول التجميع...")
+        code = combine(code, _status(system.rebuild_rollups()))
+    if args.target in ("balances", "all"):
+        progress("🔄 إعادة حساب أرصدة الطلاب...")
+        code = combine(code, _status(system.rebuild_balances()))
+    return code
+
+
+# --- 2. فحص السلامة ---
+
+# (الوصف، الاستعلام من السجلات الخام، نفس الأعمدة من الجدول المشتق، الإصلاح)
+# الصفوف المختلفة = (الخام EXCEPT المشتق) + (المشتق EXCEPT الخام)، والمبالغ مقربة لقرشين
+DRIFT_CHECKS = [
+    ("جدول الإيراد اليومي", """
+        SELECT substr(date, 1, 10), IFNULL(type, ''), IFNULL(payment_method, ''), ROUND(SUM(amount), 2), COUNT(*)
+        FROM transactions WHERE date IS NOT NULL GROUP BY 1, 2, 3
+    """, """
+        SELECT day, type, payment_method, ROUND(total, 2), tx_count FROM daily_revenue WHERE tx_count != 0
+    """, "rollups"),
+    ("جدول الأقساط المعلقة حسب الاستحقاق", """
+        SELECT due_date, COUNT(*), ROUND(SUM(amount - IFNULL(paid_amount, 0)), 2)
+        FROM installments WHERE status = 'pending' GROUP BY due_date
+    """, """
+        SELECT due_date, pending_count, ROUND(pending_amount, 2) FROM installment_due_rollup WHERE pending_count != 0
+    """, "rollups"),
+    ("دفتر أرصدة الطلاب", """
+        SELECT student_id, ROUND(SUM(amount), 2), ROUND(SUM(IFNULL(paid_amount, 0)), 2),
+               MIN(CASE WHEN status = 'pending' THEN due_date END)
+        FROM installments GROUP BY student_id
+    """, """
+        SELECT student_id, ROUND(billed, 2), ROUND(paid, 2), next_due_date FROM student_balances
+        WHERE student_id IN (SELECT student_id FROM installments)
+    """, "balances"),
+]
+
+
+def count_drift(conn, raw_sql, derived_sql):
+    """عدد الصفوف المختلفة بين تجميع السجلات الخام والجدول المشتق"""
+    return conn.execute(f"""
+        SELECT (SELECT COUNT(*) FROM ({raw_sql} EXCEPT {derived_sql}))
+             + (SELECT COUNT(*) FROM ({derived_sql} EXCEPT {raw_sql}))
+    """).fetchone()[0]
+
+
+def cmd_check(args, system):
+    problems = 0  # مشكلات في الملف نفسه (لا يصلحها إعادة البناء)
+    drifted = 0
+    repairs = set()
+    with system.db.read() as conn:
+        progress("🔍 فحص بنية الملف..." + (" (كامل)" if args.full else ""))
+        pragma = "integrity_check" if args.full else "quick_check"
+        errors = [row[0] for row in conn.execute(f"PRAGMA {pragma}") if row[0] != "ok"]
+        for error in errors:
+            progress(f"  ✗ {error}")
+        problems += len(errors)
+
+        orphans = conn.execute("PRAGMA foreign_key_check").fetchall()
+        for table, rowid, parent, _ in orphans[:20]:
+            progress(f"  ✗ {table} #{rowid}: لا يوجد صف مرتبط في {parent}")
+        problems += len(orphans)
+
+        for label, raw_sql, derived_sql, repair in DRIFT_CHECKS:
+            drift = count_drift(conn, raw_sql, derived_sql)
+            progress(f"  {'✗' if drift else '✓'} {label}: {drift:,} صف مختلف عن السجلات الخام")
+            if drift:
+                drifted += drift
+                repairs.add(repair)
+
+    if repairs and args.repair:
+        progress("🛠️ إصلاح الجداول المشتقة...")
+        code = cmd_rebuild(argparse.Namespace(target="all" if len(repairs) > 1 else repairs.pop()), system)
+        if code != EXIT_OK:
+            return code
+        drifted = 0
+    if problems or drifted:
+        return fail(f"تم العثور على {problems + drifted:,} مشكلة.", EXIT_PROBLEMS)
+    progress("✔ قاعدة البيانات سليمة.")
+    return EXIT_OK
+
+
+# --- 3. الخطط والتصدير ---
+
+def cmd_plans(args, system):
+    student_ids = [s for s in args.students.split(",") if s.strip()] if args.students else None
+    progress("🔄 توليد خطط التقسيط...")
+    result = system.create_fee_plans_bulk(args.total, args.count, args.start, grade=args.grade,
+                                          academic_year=args.year, student_ids=student_ids,
+                                          skip_existing=not args.include_existing)
+    if args.verbose:
+        for student_id, ok, msg in result[2]:
+            progress(f"  {'✓' if ok else '-'} {student_id}: {msg}")
+    return _status(result)
+
+
+def cmd_export(args, system):
+    from reports import export_report
+
+    path = args.out or f"{args.report}_{time.strftime('%Y%m%d_%H%M%S')}.{args.format}"
+    progress(f"📤 تصدير {args.report} إلى {path}...")
+    count = export_report(system, args.report, args.format, path,
+                          progress=lambda n: progress(f"  {n:,} صف"), day=args.day)
+    progress(f"✔ تم تصدير {count:,} صف إلى {path}")
+    return EXIT_OK
+
+
+def cmd_import(args, system):
+    from importer import import_file
+
+    progress(f"📥 استيراد {args.kind} من {args.path}...")
+    report = import_file(system, args.kind, args.path, chunk_size=args.chunk_size,
+                         progress=lambda r: progress(f"  {r.imported:,} من {r.total:,} (مرفوض: {r.rejected_count:,})"),
+                         rejects_path=args.rejects)
+    for line_no, reason in report.rejected[:20]:
+        progress(f"  ✗ سطر {line_no}: {reason}")
+    if report.rejected_count:
+        return fail(report.summary() + (f" - التفاصيل في {args.rejects}" if args.rejects else ""), EXIT_PROBLEMS)
+    progress(f"✔ {report.summary()}")
+    return EXIT_OK
+
+
+# --- 4. المهام الليلية ---
+
+def cmd_aging(args, system):
+    return _status(system.refresh_aging_snapshot(args.as_of))
+
+
+def cmd_archive(args, system):
+    from archive import archive_settled_years, find_settled_years
+
+    if args.dry_run:
+        years = find_settled_years(system)
+        for year, students in years:
+            progress(f"  {year}: {students:,} طالب")
+        progress(f"✔ {len(years)} عام قابل للأرشفة.")
+        return EXIT_OK
+    archive_settled_years(system, progress=progress)
+    return EXIT_OK
+
+
+def cmd_reminders(args, system):
+    from reminders import FileTransport, in_quiet_hours, outbox_stats, run_nightly
+
+    if not args.force and not in_quiet_hours():
+        return fail("التذكيرات تعمل ليلاً فقط (استخدم --force للتشغيل الآن).", EXIT_TEMPFAIL)
+    queued, sent, retried, failed = run_nightly(system, FileTransport(args.outbox_dir), day=args.day,
+                                                force=args.force, progress=progress)
+    progress(f"✔ مرسلة {sent:,} | مؤجلة {retried:,} | فاشلة {failed:,} | حالة اليوم: {outbox_stats(system, args.day)}")
+    return EXIT_PROBLEMS if failed else EXIT_OK
+
+
+def cmd_receipts(args, system):
+    from receipts import ReceiptPrinter
+
+    printer = ReceiptPrinter(system, output_dir=args.output_dir)
+    try:
+        future = printer.reprint_student(args.student) if args.student else printer.reprint_day(args.day)
+        path, count = future.result()
+    except LookupError as e:
+        return fail(str(e))
+    finally:
+        printer.shutdown()
+    progress(f"✔ تم حفظ {count:,} إيصال في {path}")
+    return EXIT_OK
+
+
+def cmd_nightly(args, system):
+    """الصيانة الليلية: فحص سريع، لقطة أعمار الديون، التذكيرات، ثم تحديث الإحصائيات وتصغير WAL"""
+    started = time.perf_counter()
+    code = cmd_check(argparse.Namespace(full=False, repair=True), system)
+    code = combine(code, cmd_aging(argparse.Namespace(as_of=None), system))
+    if not args.skip_reminders:
+        code = combine(code, cmd_reminders(argparse.Namespace(force=False, day=None, outbox_dir=args.outbox_dir),
+                                           system))
+    with system.db.maintenance() as conn:
+        conn.execute("PRAGMA optimize")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+    progress(f"✔ انتهت الصيانة الليلية في {time.perf_counter() - started:.1f} ثانية")
+    return code
+
+
+# --- 5. التحليل والتشغيل ---
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="مهام FinanceSystem التشغيلية من سطر الأوامر")
+    parser.add_argument("--db", default=os.environ.get("SCHOOL_DB", "school.db"),
+                        help="مسار قاعدة البيانات (أو متغير البيئة SCHOOL_DB)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("migrate", help="إنشاء القاعدة أو تطبيق الترحيلات الناقصة")
+
+    plans = sub.add_parser("plans", help="توليد نفس خطة التقسيط لمجموعة طلاب")
+    plans.add_argument("--total", type=float, required=True, help="إجمالي الرسوم لكل طالب")
+    plans.add_argument("--count", type=int, required=True, help="عدد الأقساط")
+    plans.add_argument("--start", required=True, help="تاريخ أول قسط (YYYY-MM-DD)")
+    plans.add_argument("--grade")
+    plans.add_argument("--year", help="العام الدراسي (مثل 2025-2026)")
+    plans.add_argument("--students", help="أرقام طلاب مفصولة بفاصلة")
+    plans.add_argument("--include-existing", action="store_true", help="عدم تخطي الطلاب الذين لديهم أقساط")
+    plans.add_argument("-v", "--verbose", action="store_true", help="طباعة نتيجة كل طالب")
+
+    rebuild = sub.add_parser("rebuild", help="إعادة بناء الجداول المشتقة من السجلات الخام")
+    rebuild.add_argument("target", choices=["rollups", "balances", "all"])
+
+    check = sub.add_parser("check", help="فحص سلامة القاعدة وتطابق الجداول المشتقة")
+    check.add_argument("--full", action="store_true", help="integrity_check الكامل بدلاً من quick_check")
+    check.add_argument("--repair", action="store_true", help="إعادة بناء الجداول المشتقة المنحرفة")
+
+    export = sub.add_parser("export", help="تصدير تقرير CSV أو PDF")
+    export.add_argument("report", help="اسم التقرير: roster / pending / overdue / cash_journal")
+    export.add_argument("--format", choices=["csv", "pdf"], default="csv")
+    export.add_argument("--out", help="مسار الملف (افتراضياً اسم التقرير ووقت التصدير)")
+    export.add_argument("--day", help="اليوم للتقارير اليومية (YYYY-MM-DD)")
+
+    imports = sub.add_parser("import", help="استيراد طلاب أو أقساط أو حركات من ملف CSV / XLSX")
+    imports.add_argument("kind", choices=["students", "installments", "transactions"],
+                         help="الطلاب أولاً (بعمود id من النظام القديم) ثم الأقساط والحركات")
+    imports.add_argument("path")
+    imports.add_argument("--rejects", help="ملف CSV تُكتب فيه الصفوف المرفوضة")
+    imports.add_argument("--chunk-size", type=int, default=1000)
+
+    aging = sub.add_parser("aging", help="تحديث لقطة أعمار الديون")
+    aging.add_argument("--as-of", help="تاريخ الاحتساب (افتراضياً اليوم)")
+
+    archive = sub.add_parser("archive", help="أرشفة الأعوام الدراسية المسددة بالكامل")
+    archive.add_argument("--dry-run", action="store_true", help="عرض الأعوام القابلة للأرشفة فقط")
+
+    reminders = sub.add_parser("reminders", help="تجهيز وإرسال تذكيرات الأقساط المتأخرة")
+    reminders.add_argument("--force", action="store_true", help="التشغيل خارج نافذة التشغيل الليلي")
+    reminders.add_argument("--day", help="يوم التذكير (افتراضياً اليوم)")
+    reminders.add_argument("--outbox-dir", default="reminders")
+
+    receipts = sub.add_parser("receipts", help="إعادة طباعة الإيصالات في مستند واحد")
+    receipts.add_argument("--day", help="إيصالات يوم (افتراضياً اليوم)")
+    receipts.add_argument("--student", type=int, help="كل إيصالات طالب")
+    receipts.add_argument("--output-dir", default="receipts")
+
+    nightly = sub.add_parser("nightly", help="الصيانة الليلية (فحص، أعمار الديون، التذكيرات، optimize)")
+    nightly.add_argument("--skip-reminders", action="store_true")
+    nightly.add_argument("--outbox-dir", default="reminders")
+
+    bench = sub.add_parser("bench", help="أوامر benchmark.py (generate / run)")
+    bench.add_argument("bench_args", nargs=argparse.REMAINDER)
+    return parser
+
+
+COMMANDS = {
+    "plans": cmd_plans,
+    "rebuild": cmd_rebuild,
+    "check": cmd_check,
+    "export": cmd_export,
+    "import": cmd_import,
+    "aging": cmd_aging,
+    "archive": cmd_archive,
+    "reminders": cmd_reminders,
+    "receipts": cmd_receipts,
+    "nightly": cmd_nightly,
+}
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.command == "migrate":
+        return cmd_migrate(args)
+    if args.command == "bench":
+        import benchmark
+
+        return benchmark.main(args.bench_args)
+
+    system = None
+    try:
+        system = open_system(args)
+        return COMMANDS[args.command](args, system)
+    except KeyboardInterrupt:
+        return fail("تم الإيقاف.", 130)
+    except Exception as e:
+        import sqlite3
+
+        if isinstance(e, sqlite3.OperationalError) and "locked" in str(e):
+            return fail(f"قاعدة البيانات مشغولة: {e}", EXIT_TEMPFAIL)
+        if isinstance(e, ValueError):
+            return fail(str(e), EXIT_USAGE)
+        return fail(f"{type(e).__name__}: {e}")
+    finally:
+        if system is not None:
+            system.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
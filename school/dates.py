@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+
+# --- صيغ التواريخ الموحدة ---
+# كل التواريخ تُخزَّن كنص ISO قابل للترتيب، لذلك المقارنة النصية = المقارنة الزمنية
+# ويمكن لـ SQLite استخدام الفهارس مع نطاقات نصف مفتوحة (>= بداية AND < نهاية).
+DATE_FMT = "%Y-%m-%d"
+DATETIME_FMT = "%Y-%m-%d %H:%M:%S"
+
+# صيغ مقبولة عند تنظيف بيانات قديمة أو مدخلات المستخدم
+_ACCEPTED_FORMATS = (
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%Y-%m-%d",
+    "%Y/%m/%d %H:%M:%S",
+    "%Y/%m/%d",
+    "%d/%m/%Y %H:%M:%S",
+    "%d/%m/%Y",
+    "%d-%m-%Y",
+)
+
+
+def today_str():
+    """تاريخ اليوم بالصيغة الموحدة"""
+    return datetime.now().strftime(DATE_FMT)
+
+
+def now_str():
+    """الوقت الحالي بالصيغة الموحدة"""
+    return datetime.now().strftime(DATETIME_FMT)
+
+
+def parse_date(value):
+    """تحويل نص تاريخ بأي صيغة مقبولة إلى datetime (أو None إن تعذر)"""
+    if not value:
+        return None
+    text = str(value).strip()
+    if "." in text:
+        text = text.split(".")[0]  # إزالة أجزاء الثانية
+    for fmt in _ACCEPTED_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def normalize_date(value):
+    """تحويل أي تاريخ مقبول إلى YYYY-MM-DD"""
+    parsed = parse_date(value)
+    return parsed.strftime(DATE_FMT) if parsed else None
+
+
+def normalize_datetime(value):
+    """تحويل أي تاريخ/وقت مقبول إلى YYYY-MM-DD HH:MM:SS"""
+    parsed = parse_date(value)
+    return parsed.strftime(DATETIME_FMT) if parsed else None
+
+
+def day_range(day=None):
+    """نطاق نصف مفتوح [بداية اليوم، بداية اليوم التالي) لاستعلامات قابلة للفهرسة"""
+    start = parse_date(day) if day else datetime.now()
+    start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    return start.strftime(DATE_FMT), (start + timedelta(days=1)).strftime(DATE_FMT)
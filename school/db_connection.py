@@ -0,0 +1,130 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class ConnectionManager:
+    """يدير اتصالات دائمة بقاعدة البيانات: اتصال قراءة لكل خيط (Thread) وكاتب واحد متسلسل"""
+
+    def __init__(self, db_path="school.db", cache_size_kb=16384, mmap_size=268435456, busy_timeout_ms=5000,
+                 factory=sqlite3.Connection, on_connect=None):
+        self.db_path = db_path
+        self.factory = factory        # صنف الاتصال (يُستبدل عند تفعيل القياس)
+        self.on_connect = on_connect  # دالة اختيارية تُستدعى لكل اتصال جديد
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.busy_timeout_ms = busy_timeout_ms
+
+        self._local = threading.local()
+        self._writer = None
+        self._write_lock = threading.RLock()
+        self._registry_lock = threading.Lock()
+        self._connections = []
+
+    # --- 1. إنشاء الاتصالات وضبط الإعدادات (Pragmas) ---
+
+    def _connect(self):
+        """يفتح اتصالاً جديداً ويطبق إعدادات الأداء عليه"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000,
+            isolation_level=None,  # نتحكم في المعاملات يدوياً (BEGIN / COMMIT)
+            check_same_thread=False,
+            factory=self.factory,
+        )
+        if self.on_connect:
+            self.on_connect(conn)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kb)}")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        with self._registry_lock:
+            self._connections.append(conn)
+        return conn
+
+    def reader(self):
+        """يعيد اتصال القراءة الخاص بالخيط الحالي (يُنشأ عند أول استخدام)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def release_reader(self):
+        """يغلق اتصال القراءة الخاص بالخيط الحالي (لخيوط قصيرة العمر مثل التصدير)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            return
+        self._local.conn = None
+        with self._registry_lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+        conn.close()
+
+    def writer(self):
+        """يعيد اتصال الكتابة الوحيد المشترك (يجب استخدامه داخل transaction)"""
+        if self._writer is None:
+            with self._write_lock:
+                if self._writer is None:
+                    self._writer = self._connect()
+        return self._writer
+
+    # --- 2. المعاملات (Context-managed transactions) ---
+
+    @contextmanager
+    def read(self):
+        """لقطة قراءة متسقة: كل الاستعلامات داخل الكتلة ترى نفس حالة القاعدة"""
+        conn = self.reader()
+        if conn.in_transaction:
+            # قراءة متداخلة داخل لقطة مفتوحة مسبقاً على نفس الخيط
+            yield conn
+            return
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.execute("COMMIT")
+
+    @contextmanager
+    def transaction(self):
+        """معاملة كتابة متسلسلة: BEGIN IMMEDIATE ثم COMMIT أو ROLLBACK عند الخطأ"""
+        with self._write_lock:
+            conn = self.writer()
+            if conn.in_transaction:
+                # معاملة متداخلة على نفس الخيط: تُدمج في المعاملة الخارجية
+                yield conn
+                return
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            else:
+                conn.execute("COMMIT")
+
+    @contextmanager
+    def maintenance(self):
+        """
+        اتصال الكتابة خارج أي معاملة مع حجز قفل الكتابة طوال الكتلة،
+        لعمليات لا تعمل داخل معاملة مثل ATTACH و DETACH و VACUUM.
+        """
+        with self._write_lock:
+            conn = self.writer()
+            if conn.in_transaction:
+                raise RuntimeError("لا يمكن بدء عملية صيانة داخل معاملة مفتوحة")
+            yield conn
+
+    def close(self):
+        """يغلق كل الاتصالات المفتوحة (عند إيقاف التطبيق)"""
+        with self._registry_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._writer = None
+        self._local = threading.local()
@@ -0,0 +1,54 @@
+import os
+import secrets
+import shutil
+import time
+
+# --- تسليم الملفات لمتصفح المستخدم (Downloads) ---
+# الخدمة تعمل في المتصفح (WEB_BROWSER)، فالملفات المولدة على الخادم (إيصالات وتقارير) تُنقل إلى
+# مجلد داخل assets_dir الذي يقدمه خادم Flet، ثم تُفتح برابطها في متصفح المستخدم.
+# - كل ملف في مجلد باسم عشوائي (secrets.token_urlsafe) فلا يمكن تخمين روابط ملفات الآخرين
+#   بعدّ أرقام الإيصالات، وخادم الأصول لا يعرض محتوى المجلدات.
+# - الملفات مؤقتة: تُحذف المجلدات الأقدم من DOWNLOAD_TTL_HOURS عند كل تسليم وعند بدء الخدمة
+#   (الإيصالات والتقارير يمكن توليدها من جديد من قاعدة البيانات).
+
+DOWNLOADS_DIR = "downloads"
+DOWNLOAD_TTL_HOURS = 24
+TOKEN_BYTES = 16
+
+
+class DownloadArea:
+    """مجلد الملفات المؤقتة المقدمة للمتصفح داخل مجلد الأصول"""
+
+    def __init__(self, assets_dir, subdir=DOWNLOADS_DIR, ttl_hours=DOWNLOAD_TTL_HOURS):
+        self.assets_dir = assets_dir
+        self.root = os.path.join(assets_dir, subdir)
+        self.ttl_s = ttl_hours * 3600
+
+    def new_path(self, filename):
+        """مسار جديد لملف باسم filename داخل مجلد عشوائي (بعد حذف الملفات المنتهية)"""
+        self.cleanup()
+        directory = os.path.join(self.root, secrets.token_urlsafe(TOKEN_BYTES))
+        os.makedirs(directory)
+        return os.path.join(directory, filename)
+
+    def publish(self, path):
+        """نقل ملف مولد على الخادم إلى مجلد التسليم، ويعيد رابطه"""
+        target = self.new_path(os.path.basename(path))
+        shutil.move(path, target)
+        return self.url(target)
+
+    def url(self, path):
+        """رابط الملف كما يقدمه خادم Flet للمتصفح"""
+        return "/" + os.path.relpath(path, self.assets_dir).replace(os.sep, "/")
+
+    def cleanup(self, now=None):
+        """حذف مجلدات الملفات الأقدم من مدة الصلاحية، ويعيد عددها"""
+        if not os.path.isdir(self.root):
+            return 0
+        cutoff = (now or time.time()) - self.ttl_s
+        removed = 0
+        for entry in os.scandir(self.root):
+            if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+        return removed
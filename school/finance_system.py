@@ -1,182 +1,644 @@
-import sqlite3
+import threading
 from datetime import datetime, timedelta
 
+from dates import DATE_FMT, day_range, now_str, today_str
+from aging import compute_aging, load_snapshot, save_snapshot
+from cache import LRUCache, cached
+from changes import ChangeSet
+from db_connection import ConnectionManager
+from schema import rebuild_balances, rebuild_last_payment_methods, rebuild_rollups
+from write_queue import WriteQueue
+
+# أقل طول لكلمة البحث يمكن لفهرس trigram مطابقته
+FTS_MIN_TERM_LENGTH = 3
+# هامش مقارنة المبالغ (كسور القروش الناتجة عن الأعداد العشرية)
+PAYMENT_EPSILON = 0.005
+
+
+def _fts_query(query):
+    """
+    تحويل نص البحث إلى تعبير FTS5 آمن: كل كلمة بين علامتي تنصيص، والكلمات مربوطة بـ AND.
+    تعيد (التعبير، الكلمات القصيرة) لأن الكلمات الأقصر من FTS_MIN_TERM_LENGTH لا يطابقها فهرس trigram.
+    """
+    terms = query.split()
+    match = " ".join('"' + t.replace('"', '""') + '"' for t in terms if len(t) >= FTS_MIN_TERM_LENGTH)
+    return match, [t for t in terms if len(t) < FTS_MIN_TERM_LENGTH]
+
+
+def _short_terms_filter(terms):
+    """
+    شرط SQL يطبق الكلمات القصيرة على نتائج FTS كبادئة لإحدى كلمات الاسم أو الصف أو العام أو الهاتف
+    (مثلاً "محمد ع" تطابق "محمد علي" فقط). تعيد (الشرط، المعاملات).
+    """
+    if not terms:
+        return "", []
+    fields = ("' ' || s.name || ' ' || s.grade || ' ' || IFNULL(s.academic_year, '')"
+              " || ' ' || IFNULL(s.parent_phone, '')")
+    escaped = [t.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") for t in terms]
+    return ("".join(f" AND ({fields}) LIKE ? ESCAPE '\\'" for _ in terms),
+            [f"% {t}%" for t in escaped])
+
+
 class FinanceSystem:
-    def __init__(self):
-        self.db_path = "school.db"
+    def __init__(self, db_path="school.db"):
+        self.db_path = db_path
+        # اتصالات دائمة بدلاً من فتح اتصال جديد في كل دالة
+        self.db = ConnectionManager(db_path)
+        # كل كتابات الدفع والخطط والطلاب تمر عبر خيط كاتب واحد (Group Commit)
+        self.writes = WriteQueue(self.db)
+        # المشتركون في إشعارات التغيير (تُستدعى بعد كل عملية كتابة ناجحة)
+        self._listeners = []
+        # ذاكرة مؤقتة للقراءات المرجعية + إصدار لكل نوع بيانات (يرتفع مع كل كتابة)
+        self.cache = LRUCache(maxsize=512, ttl=300.0)
+        self._versions = {"students": 0, "installments": 0}
+        self._versions_lock = threading.Lock()
+
+    def close(self):
+        """إغلاق اتصالات قاعدة البيانات"""
+        self.writes.close()
+        self.db.close()
+
+    # --- 0. إشعارات التغيير (Change Feed) ---
+
+    def subscribe(self, callback):
+        """تسجيل دالة تستقبل ChangeSet بعد كل عملية كتابة"""
+        self._listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def data_version(self, namespace):
+        return self._versions[namespace]
+
+    def invalidate(self, *namespaces):
+        """رفع إصدار البيانات فتُهمل القراءات المخزنة المعتمدة عليها"""
+        with self._versions_lock:
+            for ns in namespaces or tuple(self._versions):
+                self._versions[ns] += 1
+
+    def write_stats(self):
+        """إحصائيات طابور الكتابة (عدد الطلبات، الدفعات، إعادة المحاولات)"""
+        return self.writes.stats()
+
+    def _write(self, tx, *args, **kwargs):
+        """
+        تنفيذ دالة كتابة tx(conn, ...) عبر طابور الكاتب وانتظار نتيجتها.
+        tx تعيد (النتيجة، ChangeSet أو None)، والتغييرات تُنشر بعد COMMIT فقط.
+        """
+        result, changes = self.writes.submit(tx, *args, **kwargs).result()
+        if changes:
+            self.publish_changes(changes)
+        return result
+
+    def cache_stats(self):
+        """عدادات الذاكرة المؤقتة (إصابة / إخفاق / طرد)"""
+        return self.cache.stats()
+
+    def publish_changes(self, changes):
+        """إبطال القراءات المخزنة المتأثرة ثم إبلاغ المشتركين بما تغير (بعد اعتماد المعاملة)"""
+        if changes.is_empty():
+            return
+        if changes.students or changes.roster:
+            self.invalidate("students")
+        if changes.installments or changes.pending_list or changes.totals:
+            self.invalidate("installments")
+        for callback in list(self._listeners):
+            try:
+                callback(changes)
+            except Exception as e:
+                print(f"❌ خطأ في مستقبل التغييرات: {e}")
 
     # --- 1. دوال الإحصائيات (Dashboard Stats) ---
     def get_daily_stats(self):
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
-        
-        today_date = datetime.now().strftime("%Y-%m-%d")
-        
-        # 1. إجمالي إيراد اليوم
-        cur.execute("SELECT SUM(amount) FROM transactions WHERE date LIKE ? || '%' AND type='payment'", (today_date,))
-        daily_total = cur.fetchone()[0] or 0.0
-        
-        # 2. حركات اليوم (أحدث 10 حركات)
-        cur.execute("""
-            SELECT t.date, s.name, t.amount, t.payment_method
-            FROM transactions t
-            JOIN students s ON t.student_id = s.id
-            WHERE t.date LIKE ? || '%'
-            ORDER BY t.date DESC
-            LIMIT 10
-        """, (today_date,))
-        daily_transactions = cur.fetchall()
-
-        # 3. عدد الأقساط المتأخرة
-        cur.execute("""
-            SELECT COUNT(id) FROM installments 
-            WHERE due_date < ? AND status = 'pending'
-        """, (today_date,))
-        overdue_count = cur.fetchone() or (0,)
-        
-        conn.close()
+        today_date = today_str()
+        # نطاق نصف مفتوح لليوم بدلاً من LIKE حتى يستخدم SQLite الفهرس (date, type)
+        day_start, day_end = day_range(today_date)
+
+        with self.db.read() as conn:
+            cur = conn.cursor()
+
+            # 1. إجمالي إيراد اليوم (من جدول التجميع daily_revenue بدلاً من جمع كل الحركات)
+            cur.execute("""
+                SELECT SUM(total) FROM daily_revenue
+                WHERE day = ? AND type = 'payment'
+            """, (today_date,))
+            daily_total = cur.fetchone()[0] or 0.0
+
+            # 2. حركات اليوم (أحدث 10 حركات)
+            cur.execute("""
+                SELECT t.date, s.name, t.amount, t.payment_method
+                FROM transactions t
+                JOIN students s ON t.student_id = s.id
+                WHERE t.date >= ? AND t.date < ?
+                ORDER BY t.date DESC
+                LIMIT 10
+            """, (day_start, day_end))
+            daily_transactions = cur.fetchall()
+
+            # 3. عدد الأقساط المتأخرة (تجميع لكل تاريخ استحقاق بدلاً من كل قسط)
+            cur.execute("""
+                SELECT IFNULL(SUM(pending_count), 0) FROM installment_due_rollup
+                WHERE due_date < ?
+            """, (today_date,))
+            overdue_count = cur.fetchone() or (0,)
+
         return daily_total, daily_transactions, overdue_count
 
+    def get_revenue_breakdown(self, day=None):
+        """تفصيل إيراد يوم حسب النوع وطريقة الدفع (من جدول التجميع)"""
+        with self.db.read() as conn:
+            return conn.execute("""
+                SELECT type, payment_method, total, tx_count FROM daily_revenue
+                WHERE day = ?
+                ORDER BY type, payment_method
+            """, (day or today_str(),)).fetchall()
+
+    def rebuild_rollups(self):
+        """إعادة بناء جداول التجميع (بعد استيراد أو تعديل يدوي للبيانات)"""
+        try:
+            with self.db.transaction() as conn:
+                rebuild_rollups(conn)
+            self.publish_changes(ChangeSet(totals=True))
+            return True, "تم إعادة بناء جداول التجميع بنجاح."
+        except Exception as e:
+            return False, f"خطأ في إعادة بناء جداول التجميع: {str(e)}"
+
     # --- 2. دوال إدارة الأقساط والدفع ---
 
-    def create_fee_plan(self, student_id, total_fees, installments_count, start_date_str):
-        """ينشئ خطة تقسيط ويولد الأقساط"""
+    def _validate_plan(self, total_fees, installments_count, start_date_str):
+        """التحقق من بيانات الخطة، تعيد (تاريخ البداية، رسالة الخطأ)"""
         try:
-            start_date = datetime.strptime(start_date_str, "%Y-%m-%d")
+            start_date = datetime.strptime(start_date_str, DATE_FMT)
         except ValueError:
-            return False, "صيغة التاريخ غير صحيحة (YYYY-MM-DD)."
+            return None, "صيغة التاريخ غير صحيحة (YYYY-MM-DD)."
             
         if installments_count <= 0 or total_fees <= 0:
-            return False, "العدد والمبلغ يجب أن يكونا أكبر من صفر."
+            return None, "العدد والمبلغ يجب أن يكونا أكبر من صفر."
+        return start_date, None
 
+    def _plan_rows(self, student_id, total_fees, installments_count, start_date):
+        """توليد صفوف أقساط الخطة (جاهزة لـ executemany)"""
         monthly_amount = total_fees / installments_count
-        
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
-        
+        for i in range(installments_count):
+            due_date = (start_date + timedelta(days=30 * i)).strftime(DATE_FMT)
+            yield (student_id, i + 1, monthly_amount, due_date)
+
+    def create_fee_plan(self, student_id, total_fees, installments_count, start_date_str):
+        """ينشئ خطة تقسيط ويولد الأقساط"""
+        start_date, error = self._validate_plan(total_fees, installments_count, start_date_str)
+        if error:
+            return False, error
+
         try:
-            for i in range(installments_count):
-                due_date = (start_date + timedelta(days=30 * i)).strftime("%Y-%m-%d") 
-                
-                cur.execute("""INSERT INTO installments (student_id, sequence, amount, due_date, status)
-                               VALUES (?, ?, ?, ?, 'pending')""", 
-                               (student_id, i + 1, monthly_amount, due_date))
-            
-            conn.commit()
-            return True, f"تم توليد {installments_count} قسطاً للطالب بنجاح."
-            
+            return self._write(self._create_fee_plan_tx, student_id, total_fees, installments_count, start_date)
         except Exception as e:
-            conn.rollback()
             return False, f"خطأ في قاعدة البيانات أثناء توليد الأقساط: {str(e)}"
-        finally:
-            conn.close()
+
+    def _create_fee_plan_tx(self, conn, student_id, total_fees, installments_count, start_date):
+        conn.executemany("""INSERT INTO installments (student_id, sequence, amount, due_date, status)
+                            VALUES (?, ?, ?, ?, 'pending')""", 
+                         self._plan_rows(student_id, total_fees, installments_count, start_date))
+        touched, applied = self._apply_credit(conn, [student_id], now_str())
+        msg = f"تم توليد {installments_count} قسطاً للطالب بنجاح."
+        if applied:
+            msg += f" (خُصم رصيد دائن: {applied:,.2f})"
+        return ((True, msg),
+                ChangeSet(installments=touched, totals=True, pending_list=True))
+
+    def _apply_credit(self, conn, student_ids, applied_at):
+        """
+        سداد الأقساط المعلقة من الرصيد الدائن للطلاب (بعد توليد خطة جديدة).
+        لا تُسجل حركة جديدة: المبلغ دخل الخزينة مع الدفعة الزائدة الأصلية.
+        يعيد (أرقام الأقساط المتأثرة، إجمالي الرصيد المستخدم).
+        """
+        ids = list(student_ids)
+        credits = []
+        for i in range(0, len(ids), 500):
+            part = ids[i:i + 500]
+            credits += conn.execute(f"""SELECT student_id, credit FROM student_balances
+                                        WHERE credit > 0 AND student_id IN ({','.join('?' * len(part))})""",
+                                    part).fetchall()
+        touched, applied = [], 0.0
+        for student_id, credit in credits:
+            paid, remaining = self._allocate_payment(conn, student_id, None, credit, applied_at)
+            conn.execute("UPDATE student_balances SET credit = ?, updated_at = ? WHERE student_id = ?",
+                         (remaining, applied_at, student_id))
+            touched += paid
+            applied = round(applied + credit - remaining, 2)
+        return touched, applied
+
+    def create_fee_plans_bulk(self, total_fees, installments_count, start_date_str,
+                              grade=None, academic_year=None, student_ids=None, skip_existing=True):
+        """
+        ينشئ نفس خطة التقسيط لمجموعة طلاب (صف، عام دراسي، أو قائمة أرقام) في معاملة واحدة.
+        الطلاب الذين لديهم أقساط مسبقاً يتم تخطيهم عند skip_existing.
+        أرقام student_ids غير الموجودة أو غير المطابقة للصف/العام تظهر في النتائج برسالة فشل.
+        تعيد (نجاح، رسالة، نتائج لكل طالب [(student_id, نجاح، رسالة)]).
+        """
+        start_date, error = self._validate_plan(total_fees, installments_count, start_date_str)
+        if error:
+            return False, error, []
+
+        conditions, params, requested, invalid = [], [], [], []
+        if grade:
+            conditions.append("s.grade = ?")
+            params.append(grade)
+        if academic_year:
+            conditions.append("s.academic_year = ?")
+            params.append(academic_year)
+        if student_ids:
+            for sid in student_ids:
+                try:
+                    requested.append(int(sid))
+                except (TypeError, ValueError):
+                    invalid.append((sid, False, "رقم الطالب غير صالح."))
+            if not requested:
+                return False, "لا توجد أرقام طلاب صالحة.", invalid
+            requested = list(dict.fromkeys(requested))
+            conditions.append(f"s.id IN ({','.join('?' * len(requested))})")
+            params.extend(requested)
+        if not conditions:
+            return False, "يجب تحديد الصف أو العام الدراسي أو قائمة الطلاب.", []
+
+        try:
+            ok, msg, results = self._write(self._create_fee_plans_bulk_tx, " AND ".join(conditions), params,
+                                           total_fees, installments_count, start_date, skip_existing, requested)
+            return ok, msg, results + invalid
+        except Exception as e:
+            return False, f"خطأ في قاعدة البيانات أثناء توليد الخطط: {str(e)}", []
+
+    def _create_fee_plans_bulk_tx(self, conn, where, params, total_fees, installments_count, start_date,
+                                  skip_existing, requested):
+        targets = conn.execute(f"""
+            SELECT s.id, EXISTS (SELECT 1 FROM installments i WHERE i.student_id = s.id)
+            FROM students s
+            WHERE {where}
+            ORDER BY s.id
+        """, params).fetchall()
+
+        # الأرقام المطلوبة التي لم تطابق: غير موجودة أصلاً أو خارج الصف/العام المحدد
+        matched = {student_id for student_id, _ in targets}
+        unmatched = [sid for sid in requested if sid not in matched]
+        existing = {row[0] for row in conn.execute(
+            f"SELECT id FROM students WHERE id IN ({','.join('?' * len(unmatched))})", unmatched)} if unmatched else set()
+        rejected = [(sid, False, "لا يطابق الصف أو العام الدراسي المحدد." if sid in existing else "الطالب غير موجود.")
+                    for sid in unmatched]
+        if not targets:
+            return (False, "لا يوجد طلاب مطابقون للاختيار.", rejected), None
+
+        results, planned = [], []
+        for student_id, has_plan in targets:
+            if has_plan and skip_existing:
+                results.append((student_id, False, "لدى الطالب خطة أقساط مسبقاً."))
+            else:
+                planned.append(student_id)
+                results.append((student_id, True, f"تم توليد {installments_count} قسطاً."))
+
+        conn.executemany("""INSERT INTO installments (student_id, sequence, amount, due_date, status)
+                            VALUES (?, ?, ?, ?, 'pending')""",
+                         (row for student_id in planned
+                          for row in self._plan_rows(student_id, total_fees, installments_count, start_date)))
+        touched, applied = self._apply_credit(conn, planned, now_str())
+
+        msg = f"تم توليد خطط لـ {len(planned)} طالب (تم تخطي {len(targets) - len(planned)})."
+        if rejected:
+            msg += f" (أرقام غير مطابقة: {len(rejected)})"
+            results.extend(rejected)
+        if applied:
+            msg += f" (خُصم رصيد دائن: {applied:,.2f})"
+        return ((True, msg, results),
+                ChangeSet(installments=touched, totals=bool(planned), pending_list=bool(planned)))
 
 
     def get_pending_installments(self):
-        """جلب الأقساط غير المدفوعة مع اسم الطالب"""
-        conn = sqlite3.connect(self.db_path)
+        """جلب الأقساط غير المدفوعة مع اسم الطالب (الصفحة الأولى فقط)"""
+        rows, _ = self.get_pending_installments_page()
+        return rows
+
+    def get_pending_installments_page(self, cursor=None, limit=50, grade=None, academic_year=None, overdue_only=False):
+        """
+        جلب صفحة من الأقساط المعلقة بترقيم Keyset على (due_date, id).
+        cursor: قيمة next_cursor من الصفحة السابقة (أو None للصفحة الأولى).
+        تعيد (rows, next_cursor) و next_cursor = None عند انتهاء النتائج.
+        """
+        conditions = ["i.status = 'pending'"]
+        params = []
+        if cursor:
+            # المقارنة بقيم الصف تستخدم الفهرس مباشرة فتبقى كلفة الصفحة ثابتة مهما كان عمقها
+            conditions.append("(i.due_date, i.id) > (?, ?)")
+            params.extend(cursor)
+        if overdue_only:
+            conditions.append("i.due_date < ?")
+            params.append(today_str())
+        if grade:
+            conditions.append("s.grade = ?")
+            params.append(grade)
+        if academic_year:
+            conditions.append("s.academic_year = ?")
+            params.append(academic_year)
+        params.append(limit)
+
+        with self.db.read() as conn:
+            rows = conn.execute(f"""
+                SELECT i.id, s.name, i.sequence, i.due_date, i.amount, i.paid_amount
+                FROM installments i
+                JOIN students s ON i.student_id = s.id
+                WHERE {" AND ".join(conditions)}
+                ORDER BY i.due_date ASC, i.id ASC
+                LIMIT ?
+            """, params).fetchall()
+
+        next_cursor = (rows[-1][3], rows[-1][0]) if len(rows) == limit else None
+        return rows, next_cursor
+
+    def get_installments_by_ids(self, installment_ids):
+        """جلب أقساط محددة (لتحديث صفوفها في الواجهة بعد تغييرها)"""
+        ids = list(installment_ids)
+        if not ids:
+            return []
+        with self.db.read() as conn:
+            return conn.execute(f"""
+                SELECT i.id, s.name, i.sequence, i.due_date, i.amount, i.paid_amount, i.status
+                FROM installments i
+                JOIN students s ON i.student_id = s.id
+                WHERE i.id IN ({','.join('?' * len(ids))})
+            """, ids).fetchall()
+
+    def _allocate_payment(self, conn, student_id, installment_id, amount, paid_at):
+        """
+        توزيع مبلغ الدفعة على القسط المحدد أولاً ثم باقي الأقساط المعلقة للطالب حسب تاريخ الاستحقاق.
+        يعيد (أرقام الأقساط التي تأثرت، المبلغ المتبقي بعد التوزيع).
+        """
+        rows = conn.execute("""
+            SELECT id, amount, IFNULL(paid_amount, 0)
+            FROM installments
+            WHERE student_id = ? AND status = 'pending'
+            ORDER BY (id = ?) DESC, due_date, id
+        """, (student_id, installment_id)).fetchall()
+
+        remaining = round(amount, 2)
+        touched = []
+        for inst_id, required, already_paid in rows:
+            if remaining <= 0:
+                break
+            take = min(remaining, round(required - already_paid, 2))
+            if take <= 0:
+                continue
+            new_paid = round(already_paid + take, 2)
+            status = 'paid' if new_paid >= required - PAYMENT_EPSILON else 'pending'
+            conn.execute("UPDATE installments SET paid_amount=?, paid_date=?, status=? WHERE id=?",
+                         (new_paid, paid_at, status, inst_id))
+            touched.append(inst_id)
+            remaining = round(remaining - take, 2)
+        return touched, remaining
+
+    def pay_installment(self, installment_id, amount, method, student_name, idempotency_key=None):
+        """
+        تسجيل دفعة (كاملة أو جزئية) وتوزيعها على الأقساط المعلقة حسب ترتيب الاستحقاق.
+        idempotency_key: مفتاح يولده العميل لكل طلب؛ إعادة الإرسال بنفس المفتاح تعيد النتيجة الأصلية دون تسجيل جديد.
+        """
+        if amount <= 0:
+            return False, "المبلغ يجب أن يكون أكبر من صفر."
+        try:
+            return self._write(self._pay_installment_tx, installment_id, amount, method, student_name,
+                               idempotency_key)
+        except Exception as e:
+            return False, f"خطأ في التسديد: {str(e)}"
+
+    def _pay_installment_tx(self, conn, installment_id, amount, method, student_name, idempotency_key=None):
         cur = conn.cursor()
+        cur.execute("SELECT student_id FROM installments WHERE id=?", (installment_id,))
+        inst_data = cur.fetchone()
+        if not inst_data:
+            return (False, "القسط غير موجود."), None
+
+        student_id = inst_data[0]
+        if idempotency_key:
+            # طلب مكرر (ضغط مزدوج أو إعادة محاولة بعد انتهاء المهلة): لا يُسجل مرة أخرى
+            previous = cur.execute("SELECT student_id, amount, date FROM transactions WHERE idempotency_key = ?",
+                                   (idempotency_key,)).fetchone()
+            if previous:
+                if previous[0] != student_id or abs(previous[1] - amount) > PAYMENT_EPSILON:
+                    return (False, "مفتاح الطلب مستخدم مسبقاً لدفعة مختلفة."), None
+                return (True, f"تم تسجيل الدفع بنجاح. المبلغ: {amount:,.2f} (مسجل مسبقاً في {previous[2]})"), None
+
+        paid_at = now_str()
+
+        # 1. توزيع المبلغ على الأقساط (الأرصدة تُحدَّث عبر Triggers دفتر الطلاب)
+        touched, credit = self._allocate_payment(conn, student_id, installment_id, amount, paid_at)
+
+        # 2. ما يزيد عن كل المستحق يُحفظ رصيداً دائناً للطالب
+        if credit > 0:
+            cur.execute("""
+                INSERT INTO student_balances (student_id, credit, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT (student_id) DO UPDATE SET
+                    credit = ROUND(credit + excluded.credit, 2), updated_at = excluded.updated_at
+            """, (student_id, credit, paid_at))
+
+        # 3. تسجيل الحركة في جدول transactions
         cur.execute("""
-            SELECT i.id, s.name, i.sequence, i.due_date, i.amount, i.paid_amount
-            FROM installments i
-            JOIN students s ON i.student_id = s.id
-            WHERE i.status = 'pending'
-            ORDER BY i.due_date ASC
-            LIMIT 50
-        """)
-        data = cur.fetchall()
-        conn.close()
-        return data
-
-    def pay_installment(self, installment_id, amount, method, student_name):
-        """تسجيل دفعة وتحديث حالة القسط"""
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
-        
+            INSERT INTO transactions (student_id, date, amount, type, description, payment_method, idempotency_key)
+            VALUES (?, ?, ?, 'payment', ?, ?, ?)
+        """, (student_id, paid_at, amount, 
+              f"قسط رقم {installment_id} للطالب {student_name}", method, idempotency_key))
+
+        msg = f"تم تسجيل الدفع بنجاح. المبلغ: {amount:,.2f}"
+        if len(touched) > 1:
+            msg += f" (وُزع على {len(touched)} أقساط)"
+        if credit > 0:
+            msg += f" - رصيد دائن: {credit:,.2f}"
+        return ((True, msg),
+                ChangeSet(installments=touched or [installment_id], totals=True))
+
+    def get_student_balance(self, student_id):
+        """رصيد الطالب من دفتر الأرصدة: (المستحق، المدفوع، المتبقي، الرصيد الدائن، أقرب استحقاق)"""
+        with self.db.read() as conn:
+            row = conn.execute("""
+                SELECT billed, paid, outstanding, credit, next_due_date
+                FROM student_balances WHERE student_id = ?
+            """, (student_id,)).fetchone()
+        return row or (0.0, 0.0, 0.0, 0.0, None)
+
+    def get_top_debtors(self, limit=20):
+        """أكثر الطلاب مديونية (من فهرس outstanding دون تجميع على جدول الأقساط)"""
+        with self.db.read() as conn:
+            return conn.execute("""
+                SELECT b.student_id, s.name, s.grade, b.outstanding, b.next_due_date
+                FROM student_balances b
+                JOIN students s ON s.id = b.student_id
+                WHERE b.outstanding > 0
+                ORDER BY b.outstanding DESC
+                LIMIT ?
+            """, (limit,)).fetchall()
+
+    def rebuild_balances(self):
+        """إعادة حساب دفتر الأرصدة بالكامل (للصيانة أو بعد تعديل يدوي للبيانات)"""
         try:
-            cur.execute("SELECT student_id, amount FROM installments WHERE id=?", (installment_id,))
-            inst_data = cur.fetchone()
-            if not inst_data:
-                return False, "القسط غير موجود."
-            
-            student_id, required_amount = inst_data
+            with self.db.transaction() as conn:
+                rebuild_balances(conn)
+                rebuild_last_payment_methods(conn)
+                # أرصدة دائنة سُجلت قبل استخدامها تلقائياً ولطلابها أقساط معلقة
+                owed = [r[0] for r in conn.execute(
+                    "SELECT student_id FROM student_balances WHERE credit > 0 AND outstanding > 0")]
+                touched, _ = self._apply_credit(conn, owed, now_str())
+            self.publish_changes(ChangeSet(installments=touched, totals=True))
+            return True, "تمت إعادة حساب أرصدة الطلاب بنجاح."
+        except Exception as e:
+            return False, f"خطأ في إعادة حساب الأرصدة: {str(e)}"
 
-            # 1. تحديث حالة القسط إلى 'paid'
-            cur.execute("UPDATE installments SET status='paid', paid_amount=?, paid_date=? WHERE id=?", 
-                        (amount, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), installment_id))
-            
-            # 2. تسجيل الحركة في جدول transactions
-            cur.execute("""
-                INSERT INTO transactions (student_id, date, amount, type, description, payment_method)
-                VALUES (?, ?, ?, 'payment', ?, ?)
-            """, (student_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), amount, 
-                  f"قسط رقم {installment_id} للطالب {student_name}", method))
-            
-            conn.commit()
-            return True, f"تم تسجيل الدفع بنجاح. المبلغ: {amount:,.2f}"
-            
+    def get_receivables_aging(self, as_of=None):
+        """أعمار الديون محسوبة مباشرة (تمرير واحد مجمّع على الأقساط المعلقة المتأخرة)"""
+        with self.db.read() as conn:
+            return compute_aging(conn, as_of)
+
+    def get_aging_snapshot(self):
+        """آخر لقطة محفوظة لأعمار الديون: (التاريخ، وقت الحساب، الصفوف) أو None"""
+        with self.db.read() as conn:
+            return load_snapshot(conn)
+
+    def refresh_aging_snapshot(self, as_of=None):
+        """
+        حساب أعمار الديون على اتصال قراءة (لا يحجز الكاتب أثناء التجميع)
+        ثم حفظ النتيجة في معاملة كتابة قصيرة.
+        """
+        as_of = as_of or today_str()
+        try:
+            rows = self.get_receivables_aging(as_of)
+            with self.db.transaction() as conn:
+                taken_at = save_snapshot(conn, as_of, rows)
+            return True, f"تم تحديث أعمار الديون ({len(rows)} مجموعة) في {taken_at}."
         except Exception as e:
-            conn.rollback()
-            return False, f"خطأ في التسديد: {str(e)}"
-        finally:
-            conn.close()
+            return False, f"خطأ في تحديث أعمار الديون: {str(e)}"
 
     # --- 3. دوال إدارة بيانات الطلاب ---
 
+    @cached("students")
     def get_students(self):
         """جلب قائمة الطلاب الأساسية للقوائم المنسدلة"""
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
-        cur.execute("SELECT id, name, grade FROM students ORDER BY name ASC")
-        data = cur.fetchall()
-        conn.close()
-        return data
+        with self.db.read() as conn:
+            return conn.execute("SELECT id, name, grade FROM students ORDER BY name ASC").fetchall()
 
     def add_new_student(self, name, grade, academic_year, parent_phone):
         """إضافة طالب جديد"""
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
         try:
-            cur.execute("""INSERT INTO students (name, grade, academic_year, parent_phone, created_at)
-                           VALUES (?, ?, ?, ?, ?)""", 
-                           (name, grade, academic_year, parent_phone, datetime.now().strftime("%Y-%m-%d")))
-            conn.commit()
-            return True, f"تم إضافة الطالب: {name} بنجاح."
+            return self._write(self._add_new_student_tx, name, grade, academic_year, parent_phone)
         except Exception as e:
-            conn.rollback()
             return False, f"خطأ في الإضافة: {str(e)}"
-        finally:
-            conn.close()
+
+    def _add_new_student_tx(self, conn, name, grade, academic_year, parent_phone):
+        cur = conn.execute("""INSERT INTO students (name, grade, academic_year, parent_phone, created_at)
+                              VALUES (?, ?, ?, ?, ?)""", 
+                           (name, grade, academic_year, parent_phone, today_str()))
+        return (True, f"تم إضافة الطالب: {name} بنجاح."), ChangeSet(students=[cur.lastrowid], roster=True)
 
     def update_student_data(self, student_id, name, grade, academic_year, parent_phone):
         """تحديث بيانات طالب"""
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
         try:
-            cur.execute("""UPDATE students SET name=?, grade=?, academic_year=?, parent_phone=? WHERE id=? """,
-                        (name, grade, academic_year, parent_phone, student_id))
-            conn.commit()
-            return True, f"تم تحديث بيانات الطالب رقم {student_id} بنجاح."
+            return self._write(self._update_student_data_tx, student_id, name, grade, academic_year, parent_phone)
         except Exception as e:
-            conn.rollback()
             return False, f"خطأ في التحديث: {str(e)}"
-        finally:
-            conn.close()
 
+    def _update_student_data_tx(self, conn, student_id, name, grade, academic_year, parent_phone):
+        conn.execute("""UPDATE students SET name=?, grade=?, academic_year=?, parent_phone=? WHERE id=? """,
+                     (name, grade, academic_year, parent_phone, student_id))
+        return (True, f"تم تحديث بيانات الطالب رقم {student_id} بنجاح."), ChangeSet(students=[student_id])
+
+    @cached("students")
     def get_student_details(self, student_id):
         """جلب تفاصيل طالب واحد"""
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
-        cur.execute("SELECT id, name, grade, academic_year, parent_phone FROM students WHERE id=?", (student_id,))
-        data = cur.fetchone()
-        conn.close()
-        return data 
+        with self.db.read() as conn:
+            return conn.execute("SELECT id, name, grade, academic_year, parent_phone FROM students WHERE id=?", (student_id,)).fetchone()
+
+    def get_students_by_ids(self, student_ids):
+        """جلب بيانات طلاب محددين (لتحديث صفوفهم في الواجهة بعد تعديلها)"""
+        ids = list(student_ids)
+        if not ids:
+            return []
+        with self.db.read() as conn:
+            return conn.execute(f"""
+                SELECT id, name, grade, academic_year, parent_phone FROM students
+                WHERE id IN ({','.join('?' * len(ids))})
+            """, ids).fetchall()
 
+    @cached("students")
     def get_all_students_for_management(self):
         """جلب كل بيانات الطلاب لجدول الإدارة"""
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
-        cur.execute("SELECT id, name, grade, academic_year, parent_phone FROM students ORDER BY name ASC")
-        data = cur.fetchall()
-        conn.close()
-        return data
\ No newline at end of file
+        with self.db.read() as conn:
+            return conn.execute("SELECT id, name, grade, academic_year, parent_phone FROM students ORDER BY name ASC").fetchall()
+
+    @cached("students")
+    def suggest_students(self, query, limit=10):
+        """
+        اقتراحات منتقي الطالب أثناء الكتابة: أول limit طالب فقط (id, name, grade, academic_year).
+        بادئة الاسم أولاً عبر idx_students_name، ثم تكملة من فهرس trigram لأي جزء من الاسم أو الهاتف.
+        التكلفة ثابتة تقريباً مهما كان عدد الطلاب لأن كلا الاستعلامين يتوقف عند limit.
+        """
+        query = (query or "").strip()
+        if not query:
+            return []
+        with self.db.read() as conn:
+            results = conn.execute("""
+                SELECT id, name, grade, academic_year FROM students
+                WHERE name >= ? AND name < ? || char(1114111)
+                ORDER BY name ASC
+                LIMIT ?
+            """, (query, query, limit)).fetchall()
+            if query.isdigit() and len(query) < FTS_MIN_TERM_LENGTH:
+                # رقم قصير: غالباً رقم الطالب
+                results += conn.execute("SELECT id, name, grade, academic_year FROM students WHERE id = ?",
+                                        (int(query),)).fetchall()
+
+            match, short_terms = _fts_query(query)
+            if match and len(results) < limit:
+                # بدون ORDER BY rank حتى يتوقف الفهرس عند أول limit تطابق بدلاً من ترتيب كل النتائج
+                seen = {r[0] for r in results}
+                short_sql, short_params = _short_terms_filter(short_terms)
+                for row in conn.execute(f"""
+                    SELECT s.id, s.name, s.grade, s.academic_year
+                    FROM students_fts f
+                    JOIN students s ON s.id = f.rowid
+                    WHERE students_fts MATCH ?{short_sql}
+                    LIMIT ?
+                """, (match, *short_params, limit + len(seen))):
+                    if row[0] not in seen:
+                        results.append(row)
+                        if len(results) >= limit:
+                            break
+        return results[:limit]
+
+    @cached("students")
+    def search_students(self, query="", limit=50, offset=0):
+        """
+        بحث الطلاب بالاسم أو الهاتف أو الصف أو العام الدراسي عبر فهرس FTS5، مرتب حسب الصلة.
+        الكلمات الأقصر من 3 أحرف تُطبق كبادئة كلمة على نتائج FTS، أو كبادئة للاسم إن لم توجد كلمة أطول.
+        """
+        query = (query or "").strip()
+        match, short_terms = _fts_query(query)
+
+        with self.db.read() as conn:
+            if match:
+                short_sql, short_params = _short_terms_filter(short_terms)
+                return conn.execute(f"""
+                    SELECT s.id, s.name, s.grade, s.academic_year, s.parent_phone
+                    FROM students_fts f
+                    JOIN students s ON s.id = f.rowid
+                    WHERE students_fts MATCH ?{short_sql}
+                    ORDER BY f.rank
+                    LIMIT ? OFFSET ?
+                """, (match, *short_params, limit, offset)).fetchall()
+
+            if query:
+                # بحث بالبادئة كنطاق نصف مفتوح على الاسم (قابل للفهرسة بعكس LIKE)
+                return conn.execute("""
+                    SELECT id, name, grade, academic_year, parent_phone FROM students
+                    WHERE name >= ? AND name < ? || char(1114111)
+                    ORDER BY name ASC
+                    LIMIT ? OFFSET ?
+                """, (query, query, limit, offset)).fetchall()
+
+            return conn.execute("""
+                SELECT id, name, grade, academic_year, parent_phone FROM students
+                ORDER BY name ASC
+                LIMIT ? OFFSET ?
+            """, (limit, offset)).fetchall()
@@ -0,0 +1,304 @@
+import csv
+import os
+import re
+
+from changes import ChangeSet
+from dates import normalize_date, normalize_datetime
+from migrations import analyze
+
+# --- الاستيراد الجماعي للطلاب والأقساط والحركات من ملفات CSV / XLSX ---
+# الملف يُقرأ صفاً صفاً (Streaming)، وكل صف يتم التحقق منه وتوحيده، ثم يُكتب على دفعات
+# (executemany داخل معاملة لكل دفعة) فتبقى الذاكرة محدودة مهما كان حجم الملف.
+# عمود id في ملف الطلاب (اختياري) يُحفظ كما هو، فتبقى أرقام الطلاب في ملفات الأقساط والحركات صحيحة،
+# والرقم المستخدم مسبقاً يُرفض بدلاً من ربط الأقساط بطالب آخر.
+
+CHUNK_SIZE = 1000
+MAX_KEPT_REJECTS = 1000  # أقصى عدد صفوف مرفوضة تُحفظ في الذاكرة (الباقي يُكتب في ملف الرفض فقط)
+
+_ARABIC_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹", "01234567890123456789")
+
+
+# --- 1. دوال التوحيد والتحقق (Normalization) ---
+
+def _text(value):
+    return re.sub(r"\s+", " ", str(value)).strip() if value is not None else ""
+
+
+def normalize_phone(value):
+    """إزالة المسافات والرموز من رقم الهاتف وتحويل الأرقام العربية"""
+    text = _text(value).translate(_ARABIC_DIGITS)
+    if text.endswith(".0"):  # أرقام الهواتف المقروءة كأعداد من Excel
+        text = text[:-2]
+    digits = re.sub(r"\D", "", text)
+    if not digits:
+        return ""
+    if len(digits) < 7:
+        raise ValueError(f"رقم هاتف غير صالح: {value}")
+    return ("+" if text.startswith("+") else "") + digits
+
+
+def normalize_grade(value):
+    grade = _text(value).translate(_ARABIC_DIGITS)
+    if not grade:
+        raise ValueError("الصف الدراسي مطلوب")
+    return grade
+
+
+def normalize_academic_year(value):
+    """توحيد العام الدراسي إلى الصيغة YYYY-YYYY (يقبل 2025/2026 و 2025-26 و 2025)"""
+    text = _text(value).translate(_ARABIC_DIGITS)
+    if not text:
+        return ""
+    years = re.findall(r"\d+", text)
+    if not years or len(years[0]) != 4:
+        raise ValueError(f"عام دراسي غير صالح: {value}")
+    start = int(years[0])
+    if len(years) > 1:
+        end = int(years[1]) if len(years[1]) == 4 else (start // 100) * 100 + int(years[1])
+    else:
+        end = start + 1
+    if end != start + 1:
+        raise ValueError(f"عام دراسي غير صالح: {value}")
+    return f"{start}-{end}"
+
+
+def _amount(value, field="المبلغ"):
+    try:
+        amount = float(_text(value).translate(_ARABIC_DIGITS).replace(",", ""))
+    except ValueError:
+        raise ValueError(f"{field} غير صالح: {value}")
+    if amount < 0:
+        raise ValueError(f"{field} لا يمكن أن يكون سالباً")
+    return amount
+
+
+def _integer(value, field):
+    """رقم صحيح (10 أو 10.0 من Excel)، والكسور تُرفض بدلاً من اقتطاعها فلا يرتبط الصف بطالب آخر"""
+    number = _amount(value, field)
+    if not number.is_integer():
+        raise ValueError(f"{field} يجب أن يكون عدداً صحيحاً: {value}")
+    return int(number)
+
+
+def _required_date(value, normalizer, field):
+    normalized = normalizer(value)
+    if not normalized:
+        raise ValueError(f"{field} غير صالح: {value}")
+    return normalized
+
+
+def _student_row(row):
+    name = _text(row.get("name"))
+    if not name:
+        raise ValueError("اسم الطالب مطلوب")
+    created_at = normalize_date(row.get("created_at")) if row.get("created_at") else None
+    # رقم الطالب من النظام القديم يُحفظ كما هو، لأن ملفات الأقساط والحركات تشير إليه
+    student_id = row.get("id")
+    return (
+        _integer(student_id, "رقم الطالب") if _text(student_id) else None,
+        name,
+        normalize_grade(row.get("grade")),
+        normalize_academic_year(row.get("academic_year")),
+        normalize_phone(row.get("parent_phone")),
+        created_at,
+        _text(row.get("status")) or "active",
+    )
+
+
+def _installment_row(row):
+    status = _text(row.get("status")).lower() or "pending"
+    if status not in ("pending", "paid"):
+        raise ValueError(f"حالة قسط غير معروفة: {status}")
+    paid_date = row.get("paid_date")
+    return (
+        _integer(row.get("student_id"), "رقم الطالب"),
+        _integer(row.get("sequence") or 0, "رقم القسط"),
+        _amount(row.get("amount")),
+        _amount(row.get("paid_amount") or 0, "المبلغ المدفوع"),
+        _required_date(row.get("due_date"), normalize_date, "تاريخ الاستحقاق"),
+        normalize_datetime(paid_date) if paid_date else None,
+        status,
+    )
+
+
+def _transaction_row(row):
+    tx_type = _text(row.get("type")).lower() or "payment"
+    if tx_type not in ("payment", "expense"):
+        raise ValueError(f"نوع حركة غير معروف: {tx_type}")
+    student_id = row.get("student_id")
+    return (
+        _integer(student_id, "رقم الطالب") if _text(student_id) else None,
+        _required_date(row.get("date"), normalize_datetime, "التاريخ"),
+        _amount(row.get("amount")),
+        tx_type,
+        _text(row.get("description")),
+        _text(row.get("payment_method")) or "Cash",
+    )
+
+
+# فحص رقم الطالب (العمود الأول في كل صف) قبل الإدخال:
+# NEW_ID: رقم طالب جديد يجب ألا يكون مستخدماً (فارغ = رقم تلقائي)، REFERENCE: يجب أن يشير لطالب موجود
+NEW_ID, REFERENCE = "new_id", "reference"
+
+# لكل نوع استيراد: دالة تحويل الصف + جملة الإدخال + نوع فحص رقم الطالب
+IMPORT_KINDS = {
+    "students": (_student_row, """
+        INSERT INTO students (id, name, grade, academic_year, parent_phone, created_at, status)
+        VALUES (?, ?, ?, ?, ?, IFNULL(?, date('now', 'localtime')), ?)
+    """, NEW_ID),
+    "installments": (_installment_row, """
+        INSERT INTO installments (student_id, sequence, amount, paid_amount, due_date, paid_date, status)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, REFERENCE),
+    "transactions": (_transaction_row, """
+        INSERT INTO transactions (student_id, date, amount, type, description, payment_method)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, REFERENCE),
+}
+
+
+# --- 2. قراءة الملفات صفاً صفاً ---
+
+def _iter_csv(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for line_no, row in enumerate(csv.DictReader(f), start=2):
+            yield line_no, {(k or "").strip().lower(): v for k, v in row.items()}
+
+
+def _iter_xlsx(path):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise RuntimeError("استيراد ملفات Excel يتطلب تثبيت الحزمة openpyxl")
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(h or "").strip().lower() for h in next(rows, ())]
+        for line_no, values in enumerate(rows, start=2):
+            if values and any(v is not None for v in values):
+                yield line_no, dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+def iter_file_rows(path):
+    """قراءة صفوف ملف CSV أو XLSX كقواميس (رقم السطر، الصف) دون تحميل الملف كاملاً"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".xlsx", ".xlsm"):
+        return _iter_xlsx(path)
+    if ext in (".csv", ".txt"):
+        return _iter_csv(path)
+    raise ValueError(f"صيغة ملف غير مدعومة: {ext}")
+
+
+# --- 3. الاستيراد على دفعات ---
+
+class ImportReport:
+    """ملخص عملية الاستيراد: عدد الصفوف المقروءة والمستوردة والمرفوضة"""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.total = 0
+        self.imported = 0
+        self.rejected_count = 0
+        self.rejected = []  # [(رقم السطر، السبب)] بحد أقصى MAX_KEPT_REJECTS
+
+    def reject(self, line_no, reason):
+        self.rejected_count += 1
+        if len(self.rejected) < MAX_KEPT_REJECTS:
+            self.rejected.append((line_no, reason))
+
+    def summary(self):
+        return (f"استيراد {self.kind}: {self.imported} صف من {self.total} "
+                f"(مرفوض: {self.rejected_count})")
+
+
+def _existing_students(conn, ids):
+    existing = set()
+    for i in range(0, len(ids), 500):
+        part = ids[i:i + 500]
+        existing.update(r[0] for r in conn.execute(
+            f"SELECT id FROM students WHERE id IN ({','.join('?' * len(part))})", part))
+    return existing
+
+
+def _flush(system, insert_sql, chunk, student_check, report, reject):
+    """كتابة دفعة واحدة في معاملة مستقلة بعد فحص أرقام الطلاب"""
+    with system.db.transaction() as conn:
+        existing = _existing_students(conn, list({values[0] for _, values in chunk if values[0] is not None}))
+        valid = []
+        for line_no, values in chunk:
+            student_id = values[0]
+            if student_id is None:
+                valid.append(values)
+            elif student_check == REFERENCE and student_id not in existing:
+                reject(line_no, f"الطالب رقم {student_id} غير موجود", None)
+            elif student_check == NEW_ID and student_id in existing:
+                reject(line_no, f"رقم الطالب {student_id} مستخدم مسبقاً", None)
+            else:
+                if student_check == NEW_ID:
+                    existing.add(student_id)  # رقم مكرر داخل نفس الملف
+                valid.append(values)
+
+        if student_check == NEW_ID:
+            # الأرقام الصريحة أولاً حتى لا يحجز رقم تلقائي رقماً مطلوباً في نفس الدفعة
+            valid.sort(key=lambda values: values[0] is None)
+        conn.executemany(insert_sql, valid)
+    report.imported += len(valid)
+
+
+def import_file(system, kind, path, chunk_size=CHUNK_SIZE, progress=None, rejects_path=None):
+    """
+    استيراد ملف CSV/XLSX إلى جدول students أو installments أو transactions.
+    progress(report): تُستدعى بعد كل دفعة. rejects_path: ملف CSV اختياري تُكتب فيه الصفوف المرفوضة.
+    """
+    if kind not in IMPORT_KINDS:
+        raise ValueError(f"نوع استيراد غير معروف: {kind}")
+    to_values, insert_sql, student_check = IMPORT_KINDS[kind]
+    report = ImportReport(kind)
+
+    rejects_file = open(rejects_path, "w", newline="", encoding="utf-8-sig") if rejects_path else None
+    rejects_writer = csv.writer(rejects_file) if rejects_file else None
+    if rejects_writer:
+        rejects_writer.writerow(["line", "reason", "row"])
+
+    def reject(line_no, reason, row):
+        report.reject(line_no, reason)
+        if rejects_writer:
+            rejects_writer.writerow([line_no, reason, row if row is not None else ""])
+
+    try:
+        chunk = []
+        for line_no, row in iter_file_rows(path):
+            report.total += 1
+            try:
+                chunk.append((line_no, to_values(row)))
+            except (ValueError, TypeError) as e:
+                reject(line_no, str(e), row)
+                continue
+
+            if len(chunk) >= chunk_size:
+                _flush(system, insert_sql, chunk, student_check, report, reject)
+                chunk = []
+                if progress:
+                    progress(report)
+
+        if chunk:
+            _flush(system, insert_sql, chunk, student_check, report, reject)
+        if progress:
+            progress(report)
+    finally:
+        if rejects_file:
+            rejects_file.close()
+
+    # تحديث إحصائيات المخطِّط بعد الإدخال الكبير
+    if report.imported:
+        with system.db.transaction() as conn:
+            analyze(conn)
+        system.publish_changes(ChangeSet(
+            totals=kind != "students",
+            pending_list=kind == "installments",
+            roster=kind == "students",
+        ))
+    return report
@@ -0,0 +1,232 @@
+import functools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from logging.handlers import RotatingFileHandler
+
+# --- قياس الأداء داخل التطبيق (Instrumentation) ---
+# - عدد الاستدعاءات وتوزيع زمن كل دالة عامة في FinanceSystem
+# - زمن كل جملة SQL (عبر Connection/Cursor مخصصين لأن sqlite3 في بايثون لا يوفر profile hook)
+# - سجل الاستعلامات البطيئة مع EXPLAIN QUERY PLAN في ملف JSON Lines
+# زمن الجملة يشمل التنفيذ حتى أول صف (execute)، أما جلب باقي الصفوف فيظهر في زمن الدالة.
+
+BUCKETS_MS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, float("inf"))
+EXCLUDED_METHODS = {
+    "close", "subscribe", "unsubscribe", "publish_changes", "data_version", "invalidate", "cache_stats",
+    "write_stats",
+}
+# الجمل التي لا معنى لخطة تنفيذها
+_NO_PLAN_PREFIXES = ("BEGIN", "COMMIT", "ROLLBACK", "PRAGMA", "SAVEPOINT", "RELEASE", "ANALYZE", "EXPLAIN")
+
+log = logging.getLogger("school.perf")
+
+
+class Histogram:
+    """توزيع أزمنة (بالملي ثانية) على حاويات ثابتة"""
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS_MS)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms):
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                self.counts[i] += 1
+                break
+
+    def percentile(self, pct):
+        """قيمة تقريبية (الحد الأعلى للحاوية) للنسبة المئوية المطلوبة"""
+        if not self.count:
+            return 0.0
+        target = self.count * pct / 100
+        seen = 0
+        for bound, n in zip(BUCKETS_MS, self.counts):
+            seen += n
+            if seen >= target:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.total_ms / self.count if self.count else 0.0,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "max_ms": self.max_ms,
+        }
+
+
+class Metrics:
+    """سجل مقاييس مشترك بين كل الخيوط"""
+
+    def __init__(self, slow_ms=100.0, keep_slow=100):
+        self.slow_ms = slow_ms
+        self.methods = {}
+        self.statements = {}
+        self.slow_queries = deque(maxlen=keep_slow)
+        self._lock = threading.Lock()
+        self._context = threading.local()
+
+    def _observe(self, table, key, ms):
+        with self._lock:
+            hist = table.get(key)
+            if hist is None:
+                hist = table[key] = Histogram()
+            hist.observe(ms)
+
+    def observe_method(self, name, ms):
+        self._observe(self.methods, name, ms)
+
+    def observe_statement(self, sql, ms):
+        self._observe(self.statements, " ".join(sql.split()), ms)
+
+    def current_method(self):
+        return getattr(self._context, "method", None)
+
+    def record_slow_query(self, sql, params, ms, plan):
+        entry = {
+            "event": "slow_query",
+            "at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "ms": round(ms, 3),
+            "method": self.current_method(),
+            "sql": " ".join(sql.split()),
+            "params": [str(p) for p in params][:20] if isinstance(params, (list, tuple)) else None,
+            "plan": plan,
+        }
+        with self._lock:
+            self.slow_queries.append(entry)
+        log.warning(json.dumps(entry, ensure_ascii=False))
+
+    def snapshot(self):
+        """نسخة من كل المقاييس (للوحة التشخيص أو التصدير)"""
+        with self._lock:
+            return {
+                "methods": {k: h.snapshot() for k, h in self.methods.items()},
+                "statements": {k: h.snapshot() for k, h in self.statements.items()},
+                "slow_queries": list(self.slow_queries),
+            }
+
+    def reset(self):
+        with self._lock:
+            self.methods.clear()
+            self.statements.clear()
+            self.slow_queries.clear()
+
+
+# --- 1. اتصالات تقيس زمن كل جملة ---
+
+class InstrumentedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        return self._timed(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._timed(super().executemany, sql, seq_of_parameters, many=True)
+
+    def _timed(self, run, sql, parameters, many=False):
+        conn = self.connection
+        metrics = getattr(conn, "metrics", None)
+        if metrics is None or conn._explaining:
+            return run(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return run(sql, parameters)
+        finally:
+            ms = (time.perf_counter() - started) * 1000
+            metrics.observe_statement(sql, ms)
+            if ms >= metrics.slow_ms and not many:
+                metrics.record_slow_query(sql, parameters, ms, conn.explain(sql, parameters))
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection يمرر كل الجمل عبر InstrumentedCursor (يُمرَّر كـ factory لـ sqlite3.connect)"""
+
+    metrics = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._explaining = False
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def explain(self, sql, parameters):
+        """خطة تنفيذ الجملة (EXPLAIN QUERY PLAN) كنص لكل خطوة"""
+        if sql.lstrip().upper().startswith(_NO_PLAN_PREFIXES):
+            return []
+        self._explaining = True
+        try:
+            rows = super().execute("EXPLAIN QUERY PLAN " + sql, parameters).fetchall()
+            return [row[-1] for row in rows]
+        except sqlite3.Error as e:
+            return [f"(تعذر الحصول على الخطة: {e})"]
+        finally:
+            self._explaining = False
+
+
+# --- 2. ربط القياس بـ FinanceSystem ---
+
+def configure_log(path="logs/perf.log", max_bytes=5 * 1024 * 1024, backups=3):
+    """سجل منظم (سطر JSON لكل حدث) مع تدوير الملفات"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if not any(getattr(h, "baseFilename", None) == os.path.abspath(path) for h in log.handlers):
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        log.addHandler(handler)
+    log.setLevel(logging.INFO)
+    log.propagate = False
+
+
+def _wrap_method(metrics, name, fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        outer = metrics.current_method()
+        metrics._context.method = outer or name
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            ms = (time.perf_counter() - started) * 1000
+            metrics._context.method = outer
+            metrics.observe_method(name, ms)
+            if ms >= metrics.slow_ms:
+                log.info(json.dumps({"event": "slow_method", "method": name, "ms": round(ms, 3)},
+                                    ensure_ascii=False))
+    return wrapper
+
+
+def instrument(system, slow_ms=100.0, log_path="logs/perf.log"):
+    """تفعيل القياس على كائن FinanceSystem وإرجاع كائن Metrics الخاص به"""
+    metrics = Metrics(slow_ms=slow_ms)
+    if log_path:
+        configure_log(log_path)
+
+    # الاتصالات الجديدة تُنشأ بالـ factory المقاس وتحمل مرجعاً للمقاييس
+    system.db.close()
+    system.db.factory = InstrumentedConnection
+    system.db.on_connect = lambda conn: setattr(conn, "metrics", metrics)
+
+    for name in dir(system):
+        if name.startswith("_") or name in EXCLUDED_METHODS:
+            continue
+        attr = getattr(system, name)
+        if callable(attr) and hasattr(type(system), name):
+            setattr(system, name, _wrap_method(metrics, name, attr))
+
+    system.metrics = metrics
+    return metrics
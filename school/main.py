@@ -1,14 +1,66 @@
+import time
+
+# بداية قياس زمن التشغيل (قبل استيراد Flet وباقي الوحدات)
+STARTED_AT = time.perf_counter()
+
+import asyncio
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+
 import flet as ft
+from async_finance import AsyncFinanceSystem, Superseded
 from finance_system import FinanceSystem
-from db_init import init_db
-import sqlite3 
+from db_init import ensure_schema
+from downloads import DownloadArea
+from instrumentation import instrument, log as perf_log
+from receipts import ReceiptPrinter
+from session import SessionFeed, SessionState
+
+# مجلد الملفات التي يقدمها خادم Flet للمتصفح (الإيصالات والتقارير تُسلَّم منه بروابط عشوائية)
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+
+# حد الاستعلام البطيء (ملي ثانية) وملف السجل المنظم للأداء
+SLOW_QUERY_MS = 100
+PERF_LOG_PATH = "logs/perf.log"
+
+# عدد الطلاب المعروضين في كل دفعة من جدول الإدارة (البحث يتم في قاعدة البيانات)
+STUDENTS_PAGE_SIZE = 100
+
+# ترتيب التبويبات (لتحميل كل تبويب عند أول عرض له)
+TAB_DASHBOARD, TAB_PLANS, TAB_STUDENTS, TAB_AGING, TAB_DIAGNOSTICS = range(5)
+
+# عدد الاقتراحات في منتقي الطالب (الخطط المالية)
+PLAN_SUGGESTIONS = 10
+
+# فترة فحص لقطة أعمار الديون (ثوانٍ): تُعاد مرة واحدة للعملية كلها عند تغير اليوم
+AGING_CHECK_SECONDS = 3600
+
+# أزمنة مراحل التشغيل (ملي ثانية) لتبويب التشخيص وسجل الأداء
+startup_timings = {"imports_ms": (time.perf_counter() - STARTED_AT) * 1000}
+# مشكلات البيئة المكتشفة عند التشغيل (تظهر في تبويب التشخيص)
+startup_warnings = []
+
 
-# متغير عالمي لتخزين قائمة الطلاب الحالية المعروضة في جدول الإدارة (للبحث)
-current_managed_students_data = []
+def report_startup(stage, **timings):
+    """طباعة أزمنة مرحلة من مراحل التشغيل وتسجيلها في سجل الأداء"""
+    startup_timings.update(timings)
+    print(f"⏱️ {stage}: " + "، ".join(f"{k} = {v:.0f} ms" for k, v in timings.items()))
+    perf_log.info(json.dumps({"event": "startup", "stage": stage, **timings}, ensure_ascii=False))
 
-# 1. تهيئة قاعدة البيانات والنظام المالي
-init_db()
+
+# 1. النظام المالي (الاتصالات تُفتح عند أول استعلام، وفحص المخطط يتم عند التشغيل فقط)
 system = FinanceSystem()
+# قياس زمن الدوال والجمل وتسجيل الاستعلامات البطيئة (تعرض في تبويب التشخيص)
+metrics = instrument(system, slow_ms=SLOW_QUERY_MS, log_path=PERF_LOG_PATH)
+# واجهة غير متزامنة مشتركة: مجموعة خيوط محدودة لكل استدعاءات قاعدة البيانات
+finance = AsyncFinanceSystem(system, max_workers=4)
+# طباعة الإيصالات في عمليات منفصلة (تُشغَّل وتُسخَّن عند بدء الخدمة)
+printer = ReceiptPrinter(system)
+# الملفات المسلَّمة للمتصفح (مؤقتة، بأسماء لا يمكن تخمينها)
+downloads = DownloadArea(ASSETS_DIR)
 
 def main(page: ft.Page):
     # 2. إعدادات الصفحة الرئيسية
@@ -21,6 +73,9 @@ def main(page: ft.Page):
     page.scroll = ft.ScrollMode.ADAPTIVE
     
     print("✅ التطبيق بدأ التشغيل...")  # رسالة تأكيد في الكونسول
+    session_started = time.perf_counter()
+    # حالة هذه الجلسة فقط (الجداول، الترقيم، البحث...) بلا أي متغيرات مشتركة بين الجلسات
+    state = SessionState(page.session_id)
     
     # --- وظيفة مساعدة لعرض الرسائل (Snack Bar) ---
     def show_snackbar(message, page, error=False):
@@ -76,76 +131,181 @@ def main(page: ft.Page):
         border=ft.border.all(1, ft.Colors.GREY_300)
     )
     
+    # عناصر ترقيم صفحات الأقساط المعلقة (Keyset)
+    tf_pending_grade = ft.TextField(label="الصف", width=150)
+    tf_pending_year = ft.TextField(label="العام الدراسي", width=150)
+    cb_pending_overdue = ft.Checkbox(label="المتأخرة فقط", value=False)
+    txt_pending_page = ft.Text("صفحة 1")
+    btn_pending_prev = ft.IconButton(icon=ft.Icons.CHEVRON_RIGHT, tooltip="الصفحة السابقة", disabled=True)
+    btn_pending_next = ft.IconButton(icon=ft.Icons.CHEVRON_LEFT, tooltip="الصفحة التالية", disabled=True)
+    
+    btn_students_more = ft.TextButton("تحميل المزيد", icon=ft.Icons.EXPAND_MORE, visible=False)
+    
+    # عناصر تصدير التقارير
+    dd_report = ft.Dropdown(
+        label="التقرير", 
+        width=200, 
+        value="roster",
+        options=[
+            ft.dropdown.Option(key="roster", text="كشف الطلاب"),
+            ft.dropdown.Option(key="pending", text="الأقساط المستحقة"),
+            ft.dropdown.Option(key="overdue", text="الأقساط المتأخرة"),
+            ft.dropdown.Option(key="cash_journal", text="يومية الخزينة"),
+        ]
+    )
+    dd_report_format = ft.Dropdown(
+        label="الصيغة", 
+        width=100, 
+        value="pdf",
+        options=[ft.dropdown.Option("pdf"), ft.dropdown.Option("csv")]
+    )
+    export_progress = ft.ProgressRing(width=20, height=20, visible=False)
+    txt_export_progress = ft.Text("")
+    
     # حقول الإدخال للخطة المالية
-    dd_students = ft.Dropdown(label="اختر الطالب", width=300)
+    # منتقي الطالب: بحث أثناء الكتابة في قاعدة البيانات بدلاً من تحميل كل الطلاب في قائمة منسدلة
+    tf_plan_student = ft.TextField(label="ابحث عن الطالب (الاسم / الهاتف / الرقم)", width=300,
+                                   prefix_icon=ft.Icons.PERSON_SEARCH)
+    plan_suggestions = ft.Column(spacing=0, visible=False, width=300)
     tf_total = ft.TextField(label="إجمالي الرسوم السنوية", width=200, keyboard_type=ft.KeyboardType.NUMBER)
     tf_count = ft.TextField(label="عدد الأقساط", width=150, value="10", keyboard_type=ft.KeyboardType.NUMBER)
     tf_start = ft.TextField(label="تاريخ بداية الأقساط (YYYY-MM-DD)", width=250, value="2025-09-01")
 
+    # الوضع الجماعي: نفس الخطة لكل طلاب صف و/أو عام دراسي
+    sw_bulk_plan = ft.Switch(label="خطة جماعية (صف / عام دراسي)", value=False)
+    tf_bulk_grade = ft.TextField(label="الصف", width=200, visible=False)
+    tf_bulk_year = ft.TextField(label="العام الدراسي", width=200, visible=False)
+
     # تعريف حقول إدخال الطالب
     dlg_std_name = ft.TextField(label="اسم الطالب")
     dlg_std_grade = ft.TextField(label="الصف/المرحلة الدراسية")
     dlg_std_academic_year = ft.TextField(label="العام الدراسي (مثال: 2025-2026)")
     dlg_std_phone = ft.TextField(label="هاتف ولي الأمر (اختياري)")
     
+    # --- تشغيل استدعاءات قاعدة البيانات خارج دوال الأحداث ---
+
+    loading_bar = ft.ProgressBar(visible=False)
+
+    async def run_db(method, *args, key=None, debounce=0.0, **kwargs):
+        """
+        تشغيل دالة FinanceSystem في مجموعة الخيوط مع إظهار شريط التحميل.
+        key: الطلبات الأحدث بنفس المفتاح تلغي الأقدم (يُرفع Superseded للقديم).
+        """
+        state.busy["count"] += 1
+        if not loading_bar.visible:
+            loading_bar.visible = True
+            if not state.busy["batched"]:
+                page.update()
+        try:
+            if key:
+                return await finance.latest(f"{state.session_id}:{key}", method, *args, debounce=debounce, **kwargs)
+            return await finance.call(method, *args, **kwargs)
+        finally:
+            state.busy["count"] -= 1
+            loading_bar.visible = state.busy["count"] > 0
+
     # --- دوال تحميل وتحديث البيانات ---
     
-    def load_students_dropdowns():
+    async def suggest_plan_students(e):
+        """اقتراحات منتقي الطالب: أول الطلاب المطابقين فقط، مع تأخير بسيط بين الضغطات"""
+        query = (tf_plan_student.value or "").strip()
+        state.plan_student.update(id=None, name="")
         try:
-            students_list = system.get_students()
-            options = [ft.dropdown.Option(key=str(s[0]), text=f"{s[1]} ({s[2]})") for s in students_list]
-            dd_students.options = options
-            page.update()
-            print(f"✅ تم تحميل {len(students_list)} طالب في القائمة المنسدلة")
-        except Exception as e:
-            print(f"❌ خطأ في تحميل الطلاب: {e}")
+            students = await run_db("suggest_students", query, PLAN_SUGGESTIONS, key="plan-student",
+                                    debounce=0.2) if query else []
+        except Superseded:
+            return
+        plan_suggestions.controls = [
+            ft.ListTile(
+                title=ft.Text(name),
+                subtitle=ft.Text(f"{grade} - {academic_year or '-'} (رقم {s_id})"),
+                dense=True,
+                data=(s_id, name),
+                on_click=pick_plan_student,
+            )
+            for s_id, name, grade, academic_year in students
+        ]
+        plan_suggestions.visible = bool(students)
+        page.update()
 
-    def filter_and_load_student_management_table(query=""):
-        global current_managed_students_data
-        
-        try:
-            if not current_managed_students_data:
-                current_managed_students_data = system.get_all_students_for_management()
+    def pick_plan_student(e):
+        s_id, name = e.control.data
+        state.plan_student.update(id=s_id, name=name)
+        tf_plan_student.value = name
+        plan_suggestions.visible = False
+        page.update()
 
-            student_management_table.rows.clear()
-            
-            filtered_students = []
-            if query:
-                q = query.strip().lower()
-                for s in current_managed_students_data:
-                    if q in s[1].lower() or (s[4] and q in s[4].lower()):
-                        filtered_students.append(s)
+    tf_plan_student.on_change = suggest_plan_students
+
+    async def filter_and_load_student_management_table(query="", append=False, debounce=0.0):
+        try:
+            if append:
+                query = state.students_search["query"]
+                offset = state.students_search["offset"]
             else:
-                filtered_students = current_managed_students_data
+                offset = 0
+
+            # بحث مرتب بالصلة من فهرس FTS5 بدلاً من تحميل كل الطلاب في الذاكرة
+            results = await run_db(
+                "search_students", 
+                query, 
+                limit=STUDENTS_PAGE_SIZE, 
+                offset=offset,
+                key="students-search",
+                debounce=debounce
+            )
 
-            for s in filtered_students:
+            if not append:
+                state.students_search["query"] = query
+                student_management_table.rows.clear()
+                state.managed_rows.clear()
+            state.students_search["offset"] = offset + len(results)
+
+            for s in results:
                 s_id, name, grade, academic_year, phone = s
                 edit_btn = ft.IconButton(
                     icon=ft.Icons.EDIT, 
                     icon_color=ft.Colors.AMBER, 
                     tooltip="تعديل بيانات الطالب",
                     data=s_id, 
-                    on_click=lambda e: open_student_form(e, action="edit")
+                    on_click=edit_student_click
                 )
-                student_management_table.rows.append(
-                    ft.DataRow(cells=[
-                        ft.DataCell(ft.Text(str(s_id))), 
-                        ft.DataCell(ft.Text(name)), 
-                        ft.DataCell(ft.Text(grade)),
-                        ft.DataCell(ft.Text(academic_year or "-")), 
-                        ft.DataCell(ft.Text(phone or "-")), 
-                        ft.DataCell(edit_btn),
-                    ])
-                )
-            page.update()
-            print(f"✅ تم تحميل {len(filtered_students)} طالب في جدول الإدارة")
+                row = ft.DataRow(cells=[
+                    ft.DataCell(ft.Text(str(s_id))), 
+                    ft.DataCell(ft.Text(name)), 
+                    ft.DataCell(ft.Text(grade)),
+                    ft.DataCell(ft.Text(academic_year or "-")), 
+                    ft.DataCell(ft.Text(phone or "-")), 
+                    ft.DataCell(edit_btn),
+                ])
+                state.managed_rows[s_id] = row
+                student_management_table.rows.append(row)
+            btn_students_more.visible = len(results) == STUDENTS_PAGE_SIZE
+            print(f"✅ تم تحميل {len(results)} طالب في جدول الإدارة")
+        except Superseded:
+            pass  # ضغطة بحث أقدم: نتيجتها لم تعد مطلوبة
         except Exception as e:
             print(f"❌ خطأ في تحميل جدول الطلاب: {e}")
+
+    async def load_more_students(e):
+        await filter_and_load_student_management_table(append=True)
+        page.update()
+
+    btn_students_more.on_click = load_more_students
         
-    def load_pending_installments():
+    async def load_pending_installments():
         try:
+            data, next_cursor = await run_db(
+                "get_pending_installments_page",
+                cursor=state.pending_pager["cursors"][-1],
+                grade=tf_pending_grade.value.strip() or None,
+                academic_year=tf_pending_year.value.strip() or None,
+                overdue_only=cb_pending_overdue.value,
+                key="pending-page"
+            )
+            state.pending_pager["next"] = next_cursor
             pending_table.rows.clear()
-            data = system.get_pending_installments()
+            state.pending_rows.clear()
             
             for row in data:
                 inst_id, s_name, seq, date, amount, paid_amount = row
@@ -157,23 +317,51 @@ def main(page: ft.Page):
                     data={"id": inst_id, "amount": remaining, "name": s_name}, 
                     on_click=open_payment_dialog
                 )
-                pending_table.rows.append(
-                    ft.DataRow(cells=[
-                        ft.DataCell(ft.Text(s_name)), 
-                        ft.DataCell(ft.Text(str(seq))), 
-                        ft.DataCell(ft.Text(date)),
-                        ft.DataCell(ft.Text(f"{remaining:,.2f}")),
-                        ft.DataCell(pay_btn),
-                    ])
-                )
-            page.update()
+                row = ft.DataRow(cells=[
+                    ft.DataCell(ft.Text(s_name)), 
+                    ft.DataCell(ft.Text(str(seq))), 
+                    ft.DataCell(ft.Text(date)),
+                    ft.DataCell(ft.Text(f"{remaining:,.2f}")),
+                    ft.DataCell(pay_btn),
+                ])
+                state.pending_rows[inst_id] = row
+                pending_table.rows.append(row)
+            txt_pending_page.value = f"صفحة {len(state.pending_pager['cursors'])}"
+            btn_pending_prev.disabled = len(state.pending_pager["cursors"]) <= 1
+            btn_pending_next.disabled = next_cursor is None
             print(f"✅ تم تحميل {len(data)} قسط معلق")
+        except Superseded:
+            pass
         except Exception as e:
             print(f"❌ خطأ في تحميل الأقساط: {e}")
 
-    def refresh_dashboard():
+    async def pending_next_page(e):
+        if state.pending_pager["next"]:
+            state.pending_pager["cursors"].append(state.pending_pager["next"])
+            await load_pending_installments()
+            page.update()
+
+    async def pending_prev_page(e):
+        if len(state.pending_pager["cursors"]) > 1:
+            state.pending_pager["cursors"].pop()
+            await load_pending_installments()
+            page.update()
+
+    async def pending_filters_change(e):
+        # أي تغيير في الفلاتر يعيد الترقيم للصفحة الأولى
+        state.pending_pager["cursors"] = [None]
+        await load_pending_installments()
+        page.update()
+
+    btn_pending_next.on_click = pending_next_page
+    btn_pending_prev.on_click = pending_prev_page
+    tf_pending_grade.on_submit = pending_filters_change
+    tf_pending_year.on_submit = pending_filters_change
+    cb_pending_overdue.on_change = pending_filters_change
+
+    async def load_daily_stats():
         try:
-            total, trans, overdue = system.get_daily_stats()
+            total, trans, overdue = await run_db("get_daily_stats", key="daily-stats")
             txt_daily_total.value = f"{total:,.2f} ج.م"
             txt_overdue_count.value = f"{overdue[0]} أقساط"
             
@@ -187,26 +375,125 @@ def main(page: ft.Page):
                         ft.DataCell(ft.Text(t[3])),
                     ])
                 )
-                
-            load_pending_installments()
-            load_students_dropdowns() 
-            page.update()
-            print("✅ تم تحديث اللوحة الرئيسية")
+        except Superseded:
+            pass
         except Exception as e:
-            print(f"❌ خطأ في تحديث اللوحة: {e}")
+            print(f"❌ خطأ في تحميل الإحصائيات: {e}")
+
+    async def refresh_dashboard():
+        # الاستعلامان يعملان بالتوازي في مجموعة الخيوط
+        await asyncio.gather(load_daily_stats(), load_pending_installments())
+        page.update()
+        print("✅ تم تحديث اللوحة الرئيسية")
+
+    # --- التحديث التدريجي حسب التغييرات (Change-aware refresh) ---
+
+    def patch_pending_rows(installments):
+        """تحديث صفوف الأقساط المتغيرة فقط: إزالة المسددة وتعديل المبلغ المتبقي للباقي"""
+        for inst_id, s_name, seq, date, amount, paid_amount, status in installments:
+            row = state.pending_rows.get(inst_id)
+            if row is None:
+                continue
+            if status != "pending":
+                pending_table.rows.remove(row)
+                del state.pending_rows[inst_id]
+                continue
+            remaining = amount - paid_amount
+            row.cells[0].content.value = s_name
+            row.cells[3].content.value = f"{remaining:,.2f}"
+            row.cells[4].content.data["amount"] = remaining
+
+    def patch_student_rows(students):
+        """تحديث صفوف الطلاب المعدلين في جدول الإدارة والطالب المختار في منتقي الخطة"""
+        for s_id, name, grade, academic_year, phone in students:
+            row = state.managed_rows.get(s_id)
+            if row is not None:
+                row.cells[1].content.value = name
+                row.cells[2].content.value = grade
+                row.cells[3].content.value = academic_year or "-"
+                row.cells[4].content.value = phone or "-"
+            if state.plan_student["id"] == s_id:
+                state.plan_student["name"] = tf_plan_student.value = name
+
+    async def apply_changes(changes):
+        """تطبيق ChangeSet على هذه الجلسة ثم إرسال تحديث واحد للمتصفح"""
+        # استدعاءات run_db داخل التطبيق لا ترسل تحديثات منفصلة لشريط التحميل
+        state.busy["batched"] += 1
+        try:
+            tasks = []
+            if changes.totals:
+                tasks.append(load_daily_stats())
+            if changes.pending_list or (changes.students and not changes.installments):
+                # أقساط جديدة أو اسم طالب تغير: إعادة تحميل الصفحة الحالية فقط
+                tasks.append(load_pending_installments())
+            elif changes.installments & state.pending_rows.keys():
+                installments = await run_db("get_installments_by_ids", changes.installments & state.pending_rows.keys())
+                patch_pending_rows(installments)
+            if changes.roster:
+                # التبويبات التي لم تُعرض بعد ستُحمَّل بأحدث البيانات عند أول فتح لها
+                if TAB_STUDENTS in state.loaded_tabs:
+                    tasks.append(filter_and_load_student_management_table(state.students_search["query"]))
+            elif changes.students:
+                students = await run_db("get_students_by_ids", changes.students)
+                patch_student_rows(students)
+            await asyncio.gather(*tasks)
+        except Exception as e:
+            print(f"❌ خطأ في تطبيق التغييرات: {e}")
+        finally:
+            state.busy["batched"] -= 1
+            page.update()
+
+    # اشتراك الجلسة في إشعارات الكتابة: الأحداث تُنقل لحلقة أحداث الصفحة وتُدمج إن تتابعت
+    feed = SessionFeed(system, page.run_task, apply_changes).start()
+
+    def on_disconnect(e):
+        feed.pause()
+
+    def on_connect(e):
+        feed.resume()
+
+    def on_close(e):
+        feed.close()
+        finance.forget(f"{state.session_id}:")
+        print(f"👋 انتهت الجلسة {state.session_id}")
+
+    page.on_disconnect = on_disconnect
+    page.on_connect = on_connect
+    page.on_close = on_close
 
     # --- دوال العمليات (Events Handlers) ---
     
-    def search_students_change(e):
-        filter_and_load_student_management_table(e.control.value)
+    async def search_students_change(e):
+        # مهلة قصيرة لتجميع ضغطات المفاتيح المتتالية، والضغطات الأقدم تُلغى
+        await filter_and_load_student_management_table(e.control.value, debounce=0.25)
+        page.update()
         
     def handle_print_student_report(e):
-        data_to_print = []
-        for row in student_management_table.rows:
-            data_to_print.append([cell.content.value for cell in row.cells[:-1]]) 
-            
-        msg = f"تم محاكاة طباعة تقرير ({len(data_to_print)} طالب). يجب تطوير وظيفة التصدير لـ PDF."
-        show_snackbar(msg, page)
+        """تصدير التقرير المختار مباشرة من قاعدة البيانات في خيط منفصل"""
+        import reports  # استيراد مؤجل: محرك التقارير (و fpdf2) لا يلزم إلا عند التصدير
+
+        report = dd_report.value
+        fmt = dd_report_format.value
+        # التقرير يُكتب مباشرة في مجلد التسليم ثم يُفتح في متصفح المستخدم (لا يُعرض مسار الخادم)
+        path = downloads.new_path(f"{report}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}")
+
+        def on_progress(count):
+            txt_export_progress.value = f"جاري التصدير... {count:,} صف"
+            page.update()
+
+        def on_done(success, msg):
+            btn_export.disabled = False
+            export_progress.visible = False
+            txt_export_progress.value = ""
+            if success:
+                page.launch_url(downloads.url(path))
+            show_snackbar(msg, page, error=not success)
+
+        btn_export.disabled = True
+        export_progress.visible = True
+        txt_export_progress.value = "جاري التصدير..."
+        page.update()
+        reports.start_export(system, report, fmt, path, progress=on_progress, done=on_done)
 
     # --- دوال نوافذ الإدخال المنبثقة ---
 
@@ -221,30 +508,62 @@ def main(page: ft.Page):
         dlg_amount.value = str(data['amount'])
         dlg_student_pay.value = data['name']
         dlg_payment.data = data['id'] 
+        # مفتاح جديد لكل فتح للنافذة: إعادة الضغط أو المحاولة بعد خطأ لا تسجل الدفعة مرتين
+        state.payment_request["key"] = uuid.uuid4().hex
+        btn_confirm_payment.disabled = False
         page.dialog = dlg_payment
         dlg_payment.open = True
         page.update()
         
-    def confirm_payment(e):
+    async def confirm_payment(e):
         try:
             inst_id = dlg_payment.data
             amt = float(dlg_amount.value)
             method = dlg_method.value
             s_name = dlg_student_pay.value
             
-            success, msg = system.pay_installment(inst_id, amt, method, s_name)
+            # تعطيل الزر أثناء التسجيل لمنع الضغط المزدوج
+            btn_confirm_payment.disabled = True
+            success, msg = await run_db("pay_installment", inst_id, amt, method, s_name,
+                                        idempotency_key=state.payment_request["key"])
             
-            dlg_payment.open = False
+            # الصفوف والبطاقات المتأثرة تُحدَّث عبر apply_changes
+            if success:
+                dlg_payment.open = False
+                page.run_task(print_receipt, state.payment_request["key"])
+            else:
+                # تبقى النافذة مفتوحة بنفس المفتاح لإعادة المحاولة بأمان
+                btn_confirm_payment.disabled = False
             show_snackbar(msg, page, error=not success)
-            refresh_dashboard()
             
         except ValueError:
+            btn_confirm_payment.disabled = False
             show_snackbar("الرجاء التأكد من المبلغ المدخل.", page, error=True)
             page.update()
             
+    async def print_receipt(key):
+        """رسم إيصال الدفعة بعد اعتمادها (الرسم لا يؤخر تسجيل الدفع)"""
+        try:
+            future = await asyncio.to_thread(printer.print_transaction, idempotency_key=key)
+            path, _ = await asyncio.wrap_future(future)
+            # الخدمة تعمل في المتصفح: يُفتح الإيصال على جهاز الكاشير بدلاً من عرض مساره على الخادم
+            page.launch_url(await asyncio.to_thread(downloads.publish, path))
+            show_snackbar("🧾 تم إصدار الإيصال.", page)
+        except Exception as ex:
+            show_snackbar(f"تعذرت طباعة الإيصال: {ex}", page, error=True)
+
+    async def reprint_today(e):
+        try:
+            future = await asyncio.to_thread(printer.reprint_day)
+            path, count = await asyncio.wrap_future(future)
+            page.launch_url(await asyncio.to_thread(downloads.publish, path))
+            show_snackbar(f"🧾 تم إصدار {count} إيصال.", page)
+        except Exception as ex:
+            show_snackbar(f"تعذرت إعادة الطباعة: {ex}", page, error=True)
+
     # --- B. نافذة إدارة الطلاب (إضافة / تعديل) ---
     
-    def open_student_form(e, action="add"):
+    async def open_student_form(e, action="add"):
         student_form_dlg.data = {"action": action, "id": None}
         # مسح الحقول عند الفتح
         dlg_std_name.value = ""
@@ -255,7 +574,7 @@ def main(page: ft.Page):
         
         if action == "edit":
             student_id = e.control.data
-            details = system.get_student_details(student_id)
+            details = await run_db("get_student_details", student_id)
             if details:
                 s_id, name, grade, academic_year, phone = details
                 dlg_std_name.value = name
@@ -269,7 +588,13 @@ def main(page: ft.Page):
         student_form_dlg.open = True
         page.update()
 
-    def save_student_data(e):
+    async def edit_student_click(e):
+        await open_student_form(e, action="edit")
+
+    async def add_student_click(e):
+        await open_student_form(e, action="add")
+
+    async def save_student_data(e):
         """يحفظ بيانات الطالب الجديد أو يعدلها"""
         action = student_form_dlg.data.get("action")
         s_id = student_form_dlg.data.get("id")
@@ -286,38 +611,44 @@ def main(page: ft.Page):
         
         try:
             if action == "add":
-                success, msg = system.add_new_student(name, grade, academic_year, phone)
+                success, msg = await run_db("add_new_student", name, grade, academic_year, phone)
             elif action == "edit" and s_id:
-                success, msg = system.update_student_data(s_id, name, grade, academic_year, phone)
+                success, msg = await run_db("update_student_data", s_id, name, grade, academic_year, phone)
             else:
                 success, msg = False, "خطأ غير معروف في العملية."
                 
             student_form_dlg.open = False
             
-            # إعادة تعيين البيانات للتحديث
-            global current_managed_students_data
-            current_managed_students_data = [] 
-            
+            # الجداول والقوائم المتأثرة تُحدَّث عبر apply_changes
             show_snackbar(msg, page, error=not success)
             
-            # تحديث جميع الجداول والقوائم
-            filter_and_load_student_management_table() 
-            load_students_dropdowns()
-            refresh_dashboard() 
-            page.update()
-            
         except Exception as ex:
             show_snackbar(f"خطأ في الحفظ: {str(ex)}", page, error=True)
         
     # --- C. دالة حفظ الخطة المالية ---
-    def add_plan_click(e):
+    def toggle_bulk_plan(e):
+        """التبديل بين خطة لطالب واحد وخطة جماعية"""
+        bulk = sw_bulk_plan.value
+        tf_plan_student.visible = not bulk
+        plan_suggestions.visible = False
+        tf_bulk_grade.visible = bulk
+        tf_bulk_year.visible = bulk
+        page.update()
+
+    sw_bulk_plan.on_change = toggle_bulk_plan
+
+    async def add_plan_click(e):
         """زر حفظ الخطة المالية"""
-        student_id = dd_students.value
+        bulk = sw_bulk_plan.value
+        student_id = state.plan_student["id"]
+        bulk_grade = (tf_bulk_grade.value or "").strip()
+        bulk_year = (tf_bulk_year.value or "").strip()
         total_fees_str = tf_total.value
         count_str = tf_count.value
         start_date = tf_start.value
 
-        if not student_id or not total_fees_str or not count_str or not start_date:
+        has_target = (bulk_grade or bulk_year) if bulk else student_id
+        if not has_target or not total_fees_str or not count_str or not start_date:
             show_snackbar("الرجاء ملء جميع بيانات الخطة.", page, error=True)
             return
 
@@ -325,21 +656,33 @@ def main(page: ft.Page):
             total_fees = float(total_fees_str)
             installments_count = int(count_str)
             
-            ok, msg = system.create_fee_plan(
-                int(student_id), 
-                total_fees, 
-                installments_count, 
-                start_date
-            )
+            if bulk:
+                ok, msg, results = await run_db(
+                    "create_fee_plans_bulk",
+                    total_fees, 
+                    installments_count, 
+                    start_date, 
+                    grade=bulk_grade or None, 
+                    academic_year=bulk_year or None
+                )
+                print(f"✅ خطة جماعية: {sum(1 for r in results if r[1])} من {len(results)} طالب")
+            else:
+                ok, msg = await run_db(
+                    "create_fee_plan",
+                    int(student_id), 
+                    total_fees, 
+                    installments_count, 
+                    start_date
+                )
             
             if ok: 
                 tf_total.value = ""
                 tf_count.value = "10"
                 tf_start.value = "2025-09-01"
-                dd_students.value = None
+                tf_plan_student.value = ""
+                state.plan_student.update(id=None, name="")
 
             show_snackbar(msg, page, error=not ok)
-            refresh_dashboard()
             
         except ValueError as ve:
             show_snackbar(f"خطأ في البيانات: {str(ve)}", page, error=True)
@@ -347,6 +690,136 @@ def main(page: ft.Page):
             show_snackbar(f"خطأ غير متوقع: {str(ex)}", page, error=True)
         page.update()
 
+    # --- D. لوحة التشخيص (Diagnostics) ---
+    methods_table = ft.DataTable(
+        columns=[
+            ft.DataColumn(ft.Text("الدالة")), 
+            ft.DataColumn(ft.Text("العدد"), numeric=True), 
+            ft.DataColumn(ft.Text("المتوسط ms"), numeric=True), 
+            ft.DataColumn(ft.Text("p95 ms"), numeric=True), 
+            ft.DataColumn(ft.Text("الأقصى ms"), numeric=True)
+        ], 
+        rows=[],
+        border=ft.border.all(1, ft.Colors.GREY_300)
+    )
+    slow_queries_table = ft.DataTable(
+        columns=[
+            ft.DataColumn(ft.Text("الوقت")), 
+            ft.DataColumn(ft.Text("ms"), numeric=True), 
+            ft.DataColumn(ft.Text("الدالة")), 
+            ft.DataColumn(ft.Text("الاستعلام")), 
+            ft.DataColumn(ft.Text("خطة التنفيذ"))
+        ], 
+        rows=[],
+        border=ft.border.all(1, ft.Colors.GREY_300)
+    )
+    txt_cache_stats = ft.Text("")
+
+    def refresh_diagnostics(e=None):
+        """عرض لقطة من المقاييس الحالية (من الذاكرة، بدون استعلامات)"""
+        snap = metrics.snapshot()
+        methods_table.rows = [
+            ft.DataRow(cells=[
+                ft.DataCell(ft.Text(name)),
+                ft.DataCell(ft.Text(str(m["count"]))),
+                ft.DataCell(ft.Text(f"{m['mean_ms']:.2f}")),
+                ft.DataCell(ft.Text(f"{m['p95_ms']:.2f}")),
+                ft.DataCell(ft.Text(f"{m['max_ms']:.2f}")),
+            ])
+            for name, m in sorted(snap["methods"].items(), key=lambda kv: -kv[1]["mean_ms"] * kv[1]["count"])
+        ]
+        slow_queries_table.rows = [
+            ft.DataRow(cells=[
+                ft.DataCell(ft.Text(q["at"])),
+                ft.DataCell(ft.Text(f"{q['ms']:.1f}")),
+                ft.DataCell(ft.Text(q["method"] or "-")),
+                ft.DataCell(ft.Text(q["sql"][:120], tooltip=q["sql"])),
+                ft.DataCell(ft.Text(" | ".join(q["plan"])[:120])),
+            ])
+            for q in reversed(snap["slow_queries"][-20:])
+        ]
+        c = system.cache_stats()
+        txt_cache_stats.value = f"الذاكرة المؤقتة: {c['hits']} إصابة / {c['misses']} إخفاق ({c['hit_ratio']:.0%})"
+        w = system.write_stats()
+        txt_cache_stats.value += (f"  |  طابور الكتابة: {w['jobs']} طلب في {w['batches']} دفعة"
+                                  f" (أكبر دفعة {w['largest_batch']}، إعادة محاولة {w['retries']})")
+        txt_cache_stats.value += f"  |  إشعارات الجلسة: {feed.received} حدث في {feed.applied} تحديث"
+        if startup_timings:
+            txt_cache_stats.value += "  |  زمن البدء: " + "، ".join(
+                f"{k} {v:.0f} ms" for k, v in startup_timings.items())
+        for warning in startup_warnings:
+            txt_cache_stats.value += f"  |  ⚠️ {warning}"
+        page.update()
+
+    def reset_diagnostics(e):
+        metrics.reset()
+        refresh_diagnostics()
+
+    # --- E. أعمار الديون (Receivables Aging) ---
+    aging_table = ft.DataTable(
+        columns=[
+            ft.DataColumn(ft.Text("الصف")), 
+            ft.DataColumn(ft.Text("العام الدراسي")), 
+            ft.DataColumn(ft.Text("طريقة الدفع")), 
+            ft.DataColumn(ft.Text("0-30 يوم"), numeric=True), 
+            ft.DataColumn(ft.Text("31-60 يوم"), numeric=True), 
+            ft.DataColumn(ft.Text("61-90 يوم"), numeric=True), 
+            ft.DataColumn(ft.Text("أكثر من 90"), numeric=True), 
+            ft.DataColumn(ft.Text("الإجمالي"), numeric=True), 
+            ft.DataColumn(ft.Text("الطلاب"), numeric=True)
+        ], 
+        rows=[],
+        border=ft.border.all(1, ft.Colors.GREY_300)
+    )
+    txt_aging_info = ft.Text("لم يتم حساب أعمار الديون بعد")
+    txt_aging_totals = ft.Text("", size=16, weight=ft.FontWeight.BOLD)
+
+    def show_aging(snapshot):
+        """عرض لقطة أعمار الديون في الجدول مع صف الإجماليات"""
+        if not snapshot:
+            return
+        as_of, taken_at, rows = snapshot
+        aging_table.rows = [
+            ft.DataRow(cells=[
+                ft.DataCell(ft.Text(grade)),
+                ft.DataCell(ft.Text(year or "-")),
+                ft.DataCell(ft.Text(method or "-")),
+                *[ft.DataCell(ft.Text(f"{v:,.2f}")) for v in buckets],
+                ft.DataCell(ft.Text(str(students))),
+            ])
+            for grade, year, method, *buckets, students in rows
+        ]
+        sums = [sum(r[i] for r in rows) for i in range(3, 8)]
+        txt_aging_totals.value = "  |  ".join(
+            f"{label}: {v:,.2f}" for label, v in zip(["0-30", "31-60", "61-90", "+90", "الإجمالي"], sums)
+        )
+        txt_aging_info.value = f"أعمار الديون حتى {as_of} (آخر حساب: {taken_at})"
+        if as_of != datetime.now().strftime("%Y-%m-%d"):
+            txt_aging_info.value += " - لقطة قديمة، اضغط إعادة الحساب لتحديثها"
+
+    async def load_aging():
+        """عرض اللقطة المحفوظة فقط (تحديثها يتم مرة واحدة للخدمة كلها، لا لكل جلسة)"""
+        try:
+            show_aging(await run_db("get_aging_snapshot", key="aging"))
+        except Superseded:
+            pass
+        except Exception as e:
+            print(f"❌ خطأ في تحميل أعمار الديون: {e}")
+
+    async def refresh_aging(e=None):
+        ok, msg = await run_db("refresh_aging_snapshot", key="aging-refresh")
+        if ok:
+            show_aging(await run_db("get_aging_snapshot", key="aging"))
+        else:
+            show_snackbar(msg, page, error=True)
+        page.update()
+
+    btn_export = ft.ElevatedButton(
+        "تصدير التقرير", 
+        on_click=handle_print_student_report, 
+        icon=ft.Icons.PRINT
+    )
+
     # --- تعريف نوافذ الإدخال (Dialogs Definition) ---
     
     # نافذة الدفع
@@ -362,12 +835,14 @@ def main(page: ft.Page):
         value="Cash"
     )
     
+    btn_confirm_payment = ft.ElevatedButton("تأكيد وطباعة", on_click=confirm_payment, bgcolor=ft.Colors.GREEN, color=ft.Colors.WHITE)
+    
     dlg_payment = ft.AlertDialog(
         title=ft.Text("تسديد قسط وإصدار سند"),
         content=ft.Column([dlg_student_pay, dlg_amount, dlg_method], height=200, tight=True),
         actions=[
             ft.TextButton("إلغاء", on_click=close_dialog),
-            ft.ElevatedButton("تأكيد وطباعة", on_click=confirm_payment, bgcolor=ft.Colors.GREEN, color=ft.Colors.WHITE),
+            btn_confirm_payment,
         ],
     )
 
@@ -423,13 +898,25 @@ def main(page: ft.Page):
                         ft.Row([card_revenue, card_overdue]), 
                         ft.Divider(height=20),
                         ft.Text("الأقساط المستحقة", size=18, weight=ft.FontWeight.BOLD),
+                        ft.Row([
+                            tf_pending_grade, 
+                            tf_pending_year, 
+                            cb_pending_overdue,
+                            btn_pending_prev,
+                            txt_pending_page,
+                            btn_pending_next
+                        ]),
                         ft.Container(
                             content=pending_table, 
                             height=300,
                             border=ft.border.all(1, ft.Colors.GREY_300)
                         ),
                         ft.Divider(height=20),
-                        ft.Text("سجل الحركات اليومية", size=18, weight=ft.FontWeight.BOLD),
+                        ft.Row([
+                            ft.Text("سجل الحركات اليومية", size=18, weight=ft.FontWeight.BOLD),
+                            ft.TextButton("إعادة طباعة إيصالات اليوم", icon=ft.Icons.PRINT,
+                                          on_click=reprint_today),
+                        ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
                         ft.Container(
                             content=daily_table, 
                             height=200,
@@ -448,7 +935,10 @@ def main(page: ft.Page):
                     content=ft.Column([
                         ft.Text("إنشاء خطة تقسيط جديدة", size=24, weight=ft.FontWeight.BOLD),
                         ft.Divider(),
-                        dd_students,
+                        sw_bulk_plan,
+                        tf_plan_student,
+                        plan_suggestions,
+                        ft.Row([tf_bulk_grade, tf_bulk_year]),
                         ft.Row([tf_total, tf_count]),
                         tf_start,
                         ft.ElevatedButton(
@@ -473,14 +963,14 @@ def main(page: ft.Page):
                                 on_change=search_students_change, 
                                 prefix_icon=ft.Icons.SEARCH
                             ),
-                            ft.ElevatedButton(
-                                "طباعة التقرير", 
-                                on_click=handle_print_student_report, 
-                                icon=ft.Icons.PRINT
-                            ),
+                            dd_report,
+                            dd_report_format,
+                            btn_export,
+                            export_progress,
+                            txt_export_progress,
                             ft.ElevatedButton(
                                 "إضافة طالب جديد", 
-                                on_click=lambda e: open_student_form(e, action="add"), 
+                                on_click=add_student_click, 
                                 icon=ft.Icons.PERSON_ADD
                             )
                         ]),
@@ -489,22 +979,129 @@ def main(page: ft.Page):
                             content=student_management_table, 
                             height=500,
                             border=ft.border.all(1, ft.Colors.GREY_300)
-                        )
+                        ),
+                        btn_students_more
                     ])
                 )
             ),
+            ft.Tab(
+                text="أعمار الديون",
+                icon=ft.Icons.TIMELAPSE,
+                content=ft.Container(
+                    padding=20,
+                    content=ft.Column([
+                        ft.Row([
+                            ft.ElevatedButton("إعادة الحساب", on_click=refresh_aging, icon=ft.Icons.REFRESH),
+                            txt_aging_info
+                        ]),
+                        txt_aging_totals,
+                        ft.Divider(),
+                        aging_table
+                    ], scroll=ft.ScrollMode.ADAPTIVE)
+                )
+            ),
+            ft.Tab(
+                text="التشخيص",
+                icon=ft.Icons.MONITOR_HEART,
+                content=ft.Container(
+                    padding=20,
+                    content=ft.Column([
+                        ft.Row([
+                            ft.ElevatedButton("تحديث المقاييس", on_click=refresh_diagnostics, icon=ft.Icons.REFRESH),
+                            ft.TextButton("تصفير", on_click=reset_diagnostics, icon=ft.Icons.RESTART_ALT),
+                            txt_cache_stats
+                        ]),
+                        ft.Text("زمن الدوال", size=18, weight=ft.FontWeight.BOLD),
+                        methods_table,
+                        ft.Text(f"الاستعلامات البطيئة (أكثر من {SLOW_QUERY_MS} ms)", size=18, weight=ft.FontWeight.BOLD),
+                        slow_queries_table
+                    ], scroll=ft.ScrollMode.ADAPTIVE)
+                )
+            ),
         ],
         expand=True,
     )
 
-    page.add(tabs)
+    # --- تحميل التبويبات عند أول عرض (Lazy tabs) ---
+
+    async def load_tab(index):
+        """تحميل بيانات التبويب عند أول فتح له فقط (التشخيص يُحدَّث في كل مرة)"""
+        if index == TAB_DIAGNOSTICS:
+            refresh_diagnostics()
+            return
+        if index in state.loaded_tabs:
+            return
+        state.loaded_tabs.add(index)
+        if index == TAB_DASHBOARD:
+            await refresh_dashboard()
+        elif index == TAB_STUDENTS:
+            await filter_and_load_student_management_table()
+        elif index == TAB_AGING:
+            await load_aging()
+        page.update()
+
+    async def tab_changed(e):
+        await load_tab(tabs.selected_index)
+
+    tabs.on_change = tab_changed
+    page.add(loading_bar, tabs)
+    first_paint_ms = (time.perf_counter() - session_started) * 1000
     
-    # تهيئة وتحميل البيانات الأولية
-    print("🔄 جاري تحميل البيانات الأولية...")
-    refresh_dashboard()
-    filter_and_load_student_management_table()
-    print("✅ التطبيق جاهز للاستخدام!")
+    # الواجهة تظهر فوراً، ثم تُحمَّل بيانات التبويب الظاهر فقط في الخلفية
+    async def initial_load():
+        print("🔄 جاري تحميل البيانات الأولية...")
+        await load_tab(tabs.selected_index)
+        report_startup("الجلسة", first_paint_ms=first_paint_ms,
+                       first_data_ms=(time.perf_counter() - session_started) * 1000)
+        print("✅ التطبيق جاهز للاستخدام!")
+
+    page.run_task(initial_load)
+
+
+def keep_aging_fresh(stop):
+    """
+    مهمة واحدة للعملية: تعيد حساب لقطة أعمار الديون عند تغير اليوم فقط
+    (الأمر الليلي في cli.py يحدّثها عادة قبل بدء الدوام فلا يبقى هنا ما يُحسب).
+    """
+    while not stop.is_set():
+        try:
+            snapshot = system.get_aging_snapshot()
+            if not snapshot or snapshot[0] != datetime.now().strftime("%Y-%m-%d"):
+                ok, msg = system.refresh_aging_snapshot()
+                print(("📊 " if ok else "❌ ") + msg)
+        except Exception as e:
+            print(f"❌ خطأ في تحديث أعمار الديون: {e}")
+        stop.wait(AGING_CHECK_SECONDS)
+
+
+def prepare():
+    """تجهيز الخدمة قبل تشغيل Flet: فحص سريع للمخطط (والترحيل فقط عند الحاجة)"""
+    started = time.perf_counter()
+    applied = ensure_schema(system.db_path)
+    for version, description in applied:
+        print(f"  ↳ ترحيل {version}: {description}")
+    report_startup("تشغيل الخدمة", imports_ms=startup_timings["imports_ms"],
+                   schema_ms=(time.perf_counter() - started) * 1000,
+                   total_ms=(time.perf_counter() - STARTED_AT) * 1000)
+    downloads.cleanup()
+    try:
+        from reports import check_arabic_pdf
+
+        # فحص تشكيل الحروف العربية مرة واحدة هنا، فالمشكلة تظهر في التشخيص قبل أول إيصال
+        check_arabic_pdf()
+        printer.warm_up()
+    except Exception as e:
+        startup_warnings.append(f"طباعة PDF غير متاحة: {e}")
+        print(f"⚠️ طباعة الإيصالات غير متاحة: {e}")
+    aging_stop = threading.Event()
+    threading.Thread(target=keep_aging_fresh, args=(aging_stop,), name="aging-refresh", daemon=True).start()
+    return aging_stop
 
 # تشغيل التطبيق
 if __name__ == "__main__":
-    ft.app(target=main, view=ft.WEB_BROWSER)
\ No newline at end of file
+    aging_stop = prepare()
+    try:
+        ft.app(target=main, view=ft.WEB_BROWSER, assets_dir=ASSETS_DIR)
+    finally:
+        aging_stop.set()
+        printer.shutdown()
\ No newline at end of file
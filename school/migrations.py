@@ -0,0 +1,226 @@
+from dates import normalize_date, normalize_datetime
+from schema import (AGING_TABLES, LEDGER_PAYMENT_METHOD, LEDGER_TABLES, LEDGER_TRIGGERS, RECEIPT_TABLES,
+                    REMINDER_TABLES, ROLLUP_TABLES, ROLLUP_TRIGGERS, backfill_receipts, rebuild_balances,
+                    rebuild_last_payment_methods, rebuild_rollups)
+
+# --- سجل ترحيلات المخطط (Schema Migrations) ---
+# كل ترحيل له رقم إصدار ووصف وقائمة خطوات (جمل SQL أو دوال تستقبل الاتصال).
+# يُخزَّن آخر إصدار مطبق في PRAGMA user_version، والخطوات مكتوبة بحيث يمكن إعادة تشغيلها بأمان
+# (IF NOT EXISTS للجداول والفهارس، و_add_column لإضافة الأعمدة بعد فحص PRAGMA table_info).
+
+def _add_column(table, column, decl):
+    """خطوة ترحيل تضيف عموداً فقط إن لم يكن موجوداً (ALTER TABLE ADD COLUMN يفشل عند تكراره)"""
+    def step(conn):
+        if column not in {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+    return step
+
+
+def _base_tables():
+    return [
+        # 1. جدول الطلاب (students)
+        """
+        CREATE TABLE IF NOT EXISTS students (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            grade TEXT NOT NULL,
+            academic_year TEXT,     -- حقل العام الدراسي
+            parent_phone TEXT,
+            created_at TEXT,
+            status TEXT DEFAULT 'active'
+        )
+        """,
+        # 2. جدول حركات الخزينة (transactions)
+        """
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            student_id INTEGER,
+            date TEXT,
+            amount REAL NOT NULL,
+            type TEXT,              -- 'payment' أو 'expense'
+            description TEXT,
+            payment_method TEXT,
+            FOREIGN KEY (student_id) REFERENCES students (id)
+        )
+        """,
+        # 3. جدول الأقساط (installments)
+        """
+        CREATE TABLE IF NOT EXISTS installments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            student_id INTEGER NOT NULL,
+            sequence INTEGER,       -- حقل رقم القسط
+            amount REAL NOT NULL,
+            paid_amount REAL DEFAULT 0.0,
+            due_date TEXT NOT NULL,
+            paid_date TEXT,
+            status TEXT DEFAULT 'pending', -- 'pending', 'paid'
+            FOREIGN KEY (student_id) REFERENCES students (id)
+        )
+        """,
+    ]
+
+
+def _hot_query_indexes():
+    return [
+        # الأقساط المعلقة مرتبة بتاريخ الاستحقاق + عدّاد المتأخرات
+        "CREATE INDEX IF NOT EXISTS idx_installments_status_due ON installments(status, due_date, student_id)",
+        # أقساط طالب معين
+        "CREATE INDEX IF NOT EXISTS idx_installments_student ON installments(student_id, sequence)",
+        # إيراد اليوم: الفهرس يغطي الاستعلام بالكامل (date, type, amount)
+        "CREATE INDEX IF NOT EXISTS idx_transactions_date_type ON transactions(date, type, amount)",
+        # حركات طالب معين
+        "CREATE INDEX IF NOT EXISTS idx_transactions_student ON transactions(student_id)",
+        # القوائم المرتبة بالاسم
+        "CREATE INDEX IF NOT EXISTS idx_students_name ON students(name)",
+    ]
+
+
+# عدد الصفوف المقروءة في كل دفعة أثناء توحيد التواريخ (الذاكرة لا تكبر مع حجم القاعدة)
+NORMALIZE_BATCH = 1000
+
+
+def _normalize_column(table, column, normalizer, batch_size=NORMALIZE_BATCH):
+    """خطوة ترحيل: تحويل القيم غير الموحدة في عمود تاريخ إلى الصيغة القياسية (على دفعات بترتيب id)"""
+    def step(conn):
+        last_id = 0
+        while True:
+            rows = conn.execute(f"""
+                SELECT id, {column} FROM {table}
+                WHERE id > ? AND {column} IS NOT NULL AND {column} != ''
+                ORDER BY id LIMIT ?
+            """, (last_id, batch_size)).fetchall()
+            if not rows:
+                return
+            updates = []
+            for row_id, value in rows:
+                normalized = normalizer(value)
+                if normalized and normalized != value:
+                    updates.append((normalized, row_id))
+            if updates:
+                conn.executemany(f"UPDATE {table} SET {column} = ? WHERE id = ?", updates)
+            last_id = rows[-1][0]
+    return step
+
+
+def _sortable_dates():
+    return [
+        _normalize_column("transactions", "date", normalize_datetime),
+        _normalize_column("installments", "due_date", normalize_date),
+        _normalize_column("installments", "paid_date", normalize_datetime),
+        _normalize_column("students", "created_at", normalize_date),
+    ]
+
+
+def _keyset_pagination_indexes():
+    return [
+        # (status, due_date, id) يطابق ترتيب ترقيم الصفحات تماماً فلا يحتاج SQLite لفرز مؤقت
+        "DROP INDEX IF EXISTS idx_installments_status_due",
+        "CREATE INDEX IF NOT EXISTS idx_installments_status_due_id ON installments(status, due_date, id, student_id)",
+    ]
+
+
+def _student_search_index():
+    # فهرس بحث نصي (FTS5 بمقسّم trigram) يطابق أي جزء من الاسم أو الهاتف دون مسح الجدول
+    # الجدول "خارجي المحتوى" (content=students) فلا تتكرر البيانات، والـ Triggers تبقيه متزامناً
+    fts_columns = "name, parent_phone, grade, academic_year"
+    return [
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS students_fts USING fts5(
+            {fts_columns}, content='students', content_rowid='id', tokenize='trigram'
+        )
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_students_fts_ins AFTER INSERT ON students BEGIN
+            INSERT INTO students_fts (rowid, {fts_columns})
+            VALUES (NEW.id, NEW.name, NEW.parent_phone, NEW.grade, NEW.academic_year);
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_students_fts_del AFTER DELETE ON students BEGIN
+            INSERT INTO students_fts (students_fts, rowid, {fts_columns})
+            VALUES ('delete', OLD.id, OLD.name, OLD.parent_phone, OLD.grade, OLD.academic_year);
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_students_fts_upd AFTER UPDATE OF {fts_columns} ON students BEGIN
+            INSERT INTO students_fts (students_fts, rowid, {fts_columns})
+            VALUES ('delete', OLD.id, OLD.name, OLD.parent_phone, OLD.grade, OLD.academic_year);
+            INSERT INTO students_fts (rowid, {fts_columns})
+            VALUES (NEW.id, NEW.name, NEW.parent_phone, NEW.grade, NEW.academic_year);
+        END
+        """,
+        "INSERT INTO students_fts (students_fts) VALUES ('rebuild')",
+    ]
+
+
+def _payment_idempotency():
+    # مفتاح يولده العميل لكل طلب دفع: إعادة الإرسال بنفس المفتاح لا تسجل حركة ثانية
+    return [
+        _add_column("transactions", "idempotency_key", "TEXT"),
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_idempotency
+        ON transactions(idempotency_key) WHERE idempotency_key IS NOT NULL
+        """,
+    ]
+
+
+MIGRATIONS = [
+    (1, "الجداول الأساسية", _base_tables()),
+    (2, "فهارس الاستعلامات الساخنة", _hot_query_indexes()),
+    (3, "توحيد صيغ التواريخ (ISO قابلة للترتيب)", _sortable_dates()),
+    (4, "جداول تجميع الإيراد اليومي والأقساط المعلقة", ROLLUP_TABLES + ROLLUP_TRIGGERS + [rebuild_rollups]),
+    (5, "فهرس ترقيم صفحات الأقساط المعلقة", _keyset_pagination_indexes()),
+    (6, "فهرس البحث النصي عن الطلاب (FTS5)", _student_search_index()),
+    (7, "دفتر أرصدة الطلاب", LEDGER_TABLES + LEDGER_TRIGGERS + [rebuild_balances]),
+    (8, "أعمار الديون وآخر طريقة دفع لكل طالب",
+     [_add_column("student_balances", "last_payment_method", "TEXT")]
+     + LEDGER_PAYMENT_METHOD + [rebuild_last_payment_methods] + AGING_TABLES),
+    (9, "مفتاح منع تكرار الدفعات (Idempotency Key)", _payment_idempotency()),
+    (10, "ترقيم إيصالات الدفع", RECEIPT_TABLES + [backfill_receipts]),
+    (11, "صندوق تذكيرات أولياء الأمور بالأقساط المتأخرة", REMINDER_TABLES),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn):
+    """قراءة إصدار المخطط الحالي من PRAGMA user_version"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def analyze(conn):
+    """تحديث إحصائيات المخطِّط (Query Planner) بعد التغييرات الكبيرة"""
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA optimize")
+
+
+def migrate(conn, target_version=None):
+    """يطبق الترحيلات الناقصة بالترتيب، كل ترحيل في معاملة مستقلة، ويعيد قائمة الإصدارات المطبقة"""
+    target = LATEST_VERSION if target_version is None else target_version
+    current = get_schema_version(conn)
+    applied = []
+
+    if current == 0:
+        # قاعدة جديدة: تفعيل التفريغ التدريجي قبل إنشاء أي جدول (لاسترجاع المساحة بعد الأرشفة دون VACUUM كامل)
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
+    for version, description, steps in MIGRATIONS:
+        if version <= current or version > target:
+            continue
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        applied.append((version, description))
+
+    if applied:
+        analyze(conn)
+    return applied
@@ -0,0 +1,176 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from dates import day_range
+
+# --- إيصالات الدفع (Receipts) ---
+# - رقم الإيصال يُحجز تلقائياً (Trigger) داخل نفس معاملة الدفع، فالترقيم متسلسل ولا يتكرر.
+# - الرسم (PDF) يتم في مجموعة عمليات منفصلة (ProcessPoolExecutor) بعد اعتماد الدفعة،
+#   فزمن الدفع لا يتأثر بزمن الرسم ولا بقفل GIL.
+# - كل عملية تحمّل fpdf2 والخط مرة واحدة عند بدئها (initializer) وتحتفظ بقالب الإيصال جاهزاً.
+# - إعادة الطباعة الجماعية (يوم أو طالب) تُرسم في مستند واحد في تمرير واحد.
+# - إذا توقفت إحدى عمليات الرسم (BrokenProcessPool) تُنشأ المجموعة من جديد عند الطلب التالي.
+
+RECEIPTS_DIR = "receipts"
+RECEIPT_PAGE_FORMAT = "A5"
+
+# جدول receipts وTrigger حجز الرقم ودالة ترقيم الدفعات القديمة معرفة في schema.py
+
+# قالب الإيصال: (عنوان الحقل، مفتاح القيمة)، يُرسم صفاً صفاً من اليمين لليسار
+RECEIPT_TITLE = "إيصال استلام نقدية"
+RECEIPT_FIELDS = [
+    ("رقم الإيصال", "number"),
+    ("التاريخ", "issued_at"),
+    ("اسم الطالب", "name"),
+    ("الصف الدراسي", "grade"),
+    ("العام الدراسي", "academic_year"),
+    ("المبلغ", "amount"),
+    ("طريقة الدفع", "method"),
+    ("البيان", "description"),
+]
+
+_RECEIPT_QUERY = """
+    SELECT r.number, r.issued_at, t.id, t.amount, IFNULL(t.payment_method, ''), IFNULL(t.description, ''),
+           IFNULL(s.name, '-'), IFNULL(s.grade, ''), IFNULL(s.academic_year, '')
+    FROM receipts r
+    JOIN transactions t ON t.id = r.transaction_id
+    LEFT JOIN students s ON s.id = t.student_id
+"""
+
+
+# --- 1. الرسم داخل عمليات مجموعة الطباعة ---
+
+# حالة كل عملية رسم: مسار الخط والقالب المجهز (تُملأ مرة واحدة في initializer)
+_worker = {}
+
+
+def _init_worker(font_path):
+    """تجهيز عملية الرسم: تحميل fpdf2 والخط مرة واحدة وتسخينهما بإيصال تجريبي"""
+    from reports import new_arabic_pdf
+
+    _worker["new_pdf"] = lambda: new_arabic_pdf(font_path, orientation="P", page_format=RECEIPT_PAGE_FORMAT)
+    # أبعاد القالب تُحسب مرة واحدة لكل عملية
+    pdf = _worker["new_pdf"]()
+    width = pdf.w - pdf.l_margin - pdf.r_margin
+    _worker["layout"] = {"label_w": width * 0.35, "value_w": width * 0.65, "row_h": 9}
+    _draw_receipt(pdf, {key: "-" for _, key in RECEIPT_FIELDS})
+    pdf.output()
+
+
+def _draw_receipt(pdf, receipt):
+    layout = _worker["layout"]
+    pdf.add_page()
+    pdf.set_font("arabic", size=16)
+    pdf.cell(0, 12, RECEIPT_TITLE, align="C", new_x="LMARGIN", new_y="NEXT")
+    pdf.ln(4)
+    pdf.set_font("arabic", size=11)
+    for label, key in RECEIPT_FIELDS:
+        # العمود الأيسر للقيمة والأيمن للعنوان
+        pdf.cell(layout["value_w"], layout["row_h"], str(receipt[key]), border=1, align="C")
+        pdf.cell(layout["label_w"], layout["row_h"], label, border=1, align="C", fill=False,
+                 new_x="LMARGIN", new_y="NEXT")
+    pdf.ln(10)
+    pdf.set_font("arabic", size=10)
+    pdf.cell(0, 8, "توقيع أمين الخزينة: ....................", align="R")
+
+
+def _render(receipts, path):
+    """رسم قائمة إيصالات في ملف PDF واحد (صفحة لكل إيصال)"""
+    pdf = _worker["new_pdf"]()
+    for receipt in receipts:
+        _draw_receipt(pdf, receipt)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    pdf.output(path)
+    return path, len(receipts)
+
+
+def _ready():
+    return os.getpid()
+
+
+# --- 2. واجهة الطباعة في العملية الرئيسية ---
+
+class ReceiptPrinter:
+    """يجهز بيانات الإيصالات من قاعدة البيانات ويرسلها للرسم في مجموعة عمليات منفصلة"""
+
+    def __init__(self, system, output_dir=RECEIPTS_DIR, workers=2, font_path=None):
+        self.system = system
+        self.output_dir = output_dir
+        self.workers = workers
+        self.font_path = font_path
+        self._pool = None
+
+    def _executor(self):
+        if self._pool is None:
+            from reports import find_arabic_font
+
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self.font_path or find_arabic_font(),),
+            )
+        return self._pool
+
+    def warm_up(self):
+        """تشغيل عمليات الرسم مسبقاً (تحميل الخط) حتى لا ينتظر أول إيصال، ويعيد Futures"""
+        pool = self._executor()
+        return [pool.submit(_ready) for _ in range(self.workers)]
+
+    def fetch(self, where, params):
+        """بيانات الإيصالات المطابقة للشرط كقواميس جاهزة للإرسال لعمليات الرسم"""
+        with self.system.db.read() as conn:
+            rows = conn.execute(f"{_RECEIPT_QUERY} WHERE {where} ORDER BY r.number", params).fetchall()
+        return [
+            {
+                "number": number, "issued_at": issued_at, "transaction_id": tx_id,
+                "amount": f"{amount:,.2f}", "method": method, "description": description,
+                "name": name, "grade": grade, "academic_year": academic_year,
+            }
+            for number, issued_at, tx_id, amount, method, description, name, grade, academic_year in rows
+        ]
+
+    def receipt_path(self, receipt):
+        return os.path.join(self.output_dir, receipt["issued_at"][:10] or "undated",
+                            f"receipt_{receipt['number']:06d}.pdf")
+
+    def _submit(self, receipts, path):
+        try:
+            return self._executor().submit(_render, receipts, path)
+        except BrokenProcessPool:
+            # مجموعة معطلة (توقفت عملية رسم): تُستبدل بمجموعة جديدة وتُعاد المحاولة مرة واحدة
+            self.shutdown()
+            return self._executor().submit(_render, receipts, path)
+
+    def print_transaction(self, transaction_id=None, idempotency_key=None):
+        """
+        إيصال دفعة واحدة (برقم الحركة أو بمفتاح طلب الدفع)، ويعيد Future بـ (المسار، عدد الإيصالات).
+        يُستدعى بعد نجاح الدفع، فالرسم لا يدخل في زمن تسجيل الدفعة.
+        """
+        if idempotency_key:
+            receipts = self.fetch("t.idempotency_key = ?", (idempotency_key,))
+        else:
+            receipts = self.fetch("t.id = ?", (transaction_id,))
+        if not receipts:
+            raise LookupError("لا يوجد إيصال لهذه الدفعة.")
+        return self._submit(receipts, self.receipt_path(receipts[0]))
+
+    def reprint_day(self, day=None):
+        """إعادة طباعة كل إيصالات يوم في مستند واحد"""
+        start, end = day_range(day)
+        receipts = self.fetch("t.date >= ? AND t.date < ?", (start, end))
+        if not receipts:
+            raise LookupError(f"لا توجد إيصالات بتاريخ {start}.")
+        return self._submit(receipts, os.path.join(self.output_dir, "batch", f"day_{start}.pdf"))
+
+    def reprint_student(self, student_id):
+        """إعادة طباعة كل إيصالات طالب في مستند واحد"""
+        receipts = self.fetch("t.student_id = ?", (student_id,))
+        if not receipts:
+            raise LookupError(f"لا توجد إيصالات للطالب رقم {student_id}.")
+        return self._submit(receipts, os.path.join(self.output_dir, "batch", f"student_{student_id}.pdf"))
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,284 @@
+import abc
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+from dates import DATETIME_FMT, now_str, today_str
+
+# --- تذكيرات أولياء الأمور بالأقساط المتأخرة (Outbox) ---
+# 1. الإدراج: تمرير قراءة واحد على فهرس (status, due_date) يجمع الأقساط المتأخرة لكل ولي أمر،
+#    ثم تُكتب الرسائل في جدول reminder_outbox على دفعات صغيرة عبر طابور الكاتب
+#    (معاملات قصيرة تتخلل دفعات الخزينة ولا تحجز الكاتب لفترة طويلة).
+# 2. الإرسال: موزع محدود المعدل يقرأ الرسائل المستحقة على دفعات ويرسلها عبر ناقل قابل للاستبدال
+#    (ملف محلي أو ناقل وهمي للاختبار)، مع إعادة المحاولة بمهلة متزايدة داخل نفس الليلة.
+# - رسائل الأيام السابقة التي لم تُرسل تُعلَّم expired عند إدراج رسائل اليوم (مبالغها قديمة،
+#   ورسالة اليوم تشمل نفس الأقساط بمبالغ محدثة).
+# - منع التكرار: القسط لا يُذكَّر به أكثر من مرة في نفس اليوم (reminder_items).
+# - التشغيل الليلي فقط (QUIET_HOURS) حتى لا يزاحم حركة الخزينة أثناء النهار.
+# - الإرسال "مرة على الأقل": انقطاع بين الإرسال وتسجيل نتيجته قد يعيد إرسال رسالة واحدة.
+
+REMINDERS_DIR = "reminders"
+QUIET_HOURS = (20, 7)      # من الثامنة مساءً حتى السابعة صباحاً
+ENQUEUE_BATCH = 200        # عدد أولياء الأمور في كل معاملة إدراج
+DISPATCH_BATCH = 50        # عدد الرسائل في كل دفعة إرسال
+RATE_PER_SEC = 20.0        # أقصى عدد رسائل في الثانية
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF_S = 60.0     # المهلة قبل المحاولة الثانية (تتضاعف بعد كل فشل)
+
+# جدولا reminder_outbox و reminder_items معرفان في schema.py
+
+
+def in_quiet_hours(now=None, window=QUIET_HOURS):
+    """هل الوقت الحالي داخل نافذة التشغيل الليلي؟ (النافذة قد تعبر منتصف الليل)"""
+    hour = (now or datetime.now()).hour
+    start, end = window
+    return start <= hour < end if start < end else hour >= start or hour < end
+
+
+# --- 1. تجهيز الرسائل وإدراجها ---
+
+_OVERDUE_QUERY = """
+    SELECT s.parent_phone, s.id, s.name, i.id, i.sequence, i.amount - IFNULL(i.paid_amount, 0), i.due_date
+    FROM installments i
+    JOIN students s ON s.id = i.student_id
+    WHERE i.status = 'pending' AND i.due_date < ?
+      AND s.parent_phone IS NOT NULL AND s.parent_phone != ''
+      AND NOT EXISTS (SELECT 1 FROM reminder_items r WHERE r.installment_id = i.id AND r.remind_day = ?)
+"""
+
+
+def collect_overdue(system, day=None):
+    """الأقساط المتأخرة غير المذكَّر بها اليوم مجمعة لكل ولي أمر: {الهاتف: [(طالب، اسم، قسط، رقم، متبقي، استحقاق)]}"""
+    day = day or today_str()
+    by_parent = {}
+    with system.db.read() as conn:
+        for phone, *item in conn.execute(_OVERDUE_QUERY, (day, day)):
+            by_parent.setdefault(phone.strip(), []).append(tuple(item))
+    return by_parent
+
+
+def render_message(items):
+    """نص رسالة ولي الأمر: الأقساط المتأخرة لكل أبنائه والإجمالي"""
+    lines = ["ولي الأمر الكريم، نود تذكيركم بالأقساط المتأخرة التالية:"]
+    for _, name, _, sequence, remaining, due_date in sorted(items, key=lambda x: (x[1], x[5])):
+        lines.append(f"- {name}: القسط رقم {sequence} بمبلغ {remaining:,.2f} (استحقاق {due_date})")
+    lines.append(f"الإجمالي المستحق: {sum(item[4] for item in items):,.2f}")
+    lines.append("يرجى السداد لدى خزينة المدرسة. شكراً لكم.")
+    return "\n".join(lines)
+
+
+def _enqueue_tx(conn, messages, day, created_at):
+    """إدراج دفعة رسائل مع أقساطها، وتجاهل الأقساط التي سبق إدراجها اليوم"""
+    queued = 0
+    for phone, message, installment_ids in messages:
+        outbox_id = conn.execute("""
+            INSERT INTO reminder_outbox (parent_phone, remind_day, message, next_attempt_at, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, (phone, day, message, created_at, created_at)).lastrowid
+        inserted = conn.executemany(
+            "INSERT OR IGNORE INTO reminder_items (installment_id, remind_day, outbox_id) VALUES (?, ?, ?)",
+            [(installment_id, day, outbox_id) for installment_id in installment_ids],
+        ).rowcount
+        if inserted:
+            queued += 1
+        else:
+            # تشغيل متزامن آخر سبق بإدراج نفس الأقساط
+            conn.execute("DELETE FROM reminder_outbox WHERE id = ?", (outbox_id,))
+    return queued, None
+
+
+def _expire_tx(conn, day):
+    """إلغاء رسائل الأيام السابقة التي لم تُرسل بعد (تحل محلها رسائل اليوم)"""
+    return conn.execute("""
+        UPDATE reminder_outbox SET status = 'expired', last_error = 'حلت محلها رسالة أحدث'
+        WHERE status = 'queued' AND remind_day < ?
+    """, (day,)).rowcount, None
+
+
+def enqueue_reminders(system, day=None, batch_size=ENQUEUE_BATCH, progress=None):
+    """تجهيز رسائل اليوم لكل أولياء الأمور ذوي الأقساط المتأخرة، ويعيد (عدد الرسائل، عدد الأقساط)"""
+    day = day or today_str()
+    expired = system.writes.submit(_expire_tx, day).result()[0]
+    if expired and progress:
+        progress(f"  أُلغيت {expired:,} رسالة متبقية من أيام سابقة.")
+    by_parent = collect_overdue(system, day)
+    messages = [(phone, render_message(items), [item[2] for item in items]) for phone, items in by_parent.items()]
+
+    created_at = now_str()
+    queued = 0
+    for start in range(0, len(messages), batch_size):
+        queued += system.writes.submit(_enqueue_tx, messages[start:start + batch_size], day, created_at).result()[0]
+        if progress:
+            progress(f"  الرسائل: {min(start + batch_size, len(messages)):,}/{len(messages):,}")
+    return queued, sum(len(items) for items in by_parent.values())
+
+
+# --- 2. نواقل الإرسال ---
+
+class Transport(abc.ABC):
+    """واجهة الناقل: send يرسل رسالة واحدة ويرفع استثناء عند الفشل"""
+
+    @abc.abstractmethod
+    def send(self, phone, message):
+        ...
+
+    def send_batch(self, messages):
+        """إرسال دفعة [(المعرف، الهاتف، النص)] ويعيد {المعرف: نص الخطأ أو None}"""
+        results = {}
+        for outbox_id, phone, message in messages:
+            try:
+                self.send(phone, message)
+                results[outbox_id] = None
+            except Exception as e:
+                results[outbox_id] = str(e) or type(e).__name__
+        return results
+
+    def close(self):
+        pass
+
+
+class FileTransport(Transport):
+    """يكتب الرسائل في ملف JSON Lines محلي (بدلاً من بوابة الرسائل) لكل يوم"""
+
+    def __init__(self, directory=REMINDERS_DIR):
+        self.directory = directory
+
+    def send(self, phone, message):
+        self.send_batch([(None, phone, message)])
+
+    def send_batch(self, messages):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"outbox_{today_str()}.jsonl")
+        sent_at = now_str()
+        with open(path, "a", encoding="utf-8") as f:
+            for outbox_id, phone, message in messages:
+                f.write(json.dumps({"id": outbox_id, "phone": phone, "message": message, "sent_at": sent_at},
+                                   ensure_ascii=False) + "\n")
+        return {outbox_id: None for outbox_id, _, _ in messages}
+
+
+class MockTransport(Transport):
+    """ناقل وهمي للاختبار: يحتفظ بالرسائل في الذاكرة، ويمكنه الفشل لأرقام محددة"""
+
+    def __init__(self, failing_phones=()):
+        self.failing_phones = set(failing_phones)
+        self.sent = []
+
+    def send(self, phone, message):
+        if phone in self.failing_phones:
+            raise ConnectionError(f"تعذر الإرسال إلى {phone}")
+        self.sent.append((phone, message))
+
+
+# --- 3. الموزع ---
+
+class ReminderDispatcher:
+    """يرسل الرسائل المستحقة على دفعات بمعدل محدود ويسجل نتيجة كل دفعة في معاملة واحدة"""
+
+    def __init__(self, system, transport, rate_per_sec=RATE_PER_SEC, batch_size=DISPATCH_BATCH,
+                 max_attempts=MAX_ATTEMPTS, backoff_s=RETRY_BACKOFF_S, sleep=time.sleep, clock=datetime.now):
+        self.system = system
+        self.transport = transport
+        self.rate_per_sec = rate_per_sec
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_s = backoff_s
+        self.sleep = sleep
+        self.clock = clock
+
+    def _due(self, now, limit):
+        with self.system.db.read() as conn:
+            return conn.execute("""
+                SELECT id, parent_phone, message, attempts FROM reminder_outbox
+                WHERE status = 'queued' AND next_attempt_at <= ?
+                ORDER BY next_attempt_at, id LIMIT ?
+            """, (now, limit)).fetchall()
+
+    def _next_retry(self):
+        """موعد أقرب رسالة مؤجلة لإعادة المحاولة (أو None إن لم يتبق شيء في الطابور)"""
+        with self.system.db.read() as conn:
+            next_at = conn.execute(
+                "SELECT MIN(next_attempt_at) FROM reminder_outbox WHERE status = 'queued'").fetchone()[0]
+        return datetime.strptime(next_at, DATETIME_FMT) if next_at else None
+
+    def _record_tx(self, conn, batch, results, now):
+        sent_at = now.strftime(DATETIME_FMT)
+        done, retried, failed = [], [], []
+        for outbox_id, _, _, attempts in batch:
+            error = results.get(outbox_id, "لم يرد الناقل بنتيجة")
+            if error is None:
+                done.append((sent_at, outbox_id))
+            elif attempts + 1 >= self.max_attempts:
+                failed.append((error, outbox_id))
+            else:
+                retry_at = now + timedelta(seconds=self.backoff_s * 2 ** attempts)
+                retried.append((error, retry_at.strftime(DATETIME_FMT), outbox_id))
+        conn.executemany("""UPDATE reminder_outbox SET status = 'sent', attempts = attempts + 1, sent_at = ?,
+                            last_error = NULL WHERE id = ?""", done)
+        conn.executemany("""UPDATE reminder_outbox SET attempts = attempts + 1, last_error = ?, next_attempt_at = ?
+                            WHERE id = ?""", retried)
+        conn.executemany("""UPDATE reminder_outbox SET status = 'failed', attempts = attempts + 1, last_error = ?
+                            WHERE id = ?""", failed)
+        return (len(done), len(retried), len(failed)), None
+
+    def run(self, limit=None, until_quiet_hours_end=True, progress=None):
+        """
+        إرسال كل الرسائل المستحقة (أو أول limit منها)، ويعيد عدد المحاولات (مرسلة، مؤجلة لإعادة المحاولة، فاشلة نهائياً).
+        يتوقف عند انتهاء نافذة التشغيل الليلي إن كان until_quiet_hours_end.
+        ما دامت هناك رسائل مؤجلة ينتظر موعد أقربها بدلاً من التوقف عند أول دفعة فارغة.
+        """
+        totals = [0, 0, 0]
+        interval = 1.0 / self.rate_per_sec if self.rate_per_sec else 0.0
+        while limit is None or sum(totals) < limit:
+            now = self.clock()
+            if until_quiet_hours_end and not in_quiet_hours(now):
+                if progress:
+                    progress("⏸️ انتهت نافذة التشغيل الليلي، ستُستكمل الرسائل المتبقية في الليلة التالية.")
+                break
+            size = self.batch_size if limit is None else min(self.batch_size, limit - sum(totals))
+            batch = self._due(now.strftime(DATETIME_FMT), size)
+            if not batch:
+                next_at = self._next_retry()
+                if next_at is None:
+                    break
+                # انتظار أقرب إعادة محاولة (المهلات محدودة بـ max_attempts فالانتظار ينتهي دائماً)
+                self.sleep(max((next_at - now).total_seconds(), 0.0))
+                continue
+            started = time.monotonic()
+            results = self.transport.send_batch([(outbox_id, phone, message)
+                                                 for outbox_id, phone, message, _ in batch])
+            counts = self.system.writes.submit(self._record_tx, batch, results, self.clock()).result()[0]
+            totals = [a + b for a, b in zip(totals, counts)]
+            if progress:
+                progress(f"  مرسلة {totals[0]:,} | مؤجلة {totals[1]:,} | فاشلة {totals[2]:,}")
+            # تحديد المعدل: الدفعة لا تستغرق أقل من (عدد رسائلها / المعدل) ثانية
+            remaining = len(batch) * interval - (time.monotonic() - started)
+            if remaining > 0:
+                self.sleep(remaining)
+        return tuple(totals)
+
+
+def outbox_stats(system, day=None):
+    """عدد رسائل اليوم لكل حالة: {الحالة: العدد}"""
+    with system.db.read() as conn:
+        return dict(conn.execute("""
+            SELECT status, COUNT(*) FROM reminder_outbox WHERE remind_day = ? GROUP BY status
+        """, (day or today_str(),)).fetchall())
+
+
+def run_nightly(system, transport, day=None, force=False, progress=print):
+    """
+    التشغيل الليلي الكامل: إدراج رسائل اليوم ثم إرسالها، ويعيد (مدرجة، مرسلة، مؤجلة، فاشلة).
+    الناقل يُغلق في كل الأحوال، حتى عند فشل الإدراج أو الإرسال.
+    """
+    try:
+        if not force and not in_quiet_hours():
+            raise RuntimeError(f"التذكيرات تعمل ليلاً فقط (من {QUIET_HOURS[0]}:00 حتى {QUIET_HOURS[1]}:00).")
+        queued, installments = enqueue_reminders(system, day, progress=progress)
+        progress(f"📨 تم تجهيز {queued:,} رسالة تشمل {installments:,} قسطاً متأخراً.")
+        sent, retried, failed = ReminderDispatcher(system, transport).run(
+            until_quiet_hours_end=not force, progress=progress)
+    finally:
+        transport.close()
+    return queued, sent, retried, failed
@@ -0,0 +1,215 @@
+import csv
+import logging
+import os
+import threading
+
+from dates import day_range, today_str
+
+# --- محرك تصدير التقارير (CSV / PDF) ---
+# كل تقرير هو استعلام SQL يُقرأ من المؤشر (Cursor) على دفعات عبر Generator،
+# فلا يتم تحميل النتيجة كاملة في الذاكرة ولا بناء عناصر Flet للصفوف.
+
+FETCH_BATCH = 500
+PROGRESS_EVERY = 1000
+
+log = logging.getLogger("school.reports")
+
+# خطوط تدعم العربية (يمكن تحديد خط آخر عبر متغير البيئة SCHOOL_PDF_FONT)
+FONT_CANDIDATES = [
+    "fonts/Amiri-Regular.ttf",
+    "C:/Windows/Fonts/arial.ttf",
+    "C:/Windows/Fonts/tahoma.ttf",
+    "/usr/share/fonts/truetype/noto/NotoNaskhArabic-Regular.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/Library/Fonts/Arial Unicode.ttf",
+]
+
+
+# تعريف التقارير: العنوان، رؤوس الأعمدة، الاستعلام، ودالة تبني المعاملات من الخيارات
+REPORTS = {
+    "roster": (
+        "كشف الطلاب",
+        ["الرقم", "اسم الطالب", "الصف الدراسي", "العام الدراسي", "هاتف الولي"],
+        """
+        SELECT id, name, grade, IFNULL(academic_year, ''), IFNULL(parent_phone, '')
+        FROM students
+        ORDER BY grade, name
+        """,
+        lambda opts: (),
+    ),
+    "pending": (
+        "الأقساط المستحقة",
+        ["رقم القسط", "الطالب", "الصف", "القسط", "تاريخ الاستحقاق", "المبلغ المتبقي"],
+        """
+        SELECT i.id, s.name, s.grade, i.sequence, i.due_date, i.amount - IFNULL(i.paid_amount, 0)
+        FROM installments i
+        JOIN students s ON s.id = i.student_id
+        WHERE i.status = 'pending'
+        ORDER BY i.due_date, i.id
+        """,
+        lambda opts: (),
+    ),
+    "overdue": (
+        "الأقساط المتأخرة",
+        ["رقم القسط", "الطالب", "الصف", "القسط", "تاريخ الاستحقاق", "المبلغ المتبقي"],
+        """
+        SELECT i.id, s.name, s.grade, i.sequence, i.due_date, i.amount - IFNULL(i.paid_amount, 0)
+        FROM installments i
+        JOIN students s ON s.id = i.student_id
+        WHERE i.status = 'pending' AND i.due_date < ?
+        ORDER BY i.due_date, i.id
+        """,
+        lambda opts: (opts.get("day") or today_str(),),
+    ),
+    "cash_journal": (
+        "يومية الخزينة",
+        ["الوقت", "الطالب", "النوع", "المبلغ", "الطريقة", "البيان"],
+        """
+        SELECT t.date, IFNULL(s.name, '-'), t.type, t.amount, IFNULL(t.payment_method, ''), IFNULL(t.description, '')
+        FROM transactions t
+        LEFT JOIN students s ON s.id = t.student_id
+        WHERE t.date >= ? AND t.date < ?
+        ORDER BY t.date, t.id
+        """,
+        lambda opts: day_range(opts.get("day")),
+    ),
+}
+
+
+def iter_report(system, report, **options):
+    """Generator يعيد صفوف التقرير دفعة بدفعة من قاعدة البيانات"""
+    if report not in REPORTS:
+        raise ValueError(f"تقرير غير معروف: {report}")
+    _, _, sql, make_params = REPORTS[report]
+    with system.db.read() as conn:
+        cur = conn.execute(sql, make_params(options))
+        while True:
+            batch = cur.fetchmany(FETCH_BATCH)
+            if not batch:
+                break
+            yield from batch
+
+
+def _format_cell(value):
+    if isinstance(value, float):
+        return f"{value:,.2f}"
+    return "" if value is None else str(value)
+
+
+# --- 1. الكتابة بصيغة CSV ---
+
+def write_csv(rows, path, headers, progress=None):
+    """كتابة الصفوف إلى ملف CSV (UTF-8 مع BOM ليفتحه Excel بالعربية بشكل صحيح)"""
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+            if progress and count % PROGRESS_EVERY == 0:
+                progress(count)
+    return count
+
+
+# --- 2. الكتابة بصيغة PDF (fpdf2) ---
+
+def find_arabic_font():
+    """تحديد مسار خط يدعم العربية"""
+    candidates = [os.environ.get("SCHOOL_PDF_FONT")] + FONT_CANDIDATES
+    for path in candidates:
+        if path and os.path.exists(path):
+            return path
+    raise RuntimeError("لم يتم العثور على خط عربي. حدد مسار الخط عبر SCHOOL_PDF_FONT.")
+
+
+def new_arabic_pdf(font_path=None, orientation="P", page_format="A4"):
+    """إنشاء مستند PDF بخط عربي واتجاه من اليمين لليسار"""
+    from fpdf import FPDF  # استيراد مؤجل: fpdf2 مطلوب فقط عند التصدير بصيغة PDF
+
+    pdf = FPDF(orientation=orientation, format=page_format)
+    pdf.add_font("arabic", fname=font_path or find_arabic_font())
+    pdf.set_font("arabic", size=10)
+    try:
+        # تشكيل الحروف العربية يتطلب uharfbuzz
+        pdf.set_text_shaping(use_shaping_engine=True, direction="rtl")
+    except Exception as e:
+        # بدون التشكيل تُرسم الحروف منفصلة ومعكوسة: لا يُصدَّر مستند عربي بهذا الشكل
+        log.error("تعذر تفعيل تشكيل الحروف العربية: %s", e)
+        raise RuntimeError(f"تشكيل الحروف العربية غير متاح (تأكد من تثبيت uharfbuzz): {e}") from e
+    return pdf
+
+
+def check_arabic_pdf(font_path=None):
+    """فحص توفر الخط العربي وتشكيل الحروف (يرفع RuntimeError بالسبب)"""
+    new_arabic_pdf(font_path)
+
+
+def write_pdf(rows, path, headers, title, progress=None, font_path=None):
+    """كتابة الصفوف إلى جدول PDF صفاً صفاً (الصفحات تُضاف تلقائياً)"""
+    pdf = new_arabic_pdf(font_path, orientation="L")
+    pdf.add_page()
+    pdf.set_font("arabic", size=14)
+    pdf.cell(0, 10, f"{title} - {today_str()}", align="C", new_x="LMARGIN", new_y="NEXT")
+    pdf.set_font("arabic", size=9)
+
+    col_width = (pdf.w - pdf.l_margin - pdf.r_margin) / len(headers)
+    row_height = 7
+
+    def draw_row(cells, fill=False):
+        if pdf.get_y() + row_height > pdf.page_break_trigger:
+            pdf.add_page()
+            draw_row(headers, fill=True)
+        # ترتيب الأعمدة من اليمين لليسار
+        for cell in reversed(cells):
+            pdf.cell(col_width, row_height, _format_cell(cell), border=1, align="C", fill=fill)
+        pdf.ln(row_height)
+
+    pdf.set_fill_color(230, 230, 230)
+    draw_row(headers, fill=True)
+    count = 0
+    for row in rows:
+        draw_row(row)
+        count += 1
+        if progress and count % PROGRESS_EVERY == 0:
+            progress(count)
+
+    pdf.output(path)
+    return count
+
+
+# --- 3. التصدير ---
+
+def export_report(system, report, fmt, path, progress=None, **options):
+    """تصدير تقرير إلى ملف CSV أو PDF، ويعيد عدد الصفوف المكتوبة"""
+    if report not in REPORTS:
+        raise ValueError(f"تقرير غير معروف: {report}")
+    title, headers, _, _ = REPORTS[report]
+    rows = iter_report(system, report, **options)
+    if fmt == "csv":
+        return write_csv(rows, path, headers, progress)
+    if fmt == "pdf":
+        return write_pdf(rows, path, headers, title, progress)
+    raise ValueError(f"صيغة تصدير غير مدعومة: {fmt}")
+
+
+def start_export(system, report, fmt, path, progress=None, done=None, **options):
+    """
+    تشغيل التصدير في خيط منفصل حتى لا تتجمد الواجهة.
+    done(success, message) تُستدعى عند الانتهاء.
+    """
+    def run():
+        try:
+            count = export_report(system, report, fmt, path, progress, **options)
+            if done:
+                done(True, f"تم تصدير {count} صف.")
+        except Exception as e:
+            if done:
+                done(False, f"خطأ في التصدير: {str(e)}")
+        finally:
+            # الخيط ينتهي بعد التصدير: اتصال القراءة الخاص به يُغلق ولا يبقى في سجل الاتصالات
+            system.db.release_reader()
+
+    thread = threading.Thread(target=run, name=f"export-{report}", daemon=True)
+    thread.start()
+    return thread
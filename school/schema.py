@@ -0,0 +1,288 @@
+# --- تعريف مخطط الجداول المشتقة والميزات (Schema) ---
+# جمل SQL فقط (جداول، فهارس، Triggers) ودوال بيانات تعمل بـ SQL على الاتصال المعطى،
+# يستوردها سجل الترحيلات (migrations.py) ووحدات الميزات دون أن يعتمد الترحيل على
+# وحدات الواجهة أو الطباعة أو الإرسال.
+
+
+# --- 1. جداول التجميع (Rollups) ---
+# daily_revenue: إجمالي الحركات لكل (يوم، نوع، طريقة دفع)
+# installment_due_rollup: عدد ومبلغ الأقساط المعلقة لكل تاريخ استحقاق
+# تُحدَّث تلقائياً بواسطة Triggers داخل نفس معاملة الكتابة، فلا تحتاج الواجهة لتجميع السجلات الخام.
+
+ROLLUP_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS daily_revenue (
+        day TEXT NOT NULL,
+        type TEXT NOT NULL DEFAULT '',
+        payment_method TEXT NOT NULL DEFAULT '',
+        total REAL NOT NULL DEFAULT 0,
+        tx_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, type, payment_method)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS installment_due_rollup (
+        due_date TEXT PRIMARY KEY,
+        pending_count INTEGER NOT NULL DEFAULT 0,
+        pending_amount REAL NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    """,
+]
+
+# مقتطفات SQL لإضافة/طرح حركة أو قسط من جداول التجميع (ROW = NEW أو OLD)
+_REVENUE_DELTA = """
+    INSERT INTO daily_revenue (day, type, payment_method, total, tx_count)
+    VALUES (substr({row}.date, 1, 10), IFNULL({row}.type, ''), IFNULL({row}.payment_method, ''),
+            {sign}{row}.amount, {sign}1)
+    ON CONFLICT (day, type, payment_method) DO UPDATE SET
+        total = total + excluded.total,
+        tx_count = tx_count + excluded.tx_count;
+"""
+
+_DUE_DELTA = """
+    INSERT INTO installment_due_rollup (due_date, pending_count, pending_amount)
+    SELECT {row}.due_date, {sign}1, {sign}({row}.amount - IFNULL({row}.paid_amount, 0))
+    WHERE {row}.status = 'pending'
+    ON CONFLICT (due_date) DO UPDATE SET
+        pending_count = pending_count + excluded.pending_count,
+        pending_amount = pending_amount + excluded.pending_amount;
+"""
+
+
+def _trigger(name, event, table, body):
+    return f"CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON {table} BEGIN {body} END"
+
+
+ROLLUP_TRIGGERS = [
+    _trigger("trg_transactions_rollup_ins", "INSERT", "transactions",
+             _REVENUE_DELTA.format(row="NEW", sign="")),
+    _trigger("trg_transactions_rollup_del", "DELETE", "transactions",
+             _REVENUE_DELTA.format(row="OLD", sign="-")),
+    _trigger("trg_transactions_rollup_upd", "UPDATE OF date, amount, type, payment_method", "transactions",
+             _REVENUE_DELTA.format(row="OLD", sign="-") + _REVENUE_DELTA.format(row="NEW", sign="")),
+    _trigger("trg_installments_rollup_ins", "INSERT", "installments",
+             _DUE_DELTA.format(row="NEW", sign="")),
+    _trigger("trg_installments_rollup_del", "DELETE", "installments",
+             _DUE_DELTA.format(row="OLD", sign="-")),
+    _trigger("trg_installments_rollup_upd", "UPDATE OF due_date, amount, paid_amount, status", "installments",
+             _DUE_DELTA.format(row="OLD", sign="-") + _DUE_DELTA.format(row="NEW", sign="")),
+]
+
+
+def rebuild_rollups(conn):
+    """إعادة بناء جداول التجميع بالكامل من السجلات الخام (للترحيل أو بعد الاستيراد الجماعي)"""
+    conn.execute("DELETE FROM daily_revenue")
+    conn.execute("""
+        INSERT INTO daily_revenue (day, type, payment_method, total, tx_count)
+        SELECT substr(date, 1, 10), IFNULL(type, ''), IFNULL(payment_method, ''), SUM(amount), COUNT(*)
+        FROM transactions
+        WHERE date IS NOT NULL
+        GROUP BY 1, 2, 3
+    """)
+    conn.execute("DELETE FROM installment_due_rollup")
+    conn.execute("""
+        INSERT INTO installment_due_rollup (due_date, pending_count, pending_amount)
+        SELECT due_date, COUNT(*), SUM(amount - IFNULL(paid_amount, 0))
+        FROM installments
+        WHERE status = 'pending'
+        GROUP BY due_date
+    """)
+
+
+# --- 2. دفتر أرصدة الطلاب (Student Ledger) ---
+# صف واحد لكل طالب: إجمالي المستحق، المدفوع (الموزع على الأقساط)، المتبقي، أقرب تاريخ استحقاق،
+# والرصيد الدائن (مبالغ زائدة لم توزع على أي قسط). يُحدَّث بواسطة Triggers على جدول الأقساط
+# داخل نفس معاملة الكتابة، فيكون الاستعلام عن رصيد طالب أو أكبر المدينين بحثاً في فهرس فقط.
+
+LEDGER_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS student_balances (
+        student_id INTEGER PRIMARY KEY,
+        billed REAL NOT NULL DEFAULT 0,
+        paid REAL NOT NULL DEFAULT 0,
+        outstanding REAL NOT NULL DEFAULT 0,
+        credit REAL NOT NULL DEFAULT 0,
+        next_due_date TEXT,
+        updated_at TEXT,
+        FOREIGN KEY (student_id) REFERENCES students (id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_student_balances_outstanding ON student_balances(outstanding DESC)",
+    # أقرب قسط معلق لطالب: بحث مباشر في الفهرس (student_id, status, due_date)
+    "DROP INDEX IF EXISTS idx_installments_student",
+    "CREATE INDEX IF NOT EXISTS idx_installments_student_status_due ON installments(student_id, status, due_date)",
+]
+
+_BALANCE_DELTA = """
+    INSERT INTO student_balances (student_id, billed, paid, outstanding)
+    VALUES ({row}.student_id, {sign}{row}.amount, {sign}IFNULL({row}.paid_amount, 0),
+            {sign}({row}.amount - IFNULL({row}.paid_amount, 0)))
+    ON CONFLICT (student_id) DO UPDATE SET
+        billed = ROUND(billed + excluded.billed, 2),
+        paid = ROUND(paid + excluded.paid, 2),
+        outstanding = ROUND(outstanding + excluded.outstanding, 2);
+"""
+
+_NEXT_DUE = """
+    UPDATE student_balances SET
+        next_due_date = (SELECT MIN(due_date) FROM installments
+                         WHERE student_id = {row}.student_id AND status = 'pending'),
+        updated_at = datetime('now', 'localtime')
+    WHERE student_id = {row}.student_id;
+"""
+
+
+LEDGER_TRIGGERS = [
+    _trigger("trg_installments_ledger_ins", "INSERT", "installments",
+             _BALANCE_DELTA.format(row="NEW", sign="") + _NEXT_DUE.format(row="NEW")),
+    _trigger("trg_installments_ledger_del", "DELETE", "installments",
+             _BALANCE_DELTA.format(row="OLD", sign="-") + _NEXT_DUE.format(row="OLD")),
+    _trigger("trg_installments_ledger_upd", "UPDATE OF student_id, amount, paid_amount, status, due_date",
+             "installments",
+             _BALANCE_DELTA.format(row="OLD", sign="-") + _BALANCE_DELTA.format(row="NEW", sign="")
+             + _NEXT_DUE.format(row="OLD") + _NEXT_DUE.format(row="NEW")),
+]
+
+
+def rebuild_balances(conn):
+    """إعادة حساب أرصدة كل الطلاب من جدول الأقساط (مع الاحتفاظ بالرصيد الدائن)"""
+    conn.execute("""
+        INSERT INTO student_balances (student_id, billed, paid, outstanding, next_due_date, updated_at)
+        SELECT student_id,
+               ROUND(SUM(amount), 2),
+               ROUND(SUM(IFNULL(paid_amount, 0)), 2),
+               ROUND(SUM(amount - IFNULL(paid_amount, 0)), 2),
+               MIN(CASE WHEN status = 'pending' THEN due_date END),
+               datetime('now', 'localtime')
+        FROM installments
+        GROUP BY student_id
+        ON CONFLICT (student_id) DO UPDATE SET
+            billed = excluded.billed,
+            paid = excluded.paid,
+            outstanding = excluded.outstanding,
+            next_due_date = excluded.next_due_date,
+            updated_at = excluded.updated_at
+    """)
+    # طلاب حُذفت كل أقساطهم
+    conn.execute("""
+        UPDATE student_balances SET billed = 0, paid = 0, outstanding = 0, next_due_date = NULL
+        WHERE student_id NOT IN (SELECT DISTINCT student_id FROM installments)
+    """)
+
+
+# --- آخر طريقة دفع لكل طالب (لتقسيم تقارير المديونية حسب طريقة الدفع) ---
+# العمود last_payment_method يضيفه الترحيل نفسه (إضافة مشروطة بعدم وجوده).
+
+LEDGER_PAYMENT_METHOD = [
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_ledger_method AFTER INSERT ON transactions
+    WHEN NEW.type = 'payment' AND NEW.student_id IS NOT NULL
+    BEGIN
+        INSERT INTO student_balances (student_id, last_payment_method, updated_at)
+        VALUES (NEW.student_id, NEW.payment_method, datetime('now', 'localtime'))
+        ON CONFLICT (student_id) DO UPDATE SET
+            last_payment_method = excluded.last_payment_method,
+            updated_at = excluded.updated_at;
+    END
+    """,
+]
+
+
+def rebuild_last_payment_methods(conn):
+    """إعادة تعيين آخر طريقة دفع لكل طالب من جدول الحركات"""
+    # عمود payment_method يؤخذ من صف MAX(id) نفسه (خاصية الأعمدة المجردة في SQLite)
+    conn.execute("""
+        INSERT INTO student_balances (student_id, last_payment_method)
+        SELECT student_id, payment_method
+        FROM (SELECT student_id, payment_method, MAX(id)
+              FROM transactions
+              WHERE type = 'payment' AND student_id IS NOT NULL
+              GROUP BY student_id)
+        WHERE true
+        ON CONFLICT (student_id) DO UPDATE SET last_payment_method = excluded.last_payment_method
+    """)
+
+
+# --- 3. لقطة أعمار الديون (aging.py) ---
+
+AGING_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS aging_snapshot (
+        as_of TEXT NOT NULL,
+        grade TEXT NOT NULL,
+        academic_year TEXT NOT NULL,
+        payment_method TEXT NOT NULL,
+        bucket_0_30 REAL NOT NULL DEFAULT 0,
+        bucket_31_60 REAL NOT NULL DEFAULT 0,
+        bucket_61_90 REAL NOT NULL DEFAULT 0,
+        bucket_90_plus REAL NOT NULL DEFAULT 0,
+        total REAL NOT NULL DEFAULT 0,
+        students INTEGER NOT NULL DEFAULT 0,
+        taken_at TEXT NOT NULL,
+        PRIMARY KEY (as_of, grade, academic_year, payment_method)
+    ) WITHOUT ROWID
+    """,
+]
+
+
+# --- 4. إيصالات الدفع (receipts.py) ---
+
+RECEIPT_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS receipts (
+        number INTEGER PRIMARY KEY AUTOINCREMENT,
+        transaction_id INTEGER NOT NULL UNIQUE,
+        issued_at TEXT NOT NULL,
+        FOREIGN KEY (transaction_id) REFERENCES transactions (id)
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_receipt AFTER INSERT ON transactions
+    WHEN NEW.type = 'payment'
+    BEGIN
+        INSERT INTO receipts (transaction_id, issued_at) VALUES (NEW.id, NEW.date);
+    END
+    """,
+]
+
+
+def backfill_receipts(conn):
+    """ترقيم إيصالات الدفعات المسجلة قبل إضافة جدول الإيصالات (بترتيب تسجيلها)"""
+    conn.execute("""
+        INSERT OR IGNORE INTO receipts (transaction_id, issued_at)
+        SELECT id, IFNULL(date, '') FROM transactions WHERE type = 'payment' ORDER BY id
+    """)
+
+
+# --- 5. صندوق تذكيرات أولياء الأمور (reminders.py) ---
+
+REMINDER_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS reminder_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        parent_phone TEXT NOT NULL,
+        remind_day TEXT NOT NULL,
+        message TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at TEXT NOT NULL,
+        last_error TEXT,
+        created_at TEXT NOT NULL,
+        sent_at TEXT
+    )
+    """,
+    # الرسائل المستحقة للإرسال فقط (الرسائل المرسلة لا تدخل في الفهرس)
+    """
+    CREATE INDEX IF NOT EXISTS idx_reminder_outbox_due
+    ON reminder_outbox(next_attempt_at) WHERE status = 'queued'
+    """,
+    # الأقساط التي شملتها رسالة في يوم معين (المفتاح الأساسي يمنع التذكير المكرر)
+    """
+    CREATE TABLE IF NOT EXISTS reminder_items (
+        installment_id INTEGER NOT NULL,
+        remind_day TEXT NOT NULL,
+        outbox_id INTEGER NOT NULL,
+        PRIMARY KEY (installment_id, remind_day)
+    ) WITHOUT ROWID
+    """,
+]
@@ -0,0 +1,114 @@
+import threading
+
+from changes import ChangeSet
+
+# --- حالة كل جلسة متصفح واشتراكها في إشعارات التغيير ---
+# كل جلسة Flet (كاشير أو محاسب) لها حالتها الخاصة ولا تشارك الجلسات الأخرى أي متغير قابل للتغيير.
+# الكتابات في FinanceSystem تنشر ChangeSet صغيراً لكل المشتركين داخل نفس العملية، وكل جلسة
+# تدمج الأحداث التي تصل أثناء تطبيق تحديث سابق (أو أثناء انقطاع الاتصال) في تحديث واحد.
+
+
+class SessionState:
+    """الحالة القابلة للتغيير لجلسة متصفح واحدة"""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        # ترقيم صفحات الأقساط المعلقة: مؤشرات الصفحات السابقة ومؤشر الصفحة التالية
+        self.pending_pager = {"cursors": [None], "next": None}
+        # التبويبات التي حُمّلت بياناتها في هذه الجلسة
+        self.loaded_tabs = set()
+        # الصفوف المعروضة حسب رقم القسط / رقم الطالب (للتحديث التدريجي)
+        self.pending_rows = {}
+        self.managed_rows = {}
+        # حالة البحث في جدول إدارة الطلاب (نص البحث وعدد النتائج المعروضة)
+        self.students_search = {"query": "", "offset": 0}
+        # الطالب المختار في منتقي الخطة المالية
+        self.plan_student = {"id": None, "name": ""}
+        # مفتاح منع التكرار لطلب الدفع الحالي في نافذة الدفع
+        self.payment_request = {"key": None}
+        # عدد العمليات الجارية في الخلفية (لإظهار شريط التحميل)،
+        # وعدد التحديثات المجمعة الجارية (تُرسل page.update واحدة في نهايتها)
+        self.busy = {"count": 0, "batched": 0}
+
+
+class SessionFeed:
+    """
+    اشتراك جلسة في إشعارات FinanceSystem مع دمج الأحداث:
+    تحديث واحد فقط قيد التنفيذ لكل جلسة، وما يصل أثناءه يُدمج ويُطبق بعده دفعة واحدة.
+    schedule: دالة تشغل coroutine على حلقة أحداث الجلسة (page.run_task).
+    apply: coroutine تستقبل ChangeSet وتحدث واجهة الجلسة.
+    """
+
+    def __init__(self, system, schedule, apply):
+        self.system = system
+        self._schedule = schedule
+        self._apply = apply
+        self._lock = threading.Lock()
+        self._pending = None
+        self._running = False
+        self._paused = False
+        self._closed = False
+        self.received = 0  # أحداث مستلمة
+        self.applied = 0   # تحديثات طُبقت فعلاً (بعد الدمج)
+
+    def start(self):
+        self.system.subscribe(self.push)
+        return self
+
+    def close(self):
+        """إلغاء الاشتراك (عند إغلاق الجلسة) حتى لا تتراكم المستمعات"""
+        with self._lock:
+            self._closed = True
+            self._pending = None
+        self.system.unsubscribe(self.push)
+
+    def pause(self):
+        """إيقاف التطبيق مؤقتاً (انقطاع الاتصال): الأحداث تُدمج وتنتظر"""
+        with self._lock:
+            self._paused = True
+
+    def resume(self):
+        """استئناف التطبيق وتطبيق ما تراكم أثناء الانقطاع في تحديث واحد"""
+        with self._lock:
+            self._paused = False
+            if self._pending is None or self._running or self._closed:
+                return
+            self._running = True
+        self._kick()
+
+    def push(self, changes):
+        """تُستدعى من خيط الكتابة لكل ChangeSet منشور"""
+        with self._lock:
+            if self._closed:
+                return
+            self.received += 1
+            # نسخة خاصة بالجلسة: نفس ChangeSet يصل لكل الجلسات فلا يُعدل مباشرة
+            if self._pending is None:
+                self._pending = ChangeSet().merge(changes)
+            else:
+                self._pending.merge(changes)
+            if self._running or self._paused:
+                return
+            self._running = True
+        self._kick()
+
+    def _kick(self):
+        try:
+            self._schedule(self._drain)
+        except Exception as e:
+            with self._lock:
+                self._running = False
+            print(f"❌ تعذر جدولة تحديث الجلسة: {e}")
+
+    async def _drain(self):
+        while True:
+            with self._lock:
+                if self._pending is None or self._paused or self._closed:
+                    self._running = False
+                    return
+                changes, self._pending = self._pending, None
+                self.applied += 1
+            try:
+                await self._apply(changes)
+            except Exception as e:
+                print(f"❌ خطأ في تطبيق التغييرات: {e}")
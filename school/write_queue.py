@@ -0,0 +1,154 @@
+import queue
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+# --- طابور الكتابة (Write Pipeline) ---
+# كل عمليات الكتابة من كل الجلسات تمر عبر خيط كاتب واحد:
+# - تُجمع الطلبات المتزامنة في معاملة واحدة (BEGIN IMMEDIATE ... COMMIT) = Group Commit
+# - كل طلب داخل المعاملة في SAVEPOINT خاص به، ففشل طلب لا يلغي باقي الدفعة
+# - عند "database is locked" (عملية أخرى تكتب على نفس الملف) تُعاد الدفعة مع تأخير متزايد
+# - النتيجة تعود للجلسة صاحبة الطلب عبر Future بعد COMMIT فقط
+
+
+def _is_locked(error):
+    return isinstance(error, sqlite3.OperationalError) and (
+        "locked" in str(error) or "busy" in str(error))
+
+
+class _Job:
+    __slots__ = ("fn", "args", "kwargs", "future")
+
+    def __init__(self, fn, args, kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+
+
+class WriteQueue:
+    """خيط كاتب واحد ينفذ دوال الكتابة fn(conn, ...) على دفعات داخل معاملات مجمعة"""
+
+    def __init__(self, db, max_batch=64, max_wait_ms=2.0, retries=5, backoff_ms=25.0):
+        self.db = db
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.retries = retries
+        self.backoff = backoff_ms / 1000
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"jobs": 0, "failed": 0, "batches": 0, "retries": 0, "largest_batch": 0}
+
+    def submit(self, fn, *args, **kwargs):
+        """إضافة دالة كتابة للطابور، وتعيد Future بنتيجتها (أو الاستثناء الذي رفعته)"""
+        job = _Job(fn, args, kwargs)
+        if threading.current_thread() is self._thread:
+            # كتابة متداخلة من داخل دالة كتابة: تُنفذ مباشرة ضمن نفس المعاملة
+            job.future.set_result(fn(self.db.writer(), *args, **kwargs))
+            return job.future
+        self._ensure_started()
+        self._queue.put(job)
+        return job.future
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats, queued=self._queue.qsize())
+
+    def close(self, timeout=5.0):
+        """إنهاء الخيط الكاتب بعد تنفيذ الطلبات المعلقة"""
+        thread = self._thread
+        if thread is None:
+            return
+        self._queue.put(None)
+        thread.join(timeout)
+        self._thread = None
+
+    # --- الخيط الكاتب ---
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                    self._thread.start()
+
+    def _next_batch(self):
+        """ينتظر أول طلب، ثم يجمع ما يصل خلال max_wait حتى max_batch طلب"""
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        while len(batch) < self.max_batch:
+            try:
+                job = self._queue.get(timeout=self.max_wait)
+            except queue.Empty:
+                break
+            if job is None:
+                self._queue.put(None)  # يُعالج الإيقاف بعد تنفيذ الدفعة الحالية
+                break
+            batch.append(job)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            # الطلبات التي ألغاها أصحابها قبل التنفيذ تُستبعد
+            batch = [job for job in batch if job.future.set_running_or_notify_cancel()]
+            if batch:
+                self._apply(batch)
+
+    def _apply(self, batch):
+        for attempt in range(self.retries + 1):
+            try:
+                outcomes = self._commit_batch(batch)
+                break
+            except Exception as e:
+                if not _is_locked(e) or attempt == self.retries:
+                    self._count(batch, failed=len(batch))
+                    for job in batch:
+                        job.future.set_exception(e)
+                    return
+                with self._stats_lock:
+                    self._stats["retries"] += 1
+                # تأخير أُسّي مع عشوائية حتى لا تتزامن المحاولات مع الكاتب الآخر
+                time.sleep(self.backoff * (2 ** attempt) * (1 + random.random()))
+
+        self._count(batch, failed=sum(1 for ok, _ in outcomes if not ok))
+        for job, (ok, value) in zip(batch, outcomes):
+            if ok:
+                job.future.set_result(value)
+            else:
+                job.future.set_exception(value)
+
+    def _commit_batch(self, batch):
+        """تنفيذ الدفعة في معاملة واحدة، كل طلب في SAVEPOINT مستقل"""
+        outcomes = []
+        with self.db.transaction() as conn:
+            for job in batch:
+                conn.execute("SAVEPOINT write_job")
+                try:
+                    value = job.fn(conn, *job.args, **job.kwargs)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write_job")
+                    conn.execute("RELEASE write_job")
+                    if _is_locked(e):
+                        raise  # تُعاد الدفعة كاملة
+                    outcomes.append((False, e))
+                else:
+                    conn.execute("RELEASE write_job")
+                    outcomes.append((True, value))
+        return outcomes
+
+    def _count(self, batch, failed):
+        with self._stats_lock:
+            self._stats["jobs"] += len(batch)
+            self._stats["failed"] += failed
+            self._stats["batches"] += 1
+            self._stats["largest_batch"] = max(self._stats["largest_batch"], len(batch))
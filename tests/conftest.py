@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+
+# وحدات school تستورد بعضها بالاسم مباشرة (حزمة مسطحة)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "school"))
+
+from db_init import ensure_schema  # noqa: E402
+from finance_system import FinanceSystem  # noqa: E402
+
+
+@pytest.fixture
+def system(tmp_path):
+    """FinanceSystem على قاعدة مؤقتة بالمخطط الكامل"""
+    db_path = str(tmp_path / "school.db")
+    ensure_schema(db_path)
+    system = FinanceSystem(db_path)
+    yield system
+    system.close()
+
+
+def add_student(system, name="طالب", grade="KG1", academic_year="2025-2026", phone="0100"):
+    """إضافة طالب وإرجاع رقمه"""
+    ok, msg = system.add_new_student(name, grade, academic_year, phone)
+    assert ok, msg
+    with system.db.read() as conn:
+        return conn.execute("SELECT MAX(id) FROM students").fetchone()[0]
+
+
+def installments_of(system, student_id):
+    """أقساط الطالب: [(id, amount, paid_amount, status)] بترتيب الاستحقاق"""
+    with system.db.read() as conn:
+        return conn.execute("""SELECT id, amount, IFNULL(paid_amount, 0), status FROM installments
+                               WHERE student_id = ? ORDER BY due_date, id""", (student_id,)).fetchall()
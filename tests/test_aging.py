@@ -0,0 +1,53 @@
+from datetime import date, timedelta
+
+from conftest import add_student, installments_of
+
+AS_OF = date(2026, 10, 18)
+
+
+def add_due(system, student_id, days_late, amount, paid=0.0):
+    with system.db.transaction() as conn:
+        conn.execute("""INSERT INTO installments (student_id, sequence, amount, paid_amount, due_date, status)
+                        VALUES (?, 1, ?, ?, ?, 'pending')""",
+                     (student_id, amount, paid, (AS_OF - timedelta(days=days_late)).isoformat()))
+
+
+def test_bucket_edges(system):
+    student = add_student(system)
+    for days_late, amount in [(0, 5000), (1, 1), (30, 2), (31, 10), (60, 20), (61, 100), (90, 200), (91, 1000)]:
+        add_due(system, student, days_late, amount)
+    # الجزء المدفوع من القسط لا يُحتسب متأخراً
+    add_due(system, student, 400, 700, paid=200)
+
+    assert system.get_receivables_aging(AS_OF.isoformat()) == [
+        ("KG1", "2025-2026", "", 3.0, 30.0, 300.0, 1500.0, 1833.0, 1)]
+
+
+def test_rows_split_by_grade_year_and_last_payment_method(system):
+    first = add_student(system, grade="KG1")
+    second = add_student(system, grade="KG2", academic_year="2026-2027")
+    for student in (first, second):
+        add_due(system, student, 10, 300)
+        add_due(system, student, 100, 300)
+    add_due(system, second, 5, 50)
+    system.pay_installment(installments_of(system, second)[-1][0], 50, "Card", "طالب")
+
+    rows = system.get_receivables_aging(AS_OF.isoformat())
+    assert [row[:3] for row in rows] == [("KG1", "2025-2026", ""), ("KG2", "2026-2027", "Card")]
+    assert all(row[3:] == (300.0, 0.0, 0.0, 300.0, 600.0, 1) for row in rows)
+
+
+def test_snapshot_round_trip_replaces_previous(system):
+    student = add_student(system)
+    add_due(system, student, 45, 800)
+    assert system.get_aging_snapshot() is None
+
+    ok, msg = system.refresh_aging_snapshot("2026-10-01")
+    assert ok, msg
+    ok, msg = system.refresh_aging_snapshot(AS_OF.isoformat())
+    assert ok, msg
+    as_of, taken_at, rows = system.get_aging_snapshot()
+    assert as_of == AS_OF.isoformat() and taken_at
+    assert rows == system.get_receivables_aging(AS_OF.isoformat())
+    with system.db.read() as conn:
+        assert conn.execute("SELECT COUNT(DISTINCT as_of) FROM aging_snapshot").fetchone()[0] == 1
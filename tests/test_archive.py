@@ -0,0 +1,57 @@
+import pytest
+
+from archive import archive_settled_years, archive_year, find_settled_years, query_archive
+from conftest import add_student, installments_of
+
+OLD_YEAR = "2020-2021"
+
+
+def _settled_student(system):
+    """طالب من عام قديم سدد خطته بالكامل اليوم"""
+    student_id = add_student(system, academic_year=OLD_YEAR)
+    system.create_fee_plan(student_id, 1000, 1, "2020-09-01")
+    (installment_id, *_), = installments_of(system, student_id)
+    ok, msg = system.pay_installment(installment_id, 1000, "Cash", "طالب")
+    assert ok, msg
+    return student_id
+
+
+def _backdate_transactions(system, date):
+    with system.db.transaction() as conn:
+        conn.execute("UPDATE transactions SET date = ?", (date,))
+    system.rebuild_rollups()
+
+
+def test_recent_payment_keeps_year_hot(system, tmp_path):
+    _settled_student(system)
+    before = (system.get_daily_stats(), system.get_revenue_breakdown())
+    assert before[0][0] == 1000
+
+    assert find_settled_years(system) == []
+    assert archive_settled_years(system, archive_dir=str(tmp_path / "archive"), progress=lambda m: None) == []
+    with pytest.raises(RuntimeError):
+        archive_year(system, OLD_YEAR, archive_dir=str(tmp_path / "archive"))
+
+    system.invalidate("students", "installments")
+    assert (system.get_daily_stats(), system.get_revenue_breakdown()) == before
+
+
+def test_archive_moves_old_rows_without_touching_today(system, tmp_path):
+    _settled_student(system)
+    _backdate_transactions(system, "2021-03-01 10:00:00")
+    current = add_student(system, name="طالب حالي")
+    system.create_fee_plan(current, 500, 1, "2025-09-01")
+    (installment_id, *_), = installments_of(system, current)
+    system.pay_installment(installment_id, 500, "Cash", "طالب حالي")
+    before = (system.get_daily_stats(), system.get_revenue_breakdown())
+
+    archive_dir = str(tmp_path / "archive")
+    results = archive_settled_years(system, archive_dir=archive_dir, progress=lambda m: None)
+    assert [year for year, _ in results] == [OLD_YEAR]
+    assert results[0][1]["transactions"] == 1
+
+    system.invalidate("students", "installments")
+    assert (system.get_daily_stats(), system.get_revenue_breakdown()) == before
+    total, = query_archive(system, "SELECT SUM(amount) FROM all_transactions", years=[OLD_YEAR],
+                           archive_dir=archive_dir, include_hot=False)
+    assert total == (1000,)
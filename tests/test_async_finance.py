@@ -0,0 +1,49 @@
+import asyncio
+import threading
+
+import pytest
+
+from async_finance import AsyncFinanceSystem, Superseded
+
+
+class SlowSystem:
+    def __init__(self):
+        self.release = threading.Event()
+
+    def wait(self, value):
+        self.release.wait(5)
+        return value
+
+
+def test_newer_request_supersedes_older():
+    system = SlowSystem()
+    finance = AsyncFinanceSystem(system, max_workers=1)
+
+    async def scenario():
+        first = asyncio.create_task(finance.latest("k", "wait", 1))
+        await asyncio.sleep(0.05)
+        second = asyncio.create_task(finance.latest("k", "wait", 2))
+        await asyncio.sleep(0.05)
+        system.release.set()
+        with pytest.raises(Superseded):
+            await first
+        assert await second == 2
+
+    asyncio.run(scenario())
+    finance.shutdown()
+
+
+def test_task_cancellation_is_not_superseded():
+    system = SlowSystem()
+    finance = AsyncFinanceSystem(system, max_workers=1)
+
+    async def scenario():
+        task = asyncio.create_task(finance.latest("k", "wait", 1))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    system.release.set()
+    finance.shutdown()
@@ -0,0 +1,62 @@
+import sqlite3
+
+import pytest
+
+from benchmark import compare_reports, generate_school, run_benchmarks
+from cli import DRIFT_CHECKS, count_drift
+
+
+def quiet(message):
+    pass
+
+
+@pytest.fixture
+def bench_db(tmp_path):
+    path = str(tmp_path / "bench.db")
+    generate_school(path, students=20, installments=100, transactions=50, seed=1, progress=quiet)
+    return path
+
+
+def table_rows(path, sql):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def test_generator_produces_requested_sizes(bench_db):
+    counts = [table_rows(bench_db, f"SELECT COUNT(*) FROM {table}")[0][0]
+              for table in ("students", "installments", "transactions")]
+    assert counts == [20, 100, 50]
+
+
+def test_generator_is_deterministic_for_a_seed(bench_db, tmp_path):
+    other = str(tmp_path / "other.db")
+    generate_school(other, students=20, installments=100, transactions=50, seed=1, progress=quiet)
+    sql = "SELECT name, grade, academic_year, parent_phone FROM students ORDER BY id"
+    assert table_rows(bench_db, sql) == table_rows(other, sql)
+
+
+def test_generated_data_keeps_derived_tables_consistent(bench_db):
+    conn = sqlite3.connect(bench_db)
+    try:
+        assert [count_drift(conn, raw_sql, derived_sql) for _, raw_sql, derived_sql, _ in DRIFT_CHECKS] == [0, 0, 0]
+    finally:
+        conn.close()
+
+
+def test_run_reports_every_case(bench_db):
+    report = run_benchmarks(bench_db, iterations=3, progress=quiet)
+    assert {"get_daily_stats", "search_students", "suggest_students", "pay_installment"} <= report["results"].keys()
+    assert report["meta"]["rows"] == {"students": 20, "installments": 100, "transactions": 50}
+    assert all(r["p50_ms"] <= r["p95_ms"] <= r["max_ms"] for r in report["results"].values())
+
+
+def test_compare_flags_only_real_regressions():
+    def report(**p95):
+        return {"results": {name: {"p95_ms": value} for name, value in p95.items()}}
+
+    rows = compare_reports(report(slow=20.0, noise=1.2, fast=5.0, new=1.0),
+                           report(slow=10.0, noise=1.0, fast=10.0), threshold=0.10, min_delta_ms=0.5)
+    assert {name: regressed for name, _, _, _, regressed in rows} == {"slow": True, "noise": False, "fast": False}
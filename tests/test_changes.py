@@ -0,0 +1,25 @@
+from conftest import add_student, installments_of
+
+
+def test_payments_keep_cached_student_reads(system):
+    student = add_student(system, name="محمد علي")
+    other = add_student(system, name="آخر")
+    system.create_fee_plan(student, 1000, 2, "2025-09-01")
+    changes = []
+    system.subscribe(changes.append)
+    system.search_students("محمد")
+    system.suggest_students("محمد")
+
+    system.pay_installment(installments_of(system, student)[0][0], 500, "Cash", "محمد علي")
+    system.create_fee_plan(other, 600, 1, "2025-09-01")
+    hits = system.cache_stats()["hits"]
+    system.suggest_students("محمد")
+    assert system.cache_stats()["hits"] == hits + 1
+    assert not changes[0].students and changes[0].installments
+
+
+def test_student_edits_invalidate_cached_reads(system):
+    student = add_student(system, name="محمد علي")
+    assert [row[1] for row in system.search_students("محمد")] == ["محمد علي"]
+    system.update_student_data(student, "محمد حسن", "KG1", "2025-2026", "01001234567")
+    assert [row[1] for row in system.search_students("محمد")] == ["محمد حسن"]
@@ -0,0 +1,12 @@
+from cli import EXIT_FAILED, EXIT_OK, EXIT_PROBLEMS, EXIT_TEMPFAIL, EXIT_USAGE, combine
+
+
+def test_failure_wins_over_informational_codes():
+    assert combine(EXIT_FAILED, EXIT_PROBLEMS) == EXIT_FAILED
+    assert combine(EXIT_TEMPFAIL, EXIT_FAILED) == EXIT_FAILED
+    assert combine(EXIT_OK, EXIT_USAGE, EXIT_TEMPFAIL) == EXIT_FAILED
+
+
+def test_highest_informational_code_without_failures():
+    assert combine(EXIT_OK, EXIT_PROBLEMS, EXIT_TEMPFAIL) == EXIT_TEMPFAIL
+    assert combine(EXIT_OK, EXIT_OK) == EXIT_OK
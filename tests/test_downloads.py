@@ -0,0 +1,29 @@
+import os
+import time
+
+from downloads import DownloadArea
+
+
+def test_published_files_get_unguessable_urls(tmp_path):
+    area = DownloadArea(str(tmp_path / "assets"))
+    urls = []
+    for _ in range(2):
+        source = tmp_path / "receipt_000001.pdf"
+        source.write_bytes(b"%PDF")
+        urls.append(area.publish(str(source)))
+    assert urls[0] != urls[1]
+    for url in urls:
+        prefix, token, name = url.rsplit("/", 2)
+        assert prefix == "/downloads" and name == "receipt_000001.pdf"
+        assert len(token) >= 20
+        assert os.path.exists(os.path.join(area.assets_dir, *url.strip("/").split("/")))
+
+
+def test_cleanup_removes_only_expired_files(tmp_path):
+    area = DownloadArea(str(tmp_path), ttl_hours=1)
+    old, fresh = area.new_path("old.pdf"), area.new_path("fresh.pdf")
+    past = time.time() - 2 * 3600
+    os.utime(os.path.dirname(old), (past, past))
+    assert area.cleanup() == 1
+    assert not os.path.exists(os.path.dirname(old))
+    assert os.path.exists(os.path.dirname(fresh))
@@ -0,0 +1,62 @@
+from conftest import add_student
+from importer import import_file
+
+
+def _write(path, text):
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def test_students_keep_legacy_ids(system, tmp_path):
+    students = _write(tmp_path / "students.csv",
+                      "id,name,grade,academic_year,parent_phone\n"
+                      "10,أحمد,KG1,2025-2026,01001234567\n"
+                      ",,KG1,2025-2026,01011234567\n"
+                      "12,سارة,KG2,2025-2026,01021234567\n")
+    report = import_file(system, "students", students)
+    assert (report.imported, report.rejected_count) == (2, 1)
+
+    installments = _write(tmp_path / "installments.csv",
+                          "student_id,sequence,amount,due_date\n"
+                          "12,1,500,2025-09-01\n"
+                          "10,1,700,2025-09-01\n")
+    assert import_file(system, "installments", installments).imported == 2
+    with system.db.read() as conn:
+        rows = conn.execute("""SELECT s.id, s.name, i.amount FROM installments i
+                               JOIN students s ON s.id = i.student_id ORDER BY s.id""").fetchall()
+    assert rows == [(10, "أحمد", 700.0), (12, "سارة", 500.0)]
+
+
+def test_taken_or_repeated_ids_are_rejected(system, tmp_path):
+    existing = add_student(system, name="موجود")
+    students = _write(tmp_path / "students.csv",
+                      "id,name,grade\n"
+                      f"{existing},مكرر,KG1\n"
+                      "20,جديد,KG1\n"
+                      "20,جديد مكرر,KG1\n"
+                      ",تلقائي,KG1\n")
+    report = import_file(system, "students", students)
+    assert (report.imported, report.rejected_count) == (2, 2)
+    with system.db.read() as conn:
+        names = dict(conn.execute("SELECT id, name FROM students").fetchall())
+    assert names[existing] == "موجود" and names[20] == "جديد"
+    assert "تلقائي" in names.values()
+
+
+def test_fractional_ids_are_rejected_not_truncated(system, tmp_path):
+    students = _write(tmp_path / "students.csv",
+                      "id,name,grade\n"
+                      "10,أحمد,KG1\n"
+                      "11.0,سارة,KG1\n")
+    assert import_file(system, "students", students).imported == 2
+
+    installments = _write(tmp_path / "installments.csv",
+                          "student_id,sequence,amount,due_date\n"
+                          "10.5,1,500,2025-09-01\n"
+                          "11,1.5,500,2025-09-01\n"
+                          "11,1,500,2025-09-01\n")
+    report = import_file(system, "installments", installments)
+    assert (report.imported, report.rejected_count) == (1, 2)
+    assert all("عدداً صحيحاً" in reason for _, reason in report.rejected)
+    with system.db.read() as conn:
+        assert conn.execute("SELECT student_id FROM installments").fetchall() == [(11,)]
@@ -0,0 +1,42 @@
+from conftest import add_student
+from instrumentation import Histogram, instrument
+
+
+def test_histogram_percentiles_use_bucket_bounds():
+    hist = Histogram()
+    for ms in [0.3] * 90 + [7.0] * 9 + [300.0]:
+        hist.observe(ms)
+    snap = hist.snapshot()
+    assert (snap["count"], snap["p50_ms"], snap["p95_ms"], snap["p99_ms"], snap["max_ms"]) == (
+        100, 0.5, 10, 10, 300.0)
+    assert Histogram().snapshot()["p95_ms"] == 0.0
+
+
+def test_public_methods_and_statements_are_timed(system):
+    metrics = instrument(system, slow_ms=10_000, log_path=None)
+    add_student(system, name="محمد علي")
+    system.search_students("محمد")
+    system.search_students("محمد")
+
+    snap = metrics.snapshot()
+    assert snap["methods"]["search_students"]["count"] == 2
+    assert "add_new_student" in snap["methods"]
+    assert not {"subscribe", "cache_stats", "publish_changes"} & snap["methods"].keys()
+    assert any(sql.startswith("INSERT INTO students") for sql in snap["statements"])
+    assert snap["slow_queries"] == []
+
+    metrics.reset()
+    assert metrics.snapshot()["methods"] == {}
+
+
+def test_slow_queries_keep_plan_and_calling_method(system):
+    metrics = instrument(system, slow_ms=0, log_path=None)
+    system.get_pending_installments_page(limit=5)
+
+    queries = [q for q in metrics.snapshot()["slow_queries"] if "FROM installments" in q["sql"]]
+    assert queries
+    assert queries[0]["method"] == "get_pending_installments_page"
+    assert any("idx_installments_status_due_id" in step for step in queries[0]["plan"])
+    # الدالة الداخلية تُنسب للدالة العامة التي استدعتها
+    system.get_pending_installments()
+    assert metrics.snapshot()["slow_queries"][-1]["method"] == "get_pending_installments"
@@ -0,0 +1,89 @@
+import pytest
+
+from conftest import add_student, installments_of
+
+
+@pytest.fixture
+def student(system):
+    student_id = add_student(system)
+    ok, msg = system.create_fee_plan(student_id, 3000, 3, "2025-09-01")
+    assert ok, msg
+    return student_id
+
+
+def test_payment_spills_over_to_next_installments(system, student):
+    first = installments_of(system, student)[0][0]
+    ok, msg = system.pay_installment(first, 1500, "Cash", "طالب")
+    assert ok, msg
+    assert [(paid, status) for _, _, paid, status in installments_of(system, student)] == [
+        (1000, "paid"), (500, "pending"), (0, "pending")]
+    billed, paid, outstanding, credit, next_due = system.get_student_balance(student)
+    assert (billed, paid, outstanding, credit) == (3000, 1500, 1500, 0)
+    assert next_due == "2025-10-01"
+
+
+def test_overpayment_is_kept_as_credit(system, student):
+    first = installments_of(system, student)[0][0]
+    ok, msg = system.pay_installment(first, 5000, "Cash", "طالب")
+    assert ok and "2,000.00" in msg
+    assert system.get_student_balance(student)[2:4] == (0, 2000)
+    assert system.get_top_debtors() == []
+
+
+def test_new_plan_consumes_credit(system, student):
+    system.pay_installment(installments_of(system, student)[0][0], 5000, "Cash", "طالب")
+
+    ok, msg = system.create_fee_plan(student, 2500, 2, "2026-09-01")
+    assert ok, msg
+    new = installments_of(system, student)[3:]
+    assert [(paid, status) for _, _, paid, status in new] == [(1250, "paid"), (750, "pending")]
+    assert system.get_student_balance(student)[2:4] == (500, 0)
+    assert [row[0] for row in system.get_top_debtors()] == [student]
+    assert system.get_top_debtors()[0][3] == 500
+    with system.db.read() as conn:
+        # الرصيد المستخدم لا يُسجل إيراداً مرة ثانية
+        assert conn.execute("SELECT SUM(amount) FROM transactions").fetchone()[0] == 5000
+
+
+def test_bulk_plan_consumes_credit(system, student):
+    system.pay_installment(installments_of(system, student)[0][0], 4000, "Cash", "طالب")
+    other = add_student(system, name="آخر")
+
+    ok, msg, results = system.create_fee_plans_bulk(1000, 1, "2026-09-01", student_ids=[student, other],
+                                                    skip_existing=False)
+    assert ok, msg
+    assert system.get_student_balance(student)[2:4] == (0, 0)
+    assert system.get_student_balance(other)[2:4] == (1000, 0)
+
+
+def test_rebuild_applies_stranded_credit(system, student):
+    with system.db.transaction() as conn:
+        conn.execute("UPDATE student_balances SET credit = 1000 WHERE student_id = ?", (student,))
+    ok, msg = system.rebuild_balances()
+    assert ok, msg
+    assert system.get_student_balance(student)[2:4] == (2000, 0)
+
+
+def test_bulk_plan_reports_unknown_students(system, student):
+    other = add_student(system, name="آخر", grade="KG2")
+
+    ok, msg, results = system.create_fee_plans_bulk(1000, 1, "2026-09-01", grade="KG1",
+                                                    student_ids=[student, other, 9999], skip_existing=False)
+    assert ok, msg
+    assert [(sid, ok) for sid, ok, _ in results] == [(student, True), (other, False), (9999, False)]
+    assert results[2][2] == "الطالب غير موجود."
+
+    ok, msg, results = system.create_fee_plans_bulk(1000, 1, "2026-09-01", student_ids=[9999])
+    assert not ok
+    assert results == [(9999, False, "الطالب غير موجود.")]
+
+
+def test_bulk_plan_reports_invalid_ids(system, student):
+    ok, msg, results = system.create_fee_plans_bulk(1000, 1, "2026-09-01", student_ids=[student, "abc"],
+                                                    skip_existing=False)
+    assert ok, msg
+    assert results[-1] == ("abc", False, "رقم الطالب غير صالح.")
+
+    ok, msg, results = system.create_fee_plans_bulk(1000, 1, "2026-09-01", student_ids=["x", None])
+    assert not ok
+    assert [sid for sid, _, _ in results] == ["x", None]
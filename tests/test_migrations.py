@@ -0,0 +1,70 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+from dates import normalize_date
+from db_init import ensure_schema
+from migrations import MIGRATIONS
+
+
+def test_every_migration_step_can_be_rerun(tmp_path):
+    path = str(tmp_path / "school.db")
+    ensure_schema(path)
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        for version, description, steps in MIGRATIONS:
+            for step in steps:
+                step(conn) if callable(step) else conn.execute(step)
+    finally:
+        conn.close()
+
+
+def test_dates_are_normalized_in_batches(tmp_path):
+    from migrations import _normalize_column
+
+    conn = sqlite3.connect(str(tmp_path / "dates.db"), isolation_level=None)
+    conn.execute("CREATE TABLE installments (id INTEGER PRIMARY KEY, due_date TEXT)")
+    conn.executemany("INSERT INTO installments (due_date) VALUES (?)",
+                     [(f"{day}/9/2025",) for day in range(1, 26)] + [("2025-10-01",), ("",), (None,)])
+    _normalize_column("installments", "due_date", normalize_date, batch_size=4)(conn)
+    dates = [row[0] for row in conn.execute("SELECT due_date FROM installments ORDER BY id")]
+    conn.close()
+    assert dates[:25] == [f"2025-09-{day:02d}" for day in range(1, 26)]
+    assert dates[25:] == ["2025-10-01", "", None]
+
+
+def test_migrations_do_not_load_feature_modules():
+    school = os.path.join(os.path.dirname(__file__), os.pardir, "school")
+    loaded = subprocess.run(
+        [sys.executable, "-c", "import sys, db_init; print(' '.join(sorted(sys.modules)))"],
+        cwd=school, capture_output=True, text=True, check=True).stdout.split()
+    assert not {"receipts", "reminders", "aging", "reports", "fpdf", "concurrent.futures.process"} & set(loaded)
+
+
+def test_current_schema_runs_no_ddl(tmp_path, monkeypatch):
+    import db_init
+    from migrations import LATEST_VERSION
+
+    path = str(tmp_path / "school.db")
+    assert [version for version, _ in ensure_schema(path)] == [version for version, _, _ in MIGRATIONS]
+
+    statements = []
+    connect = sqlite3.connect
+
+    def traced_connect(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    def no_migrate(conn):
+        raise AssertionError("migrate() على مخطط حديث")
+
+    monkeypatch.setattr(db_init.sqlite3, "connect", traced_connect)
+    monkeypatch.setattr(db_init, "migrate", no_migrate)
+    assert ensure_schema(path) == []
+    assert statements == ["PRAGMA user_version"]
+
+    conn = connect(path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == LATEST_VERSION
+    conn.close()
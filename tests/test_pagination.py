@@ -0,0 +1,55 @@
+import itertools
+
+import pytest
+
+from conftest import add_student
+from dates import today_str
+
+
+@pytest.fixture
+def pending(system):
+    # كل الأقساط في تواريخ استحقاق قليلة متكررة، فحدود الصفحات تقع داخل نفس التاريخ
+    for i in range(12):
+        student = add_student(system, name=f"طالب {i}", grade=("KG1", "KG2")[i % 2],
+                              academic_year=("2025-2026", "2026-2027")[i % 3 == 0])
+        ok, msg = system.create_fee_plan(student, 900, 3, ("2025-09-01", "2099-09-01")[i % 4 == 0])
+        assert ok, msg
+    return system
+
+
+def walk(system, limit, cursor=None, **filters):
+    rows = []
+    while True:
+        page, cursor = system.get_pending_installments_page(cursor=cursor, limit=limit, **filters)
+        rows.extend(page)
+        if cursor is None:
+            return rows
+
+
+def expected(system, grade=None, academic_year=None, overdue_only=False):
+    with system.db.read() as conn:
+        return [row[0] for row in conn.execute("""
+            SELECT i.id FROM installments i JOIN students s ON s.id = i.student_id
+            WHERE i.status = 'pending' AND (? IS NULL OR s.grade = ?) AND (? IS NULL OR s.academic_year = ?)
+              AND (? = 0 OR i.due_date < ?)
+            ORDER BY i.due_date, i.id
+        """, (grade, grade, academic_year, academic_year, int(overdue_only), today_str()))]
+
+
+@pytest.mark.parametrize("grade, academic_year, overdue_only", list(itertools.product(
+    (None, "KG1"), (None, "2026-2027"), (False, True))))
+@pytest.mark.parametrize("limit", (1, 7, 36))
+def test_pages_cover_every_installment_once(pending, limit, grade, academic_year, overdue_only):
+    filters = dict(grade=grade, academic_year=academic_year, overdue_only=overdue_only)
+    ids = [row[0] for row in walk(pending, limit, **filters)]
+    assert len(ids) == len(set(ids))
+    assert ids == expected(pending, **filters)
+
+
+def test_payment_between_pages_does_not_shift_the_cursor(pending):
+    first, cursor = pending.get_pending_installments_page(limit=10)
+    # سداد قسط من الصفحة الأولى يخرجه من القائمة دون أن يُكرر أو يُسقط صفاً من الصفحة التالية
+    pending.pay_installment(first[0][0], 300, "Cash", first[0][1])
+    rest = walk(pending, 10, cursor=cursor)
+    assert [row[0] for row in first[1:] + rest] == expected(pending)
+
@@ -0,0 +1,80 @@
+import threading
+
+import pytest
+
+from conftest import add_student, installments_of
+from finance_system import FinanceSystem
+
+
+@pytest.fixture
+def plan(system):
+    student_id = add_student(system)
+    ok, msg = system.create_fee_plan(student_id, 3000, 3, "2025-09-01")
+    assert ok, msg
+    return student_id, installments_of(system, student_id)[0][0]
+
+
+def payments(system, key):
+    with system.db.read() as conn:
+        return conn.execute("SELECT COUNT(*) FROM transactions WHERE idempotency_key = ?", (key,)).fetchone()[0]
+
+
+def test_replayed_key_returns_original_result(system, plan):
+    student_id, first = plan
+    ok, msg = system.pay_installment(first, 500, "Cash", "طالب", idempotency_key="k1")
+    assert ok, msg
+    ok, msg = system.pay_installment(first, 500, "Cash", "طالب", idempotency_key="k1")
+    assert ok and "مسجل مسبقاً" in msg
+    assert payments(system, "k1") == 1
+    assert system.get_student_balance(student_id)[1] == 500
+
+
+def test_key_reused_for_a_different_payment_is_rejected(system, plan):
+    student_id, first = plan
+    other = add_student(system, name="آخر")
+    system.create_fee_plan(other, 1000, 1, "2025-09-01")
+    system.pay_installment(first, 500, "Cash", "طالب", idempotency_key="k1")
+
+    ok, msg = system.pay_installment(first, 700, "Cash", "طالب", idempotency_key="k1")
+    assert not ok and "مفتاح الطلب" in msg
+    ok, msg = system.pay_installment(installments_of(system, other)[0][0], 500, "Cash", "آخر",
+                                     idempotency_key="k1")
+    assert not ok and "مفتاح الطلب" in msg
+    assert payments(system, "k1") == 1
+    assert system.get_student_balance(other)[1] == 0
+
+
+def test_concurrent_submits_record_one_payment(system, plan):
+    student_id, first = plan
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        system.pay_installment(first, 500, "Cash", "طالب", idempotency_key="k1"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(ok for ok, _ in results)
+    assert payments(system, "k1") == 1
+    assert system.get_student_balance(student_id)[1] == 500
+
+
+def test_concurrent_processes_cannot_duplicate_a_key(system, plan):
+    # خادمان على نفس القاعدة (كاتب مستقل لكل منهما): الفهرس الفريد يمنع الحركة الثانية
+    student_id, first = plan
+    other = FinanceSystem(system.db_path)
+    try:
+        barrier = threading.Barrier(2)
+
+        def pay(target):
+            barrier.wait()
+            target.pay_installment(first, 500, "Cash", "طالب", idempotency_key="k1")
+
+        threads = [threading.Thread(target=pay, args=(target,)) for target in (system, other)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        other.close()
+    assert payments(system, "k1") == 1
+    assert system.get_student_balance(student_id)[1] == 500
@@ -0,0 +1,25 @@
+import os
+
+from conftest import add_student
+from receipts import ReceiptPrinter
+
+
+def test_printer_recovers_after_a_worker_dies(system, tmp_path):
+    sid = add_student(system, "طالب", "الأول")
+    with system.db.transaction() as conn:
+        conn.execute("""INSERT INTO transactions (student_id, date, amount, type, description, payment_method)
+                        VALUES (?, '2026-10-18 10:00:00', 100, 'payment', 'دفعة', 'نقدي')""", (sid,))
+        tx_id = conn.execute("SELECT MAX(id) FROM transactions").fetchone()[0]
+    printer = ReceiptPrinter(system, output_dir=str(tmp_path), workers=1)
+    try:
+        # توقف عملية الرسم يعطل المجموعة كلها
+        broken = printer._executor().submit(os._exit, 1)
+        try:
+            broken.result(timeout=30)
+        except Exception:
+            pass
+        path, count = printer.print_transaction(transaction_id=tx_id).result(timeout=60)
+        assert count == 1
+        assert os.path.exists(path)
+    finally:
+        printer.shutdown()
@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import reminders
+from conftest import add_student, installments_of
+from reminders import (MockTransport, ReminderDispatcher, Transport, enqueue_reminders, outbox_stats,
+                       run_nightly)
+
+
+class ClosingTransport(MockTransport):
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_transport_requires_send():
+    with pytest.raises(TypeError):
+        Transport()
+
+
+def test_run_nightly_closes_transport_on_failure(system, monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError("enqueue failed")
+
+    monkeypatch.setattr(reminders, "enqueue_reminders", broken)
+    transport = ClosingTransport()
+    with pytest.raises(RuntimeError):
+        run_nightly(system, transport, force=True, progress=lambda msg: None)
+    assert transport.closed
+
+
+def test_run_nightly_closes_transport_on_success(system):
+    transport = ClosingTransport()
+    assert run_nightly(system, transport, force=True, progress=lambda msg: None)[0] == 0
+    assert transport.closed
+
+
+class Clock:
+    """ساعة وهمية تتقدم عند كل انتظار للموزع"""
+
+    def __init__(self, start):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += timedelta(seconds=seconds)
+
+
+class FlakyTransport(MockTransport):
+    """يفشل أول failures محاولات ثم ينجح"""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def send(self, phone, message):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("timeout")
+        super().send(phone, message)
+
+
+@pytest.fixture
+def overdue(system):
+    sid = add_student(system, phone="01001234567")
+    ok, msg = system.create_fee_plan(sid, 2000, 2, "2025-09-01")
+    assert ok, msg
+    return sid
+
+
+def test_failed_send_is_retried_in_the_same_run(system, overdue):
+    assert enqueue_reminders(system, day="2026-10-18")[0] == 1
+    transport = FlakyTransport(failures=1)
+    clock = Clock(datetime(2026, 10, 18, 21, 0))
+    sent, retried, failed = ReminderDispatcher(system, transport, rate_per_sec=0, sleep=clock.sleep,
+                                               clock=clock).run()
+    assert (sent, retried, failed) == (1, 1, 0)
+    assert len(transport.sent) == 1
+
+
+def test_next_night_replaces_unsent_messages(system, overdue):
+    enqueue_reminders(system, day="2026-10-18")
+    # الإعادة مؤجلة لما بعد انتهاء النافذة الليلية فتبقى الرسالة في الطابور
+    clock = Clock(datetime(2026, 10, 19, 6, 59, 30))
+    ReminderDispatcher(system, FlakyTransport(failures=1), rate_per_sec=0, sleep=clock.sleep, clock=clock).run()
+    assert outbox_stats(system, "2026-10-18") == {"queued": 1}
+
+    first = installments_of(system, overdue)[0][0]
+    system.pay_installment(first, 400, "Cash", "طالب")
+    enqueue_reminders(system, day="2026-10-19")
+    transport = MockTransport()
+    clock = Clock(datetime(2026, 10, 19, 21, 0))
+    ReminderDispatcher(system, transport, rate_per_sec=0, sleep=clock.sleep, clock=clock).run()
+
+    assert len(transport.sent) == 1
+    assert "600.00" in transport.sent[0][1]
+    assert outbox_stats(system, "2026-10-18") == {"expired": 1}
@@ -0,0 +1,25 @@
+import pytest
+
+from reports import start_export
+
+
+def test_export_threads_release_their_connections(system, tmp_path):
+    results = []
+    for i in range(5):
+        start_export(system, "roster", "csv", str(tmp_path / f"roster_{i}.csv"),
+                     done=lambda ok, msg: results.append(ok)).join()
+    assert results == [True] * 5
+    assert system.db._connections == []
+
+
+def test_missing_text_shaping_fails_loudly(monkeypatch):
+    from fpdf import FPDF
+
+    import reports
+
+    def broken(self, *args, **kwargs):
+        raise ImportError("No module named 'uharfbuzz'")
+
+    monkeypatch.setattr(FPDF, "set_text_shaping", broken)
+    with pytest.raises(RuntimeError, match="uharfbuzz"):
+        reports.new_arabic_pdf()
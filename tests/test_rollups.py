@@ -0,0 +1,66 @@
+import argparse
+
+from archive import archive_year
+from cli import DRIFT_CHECKS, EXIT_OK, EXIT_PROBLEMS, cmd_check, count_drift
+from conftest import add_student, installments_of
+
+OLD_YEAR = "2020-2021"
+
+
+def drift(system):
+    with system.db.read() as conn:
+        return {label: count_drift(conn, raw_sql, derived_sql)
+                for label, raw_sql, derived_sql, _ in DRIFT_CHECKS}
+
+
+def check(system, repair=False):
+    return cmd_check(argparse.Namespace(full=False, repair=repair), system)
+
+
+def test_rollups_follow_a_mixed_workload(system, tmp_path):
+    # عام قديم مسدد يُؤرشف (حذف حركات وأقساط)
+    old = add_student(system, academic_year=OLD_YEAR)
+    system.create_fee_plan(old, 1000, 2, "2020-09-01")
+    for installment_id, *_ in installments_of(system, old):
+        system.pay_installment(installment_id, 500, "Card", "قديم")
+    with system.db.transaction() as conn:
+        conn.execute("UPDATE transactions SET date = '2021-03-01 10:00:00' WHERE student_id = ?", (old,))
+
+    # خطط فردية وجماعية ودفعات جزئية وزائدة
+    students = [add_student(system, name=f"طالب {i}") for i in range(3)]
+    system.create_fee_plan(students[0], 3000, 3, "2025-09-01")
+    system.create_fee_plans_bulk(1200, 4, "2025-10-15", student_ids=students[1:])
+    system.pay_installment(installments_of(system, students[0])[0][0], 1500, "Cash", "طالب 0")
+    system.pay_installment(installments_of(system, students[1])[0][0], 100, "Card", "طالب 1")
+    system.pay_installment(installments_of(system, students[2])[0][0], 5000, "Cash", "طالب 2")
+
+    # تعديلات وحذف مباشر على السجلات الخام
+    with system.db.transaction() as conn:
+        conn.execute("""INSERT INTO transactions (date, amount, type, description, payment_method)
+                        VALUES ('2026-10-18 09:00:00', 250, 'expense', 'أدوات', 'Cash')""")
+        conn.execute("UPDATE transactions SET amount = amount + 10, payment_method = 'Card' "
+                     "WHERE id = (SELECT MAX(id) FROM transactions WHERE type = 'payment')")
+        deleted = conn.execute("SELECT MIN(id) FROM transactions WHERE student_id = ?", (students[1],)).fetchone()[0]
+        conn.execute("DELETE FROM receipts WHERE transaction_id = ?", (deleted,))
+        conn.execute("DELETE FROM transactions WHERE id = ?", (deleted,))
+        conn.execute("DELETE FROM installments WHERE id = ?", (installments_of(system, students[1])[-1][0],))
+        conn.execute("UPDATE installments SET due_date = '2026-01-01' WHERE id = ?",
+                     (installments_of(system, students[0])[-1][0],))
+
+    archive_year(system, OLD_YEAR, archive_dir=str(tmp_path / "archive"), progress=lambda m: None)
+
+    assert set(drift(system).values()) == {0}
+    assert check(system) == EXIT_OK
+
+
+def test_check_reports_and_repairs_drift(system):
+    student = add_student(system)
+    system.create_fee_plan(student, 1000, 2, "2025-09-01")
+    system.pay_installment(installments_of(system, student)[0][0], 500, "Cash", "طالب")
+    with system.db.transaction() as conn:
+        conn.execute("UPDATE daily_revenue SET total = total + 1")
+        conn.execute("UPDATE installment_due_rollup SET pending_count = pending_count + 1")
+
+    assert check(system) == EXIT_PROBLEMS
+    assert check(system, repair=True) == EXIT_OK
+    assert set(drift(system).values()) == {0}
@@ -0,0 +1,66 @@
+import pytest
+
+from conftest import add_student
+
+
+@pytest.fixture
+def students(system):
+    return {name: add_student(system, name=name, grade=grade, phone=phone) for name, grade, phone in [
+        ("محمد علي", "KG1", "01001234567"),
+        ("محمد حسن", "KG2", "01101234567"),
+        ("أحمد محمود", "KG1", "01201234567"),
+        ("سارة_عمر", "KG2", "01501234567"),
+    ]}
+
+
+def found(rows):
+    return sorted(row[1] for row in rows)
+
+
+def test_search_matches_any_part_of_name_or_phone(system, students):
+    assert found(system.search_students("محمد")) == ["محمد حسن", "محمد علي"]
+    assert found(system.search_students("محم")) == ["أحمد محمود", "محمد حسن", "محمد علي"]
+    assert found(system.search_students("1201")) == ["أحمد محمود"]
+
+
+def test_short_terms_narrow_multi_word_queries(system, students):
+    assert found(system.search_students("محمد ع")) == ["محمد علي"]
+    assert found(system.search_students("محمد ح")) == ["محمد حسن"]
+    assert found(system.search_students("محمد 011")) == ["محمد حسن"]
+    assert found(system.search_students("محم KG")) == ["أحمد محمود", "محمد حسن", "محمد علي"]
+    assert found(system.search_students("محمد ز")) == []
+
+
+def test_short_terms_are_literal_not_wildcards(system, students):
+    assert found(system.search_students("سارة _")) == []
+    assert found(system.search_students("محمد %")) == []
+
+
+def test_short_query_alone_is_a_name_prefix(system, students):
+    assert found(system.search_students("مح")) == ["محمد حسن", "محمد علي"]
+
+
+def test_suggestions_apply_short_terms(system, students):
+    assert found(system.suggest_students("علي م")) == ["محمد علي"]
+
+
+def test_suggestions_list_name_prefix_first_then_fill_without_duplicates(system, students):
+    rows = system.suggest_students("محم")
+    assert [row[1] for row in rows] == ["محمد حسن", "محمد علي", "أحمد محمود"]
+    assert len({row[0] for row in rows}) == len(rows)
+    assert rows[0] == (students["محمد حسن"], "محمد حسن", "KG2", "2025-2026")
+
+
+def test_suggestions_respect_limit(system, students):
+    assert [row[1] for row in system.suggest_students("محم", limit=2)] == ["محمد حسن", "محمد علي"]
+    assert [row[1] for row in system.suggest_students("محم", limit=1)] == ["محمد حسن"]
+    for n in range(15):
+        add_student(system, name=f"طالب {n:02d} محمد")
+    rows = system.suggest_students("محمد", limit=5)
+    assert len(rows) == 5 and [row[1] for row in rows[:2]] == ["محمد حسن", "محمد علي"]
+
+
+def test_short_numeric_suggestion_finds_student_id(system, students):
+    sid = students["سارة_عمر"]
+    assert system.suggest_students(str(sid)) == [(sid, "سارة_عمر", "KG2", "2025-2026")]
+    assert system.suggest_students("") == []
@@ -0,0 +1,107 @@
+import asyncio
+
+from changes import ChangeSet
+from session import SessionFeed
+
+
+class FakeSystem:
+    def __init__(self):
+        self.listeners = []
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        self.listeners.remove(listener)
+
+    def publish(self, changes):
+        for listener in list(self.listeners):
+            listener(changes)
+
+
+def test_events_while_paused_apply_as_one_update():
+    system, scheduled, applied = FakeSystem(), [], []
+
+    async def apply(changes):
+        applied.append(changes)
+
+    feed = SessionFeed(system, scheduled.append, apply).start()
+    feed.pause()
+    first = ChangeSet(installments=[1], totals=True)
+    system.publish(first)
+    system.publish(ChangeSet(installments=[2]))
+    system.publish(ChangeSet(students=[7], roster=True))
+    assert scheduled == [] and (feed.received, feed.applied) == (3, 0)
+
+    feed.resume()
+    assert len(scheduled) == 1
+    asyncio.run(scheduled.pop()())
+    assert feed.applied == 1 and len(applied) == 1
+    merged = applied[0]
+    assert (merged.installments, merged.students, merged.totals, merged.roster) == ({1, 2}, {7}, True, True)
+    # الحدث الأصلي مشترك بين الجلسات فلا يُعدل بالدمج
+    assert first.installments == {1} and not first.roster
+
+
+def test_events_during_an_update_coalesce_into_the_next_one():
+    applied = []
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        gate, tasks = asyncio.Event(), []
+        system = FakeSystem()
+
+        async def apply(changes):
+            applied.append(changes)
+            if len(applied) == 1:
+                await gate.wait()
+
+        feed = SessionFeed(system, lambda drain: tasks.append(loop.create_task(drain())), apply).start()
+        system.publish(ChangeSet(installments=[1]))
+        await asyncio.sleep(0)
+        system.publish(ChangeSet(installments=[2]))
+        system.publish(ChangeSet(installments=[3], pending_list=True))
+        assert len(tasks) == 1
+        gate.set()
+        await tasks[0]
+        return feed
+
+    feed = asyncio.run(scenario())
+    assert [sorted(changes.installments) for changes in applied] == [[1], [2, 3]]
+    assert applied[1].pending_list
+    assert (feed.received, feed.applied) == (3, 2)
+
+
+def test_closed_feed_drops_events_and_unsubscribes():
+    system, scheduled = FakeSystem(), []
+
+    async def apply(changes):
+        raise AssertionError("تحديث بعد الإغلاق")
+
+    feed = SessionFeed(system, scheduled.append, apply).start()
+    feed.pause()
+    system.publish(ChangeSet(installments=[1]))
+    feed.close()
+    assert system.listeners == []
+    feed.push(ChangeSet(installments=[2]))
+    feed.resume()
+    assert scheduled == [] and feed.received == 1
+
+
+def test_failed_schedule_is_retried_on_the_next_event():
+    system, applied, calls = FakeSystem(), [], []
+
+    async def apply(changes):
+        applied.append(changes)
+
+    def schedule(drain):
+        calls.append(drain)
+        if len(calls) == 1:
+            raise RuntimeError("الجلسة مغلقة")
+
+    SessionFeed(system, schedule, apply).start()
+    system.publish(ChangeSet(installments=[1]))
+    system.publish(ChangeSet(installments=[2]))
+    assert len(calls) == 2
+    asyncio.run(calls[1]())
+    assert [sorted(changes.installments) for changes in applied] == [[1, 2]]
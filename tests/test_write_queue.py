@@ -0,0 +1,92 @@
+import sqlite3
+import threading
+
+import pytest
+
+from db_connection import ConnectionManager
+from write_queue import WriteQueue
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = ConnectionManager(str(tmp_path / "queue.db"), busy_timeout_ms=50)
+    with db.transaction() as conn:
+        conn.execute("CREATE TABLE items (name TEXT PRIMARY KEY)")
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def writes(db):
+    writes = WriteQueue(db, max_wait_ms=50, backoff_ms=20)
+    yield writes
+    writes.close()
+
+
+def insert(conn, name):
+    conn.execute("INSERT INTO items (name) VALUES (?)", (name,))
+    return name
+
+
+def insert_then_fail(conn, name):
+    insert(conn, name)
+    raise ValueError(name)
+
+
+def names(db):
+    with db.read() as conn:
+        return sorted(row[0] for row in conn.execute("SELECT name FROM items"))
+
+
+def submit_while_blocked(writes, jobs):
+    """يوقف الكاتب بطلب أول حتى تصل كل الطلبات، فتُنفذ في دفعة واحدة"""
+    started, release = threading.Event(), threading.Event()
+    blocker = writes.submit(lambda conn: started.set() or release.wait(5))
+    assert started.wait(5)
+    futures = [writes.submit(fn, *args) for fn, *args in jobs]
+    release.set()
+    blocker.result(5)
+    return futures
+
+
+def test_concurrent_jobs_share_one_commit(db, writes):
+    futures = submit_while_blocked(writes, [(insert, f"n{i}") for i in range(10)])
+    assert [f.result(5) for f in futures] == [f"n{i}" for i in range(10)]
+    stats = writes.stats()
+    assert (stats["jobs"], stats["batches"], stats["largest_batch"]) == (11, 2, 10)
+    assert len(names(db)) == 10
+
+
+def test_failing_job_does_not_roll_back_its_batch(db, writes):
+    futures = submit_while_blocked(writes, [(insert, "a"), (insert_then_fail, "b"), (insert, "c")])
+    assert futures[0].result(5) == "a" and futures[2].result(5) == "c"
+    with pytest.raises(ValueError):
+        futures[1].result(5)
+    assert writes.stats()["largest_batch"] == 3
+    assert names(db) == ["a", "c"]
+
+
+def test_batch_is_retried_while_another_process_holds_the_lock(db, writes):
+    other = sqlite3.connect(db.db_path, isolation_level=None, check_same_thread=False)
+    other.execute("BEGIN IMMEDIATE")
+    future = writes.submit(insert, "late")
+    # القفل يُحرَّر بعد أن يفشل الكاتب مرة واحدة على الأقل
+    threading.Timer(0.2, other.execute, ("COMMIT",)).start()
+    assert future.result(5) == "late"
+    other.close()
+    assert writes.stats()["retries"] >= 1
+    assert names(db) == ["late"]
+
+
+def test_lock_held_past_all_retries_fails_the_batch(db):
+    writes = WriteQueue(db, retries=1, backoff_ms=1)
+    other = sqlite3.connect(db.db_path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    try:
+        with pytest.raises(sqlite3.OperationalError, match="locked"):
+            writes.submit(insert, "x").result(5)
+        assert writes.stats()["failed"] == 1
+    finally:
+        other.execute("ROLLBACK")
+        other.close()
+        writes.close()